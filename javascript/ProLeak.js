@@ -101,9 +101,10 @@ class ProLeak extends EventEmitter {
     let buffer = "";
     this.socket.on('data', (data) => {
       buffer += data.toString('utf-8');
-      while (buffer.includes("---\n")) {
-        const [event, remaining] = buffer.split("---\n", 2);
-        buffer = remaining;
+      let end;
+      while ((end = buffer.indexOf("---\n")) !== -1) {
+        const event = buffer.slice(0, end);
+        buffer = buffer.slice(end + 4);
         this._processEvent(event.trim().split('\n'));
       }
     });
@@ -114,8 +115,8 @@ class ProLeak extends EventEmitter {
   }
 
   _processEvent(eventData) {
-    const [eventName, ...paramLines] = eventData;
-    const eventParams = JSON.parse(paramLines.join('\n'));
+    const eventName = eventData[0].split(': ').slice(1).join(': ');
+    const eventParams = JSON.parse(eventData[1]);
     const isPrefix = eventParams.__is_prefix;
     delete eventParams.__is_prefix;
 
@@ -156,7 +157,7 @@ class ProLeak extends EventEmitter {
   }
 
   _sendInterceptionResult(eventName, params) {
-    const wrappedParams = {
+    const wrappedParams = params === null ? null : {
       entries: Object.entries(params).map(([key, value]) => ({ key, value: String(value) }))
     };
     const response = JSON.stringify({
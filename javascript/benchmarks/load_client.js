@@ -0,0 +1,72 @@
+/*
+    ProLeak API (JavaScript)
+    Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+// Load-test client driven by python/benchmarks/bench_load.py against the engine simulator
+// Usage: node load_client.js <port>
+// Prints one JSON line with the received count, events/s and handler latency percentiles
+
+const { performance } = require('perf_hooks');
+const ProLeak = require('../ProLeak');
+
+const port = parseInt(process.argv[2], 10);
+const api = new ProLeak('127.0.0.1', port);
+const latencies = [];
+let first = null;
+let last = null;
+
+function nowNs() {
+  return BigInt(Math.round((performance.timeOrigin + performance.now()) * 1e6));
+}
+
+function percentile(sorted, percent) {
+  if (sorted.length === 0) {
+    return 0;
+  }
+  return sorted[Math.min(sorted.length - 1, Math.ceil(sorted.length * percent / 100) - 1)];
+}
+
+api.registerInterceptor("MethodCall", (event, params) => params);
+
+api.registerGlobalHandler((event, params) => {
+  const now = performance.now();
+  if (first === null) {
+    first = now;
+  }
+  last = now;
+  if (params.__sent !== undefined) {
+    latencies.push(Number(nowNs() - BigInt(params.__sent)) / 1e9);
+  }
+  if (event === "EndOfGame") {
+    latencies.sort((a, b) => a - b);
+    const elapsed = (last - first) / 1000;
+    console.log(JSON.stringify({
+      received: latencies.length,
+      events_per_second: elapsed > 0 ? latencies.length / elapsed : 0,
+      handler_latency: { p50: percentile(latencies, 50), p99: percentile(latencies, 99) }
+    }));
+    api.stopLeaking();
+    api.disconnect();
+  }
+});
+
+api.connect()
+  .then(() => api.startLeaking())
+  .catch((error) => {
+    console.error(error);
+    process.exit(1);
+  });
@@ -0,0 +1,375 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import inspect
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from ProLeak import (BINARY_SWITCH_EVENT, DEFAULT_READ_SIZE, FALLBACK_BLOCK, FALLBACK_PASS, FRAME_COMMAND,
+                     PROTOCOL_AUTO, PROTOCOL_TEXT, BinaryFrameDecoder, Codec, EventRegistry, FrameDecoder,
+                     ProLeakConnectionError, ProLeakProtocolError, _MISSING, _accept_protocol,
+                     _binary_interception_result, _hello, _interception_result, _no_stop, available_codecs,
+                     binary_frame)
+
+_CLOSED = object()
+
+
+class AsyncProLeak(EventRegistry):
+    """asyncio flavour of :class:`ProLeak`: no reader thread, one task per connection.
+
+    Handlers and interceptors may be plain functions or ``async def`` coroutines,
+    registered through the same ``register_*`` API as the threaded client.
+    """
+
+    def __init__(self, host='localhost', port=69420, connection_timeout=5, read_size=DEFAULT_READ_SIZE,
+                 event_queue_size=1024, interceptor_deadline: Optional[float] = None,
+                 interceptor_fallback: str = FALLBACK_PASS, subscribe: bool = False,
+                 protocol: str = PROTOCOL_TEXT, codecs: Optional[List[Codec]] = None,
+                 lazy_params: bool = False, unix_socket: Optional[str] = None, priority: int = 0,
+                 process_executor=None):
+        super().__init__()
+        self.lazy_params = lazy_params
+        self.process_executor = process_executor
+        self.unix_socket = unix_socket
+        self.priority = priority
+        if interceptor_fallback not in (FALLBACK_PASS, FALLBACK_BLOCK):
+            raise ValueError(f"Unknown interceptor fallback: {interceptor_fallback!r}")
+        if protocol not in (PROTOCOL_TEXT, PROTOCOL_AUTO):
+            raise ValueError(f"Unknown protocol: {protocol!r}")
+        self.protocol = protocol
+        self.codecs = codecs or available_codecs()
+        self.codec: Optional[Codec] = None
+        self.interceptor_deadline = interceptor_deadline
+        self.interceptor_fallback = interceptor_fallback
+        self.host = host
+        self.port = port
+        self.connection_timeout = connection_timeout
+        self.read_size = read_size
+        self.event_queue_size = event_queue_size
+        self.running = False
+        self.sharing = False
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+        self.decoder: Optional[FrameDecoder] = None
+        self._closed: Optional[asyncio.Event] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.subscribe = subscribe
+        self._subscribed: Optional[Dict[str, List[str]]] = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.sharing and self.writer:
+            try:
+                await self.stop_leaking()
+            except ProLeakConnectionError:
+                pass
+        await self.disconnect()
+
+    async def connect(self):
+        if not self.writer:
+            try:
+                if self.unix_socket:
+                    connection = asyncio.open_unix_connection(self.unix_socket, limit=self.read_size)
+                else:
+                    connection = asyncio.open_connection(self.host, self.port, limit=self.read_size)
+                self.reader, self.writer = await asyncio.wait_for(connection, self.connection_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.reader = self.writer = None
+                raise ProLeakConnectionError(f"Failed to connect to ProLeak Engine: {e}. Is the C# server running?")
+            self.running = True
+            self.connected_at = time.monotonic()
+            self._closed = asyncio.Event()
+            self.codec = None
+            self.decoder = FrameDecoder(self.read_size)
+            if self.protocol == PROTOCOL_AUTO:
+                self.decoder.switch_marker = f"Event: {BINARY_SWITCH_EVENT}\n".encode('utf-8')
+                await self._send_command(_hello(self.codecs))
+            if self.process_executor:
+                self.process_executor.start()
+            self.task = asyncio.create_task(self._read_events())
+
+    async def disconnect(self):
+        self.running = False
+        writer, self.writer = self.writer, None
+        self.reader = None
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass  # The connection might already be gone
+        task = self.task
+        if task and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._close_subscribers()
+        if self.process_executor:
+            self.process_executor.shutdown(drain=True)
+        if self.recorder:
+            self.recorder.flush()  # The game so far is on disk, even if the client is never closed
+
+    async def start_leaking(self):
+        if not self.writer:
+            raise ProLeakConnectionError("Not connected to ProLeak Engine. Call connect() first.")
+        if not self.sharing:
+            if self.subscribe:
+                self._subscribed = self._subscription()
+                await self._send_command(f"START:{json.dumps(self._subscribed)}")
+            else:
+                await self._send_command("START")
+            self.sharing = True
+
+    async def stop_leaking(self):
+        if not self.writer:
+            raise ProLeakConnectionError("Not connected to ProLeak Engine. Call connect() first.")
+        if self.sharing:
+            await self._send_command("STOP")
+            self.sharing = False
+
+    async def _send_command(self, command):
+        data = command.encode('utf-8')
+        await self._send_bytes(binary_frame(FRAME_COMMAND, data) if self.codec else data)
+
+    async def _send_bytes(self, data):
+        if not self.writer:
+            raise ProLeakConnectionError("Not connected to ProLeak Engine. Call connect() first.")
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except OSError as e:
+            raise ProLeakConnectionError(f"Failed to send command to ProLeak Engine: {e}")
+
+    def _transport_stats(self):
+        stats = super()._transport_stats()
+        transport = self.writer.transport if self.writer else None
+        stats["writer"] = {"pending": transport.get_write_buffer_size() if transport else 0}
+        stats["subscribers"] = [queue.qsize() for queue in self._subscribers]  # Events waiting per events() iterator
+        if self.process_executor:
+            stats["process_pool"] = self.process_executor.stats()
+        return stats
+
+    def _wants(self, event_name, dispatch):
+        return super()._wants(event_name, dispatch) or (1 if self._subscribers else 0)
+
+    def _subscription(self):
+        subscription = super()._subscription()
+        if self._subscribers:
+            subscription["events"] = ["*"]  # Event iterators see everything
+        return subscription
+
+    def _registry_changed(self):
+        if self.subscribe and self.sharing and self.writer:
+            subscription = self._subscription()
+            if subscription != self._subscribed:
+                self._subscribed = subscription
+                command = f"SUBSCRIBE:{json.dumps(subscription)}".encode('utf-8')
+                self.writer.write(binary_frame(FRAME_COMMAND, command) if self.codec else command)
+
+    async def _read_events(self):
+        decoder = self.decoder
+        try:
+            while self.running:
+                data = await self.reader.read(self.read_size)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                decoder.feed(data)
+                if not self.codec:
+                    frames = decoder.frames()
+                    switch = frames.pop() if decoder.switched else None
+                    self.frames_received += len(frames)
+                    if self.recorder:
+                        self.recorder.record(frames, True)
+                    for frame in frames:
+                        await self._process_event(frame.strip().split('\n'))
+                    if switch is None:
+                        continue
+                    self.codec = _accept_protocol(switch, self.codecs)
+                    decoder = self.decoder = BinaryFrameDecoder.resume(decoder)
+                frames = decoder.frames()
+                self.frames_received += len(frames)
+                if self.recorder:
+                    self.recorder.record(frames, False, self.codec)
+                for kind, body in frames:
+                    await self._process_binary_event(kind, body)
+        except (OSError, ProLeakConnectionError, ProLeakProtocolError) as e:
+            print(f"Socket error: {e}")
+        finally:
+            self.running = False
+            self._close_subscribers()
+            if self.writer:
+                await self.disconnect()
+
+    async def _process_event(self, event_data):
+        event = self._parse_event(event_data)
+        if event is not None:
+            await self._dispatch_event(*event)
+
+    async def _process_binary_event(self, kind, body):
+        event = self._parse_binary_event(kind, body)
+        if event is not None:
+            await self._dispatch_event(*event)
+
+    def _call_later(self, delay, func):
+        asyncio.get_running_loop().call_later(delay, self._call_now, func)
+
+    @staticmethod
+    def _call_now(func):
+        result = func()
+        if inspect.isawaitable(result):  # Coalesced events are dispatched as tasks of the loop, like the reader's
+            asyncio.ensure_future(result)
+
+    async def _dispatch_event(self, event_name, event_params, is_prefix, raw_params, received):
+        dispatch = self._dispatch
+
+        if is_prefix and (event_name in dispatch.interceptors or event_name in dispatch.rules):
+            chain = self._chain(dispatch, event_name, event_params)
+            original = dict(event_params) if raw_params is None else None  # What a pass-through fallback resends
+            try:
+                result, key = self._known_decision(chain, event_name, event_params, raw_params)
+                if result is _MISSING:
+                    result = await asyncio.wait_for(self._run_interceptors(chain, event_name, event_params),
+                                                    self.interceptor_deadline)
+                    if key is not None:
+                        self.decision_cache.put(key, result)
+            except asyncio.TimeoutError:
+                self.late_interceptions += 1
+                result = self._fallback(raw_params, original)
+            except Exception as e:
+                print(f"Interceptor error: {e!r}")
+                result = self._fallback(raw_params, original)
+            decided = time.perf_counter()
+            if self.codec:
+                await self._send_bytes(_binary_interception_result(self.codec, event_name, result))
+            else:
+                await self._send_command(_interception_result(event_name, result))
+            self._record_latency(event_name, "decision", decided - received)
+            self._record_latency(event_name, "send", time.perf_counter() - decided)
+        else:
+            route = dispatch.process_handlers.get(event_name)
+            process_handlers = route.select(event_params) if route else ()
+            if process_handlers:
+                self.process_executor.submit(process_handlers, event_name, event_params, raw_params, self.codec)
+            route = dispatch.handlers.get(event_name)
+            for handler in (route.select(event_params) if route else ()) + dispatch.global_handlers:
+                await self._call_handler(handler, event_name, event_params)
+
+            for queue in self._subscribers:
+                if queue.full():
+                    queue.get_nowait()  # Slow consumers lose the oldest events, never the reader
+                queue.put_nowait((event_name, event_params))
+
+    async def _call_handler(self, handler, event_name, event_params):
+        # Timed up to its completion, awaits included
+        profiler = self.profiler
+        started = time.perf_counter()
+        if profiler:
+            profiler.enter(handler.name, started)
+        try:
+            result = handler.call(event_name, event_params, self._stop)
+            if inspect.isawaitable(result):
+                await result
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record_handler(event_name, handler.name, elapsed)
+            if profiler:
+                profiler.exit(handler.name, elapsed)
+
+    async def _run_interceptors(self, chain, event_name, event_params):
+        # Only coroutine interceptors can be cut short by a deadline; plain functions block the loop
+        profiler = self.profiler
+        for interceptor in chain:
+            started = time.perf_counter()
+            if profiler:
+                profiler.enter(interceptor.name, started)
+            try:
+                result = interceptor.call(event_name, event_params, _no_stop)
+                if inspect.isawaitable(result):
+                    result = await asyncio.wait_for(result, interceptor.deadline)
+            except asyncio.TimeoutError:
+                print(f"Interceptor {interceptor.name} overran its deadline for {event_name}")
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record_latency(event_name, interceptor.name, elapsed)
+                if profiler:
+                    profiler.exit(interceptor.name, elapsed)
+            if result is None:  # Intercept and block
+                return None
+            elif isinstance(result, dict):  # Intercept and modify
+                event_params = result
+        return event_params
+
+    def _stop(self):
+        self.running = False
+        self._close_subscribers()
+
+    def _close_subscribers(self):
+        if self._closed:
+            self._closed.set()
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(_CLOSED)
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over ``(event, params)`` pairs until the connection closes.
+
+        Each iterator gets its own bounded queue; when it falls behind by more
+        than ``event_queue_size`` events, the oldest ones are discarded.
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.event_queue_size)
+        self._subscribers.add(queue)
+        self._registry_changed()
+        try:
+            while self.running or not queue.empty():
+                item = await queue.get()
+                if item is _CLOSED:
+                    break
+                yield item
+        finally:
+            self._subscribers.discard(queue)
+            self._registry_changed()
+
+    def __aiter__(self):
+        return self.events()
+
+    async def wait_closed(self):
+        """Wait until the connection is closed or a handler called stop."""
+        if self._closed:
+            await self._closed.wait()
+
+    async def plug(self, callback: Callable[[str, Dict[str, Any], Callable[[], None]], Any]):
+        try:
+            await self.connect()
+            await self.start_leaking()
+            self.register_global_handler(lambda e, p, unplug: callback(e, p, unplug))
+            await self.wait_closed()
+        except ProLeakConnectionError as e:
+            print(f"ProLeak Error: {e}")
+        finally:
+            await self.__aexit__(None, None, None)
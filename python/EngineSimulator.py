@@ -0,0 +1,454 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import json
+import queue
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from ProLeak import (BINARY_PROTOCOL, BINARY_SWITCH_EVENT, FLOW_EVENT, FRAME_COMMAND, FRAME_DELIMITER, FRAME_EVENT,
+                     FRAME_INTERCEPTION_RESULT, FRAME_PREFIX_EVENT, Codec, LatencyHistogram, Route, Rule,
+                     available_codecs, binary_event_body, binary_frame, criteria_from_json, parse_commands, split_commands)
+
+BATCH_SIZE = 256  # Events written with a single sendall, like the engine's socket buffer would
+
+
+class LoadProfile(NamedTuple):
+    """Shape of a synthetic event stream."""
+    name: str
+    count: int
+    rate: Optional[float]  # Events per second, None for as fast as possible
+    mix: Dict[str, float]  # Event name -> relative weight
+    payload_size: int  # Bytes of padding in each MethodCall's Arguments
+    prefix_ratio: float = 0.0  # Share of MethodCall events sent as prefix events, waiting for a decision
+
+
+PROFILES = {profile.name: profile for profile in (
+    LoadProfile("steady", 50_000, 5_000, {"UnityMessage": 8, "MethodCall": 2}, 64),
+    LoadProfile("burst", 200_000, None, {"UnityMessage": 8, "MethodCall": 2}, 64),
+    LoadProfile("large", 5_000, None, {"MethodCall": 1}, 64 * 1024),
+    LoadProfile("intercept", 20_000, None, {"MethodCall": 1}, 64, prefix_ratio=0.5),
+)}
+
+METHODS = ("SomeSpecificMethod", "SomeOtherMethod", "SpawnUnit", "UpdateGold", "Tick")
+TYPES = ("Lisk.Game.Units.UnitSpawner", "Lisk.Game.Economy", "Lisk.Game.Waves")
+
+
+def synthetic_events(profile: LoadProfile, seed: int = 0) -> Iterator[Tuple[str, Dict[str, Any], bool]]:
+    """Yield ``(event, params, is_prefix)`` following the profile, reproducibly for a seed."""
+    rng = random.Random(seed)
+    names = list(profile.mix)
+    padding = "x" * profile.payload_size
+    for index, event_name in enumerate(rng.choices(names, [profile.mix[n] for n in names], k=profile.count)):
+        if event_name == "MethodCall":
+            params = {"Method": rng.choice(METHODS), "DeclaringType": rng.choice(TYPES),
+                      "Arguments": [padding, index]}
+            yield event_name, params, rng.random() < profile.prefix_ratio
+        elif event_name == "UnityMessage":
+            yield event_name, {"Method": "Update", "Frame": index}, False
+        else:
+            yield event_name, {"Index": index}, False
+
+
+def read_capture(path: str) -> Iterator[bytes]:
+    """Frames of a captured text stream: the raw ``---\\n`` delimited bytes the engine sent."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for frame in data.split(FRAME_DELIMITER):
+        if frame.strip():
+            yield frame.strip() + b"\n" + FRAME_DELIMITER
+
+
+class EngineConnection:
+    """State the stand-in engine keeps for one connected client."""
+
+    def __init__(self, sock: socket.socket, binary: bool = True):
+        self.socket = sock
+        self.binary = binary  # Whether to accept the client's binary protocol offer
+        self.codec: Optional[Codec] = None
+        self.sharing = False
+        self.subscription: Optional[set] = None  # None: every event
+        self.filters: Dict[str, Route] = {}  # Events only wanted for some param values
+        self.intercepts: Optional[set] = None  # None: every subscribed prefix event is asked
+        self.rules: Dict[str, Route] = {}  # The client's rule table, as Routes of Rule
+        self.rule_decisions = 0
+        # Flow policies the engine enforces: sampling and throttling, coalescing is left to clients
+        self.flow: Dict[str, Dict[str, Any]] = {}  # Event -> policy and its state
+        self.suppressed: Dict[str, int] = {}
+        self.commands: List[Any] = []
+        self.results: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.bytes_sent = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def wants(self, event_name: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        if not (self.sharing and (self.subscription is None or "*" in self.subscription
+                                  or event_name in self.subscription)):
+            return False
+        route = self.filters.get(event_name)
+        return route is None or params is None or bool(route.select(params))
+
+    def admits(self, event_name: str) -> bool:
+        """Whether a non prefix event gets through the client's flow policy for it."""
+        flow = self.flow.get(event_name)
+        if flow is None:
+            return True
+        if "sample" in flow:
+            flow["seen"] += 1
+            admitted = (flow["seen"] - 1) % flow["sample"] == 0
+        else:
+            now = time.monotonic()
+            rate = flow["throttle"]
+            flow["tokens"] = min(max(rate, 1.0), flow["tokens"] + (now - flow["stamp"]) * rate)
+            flow["stamp"] = now
+            admitted = flow["tokens"] >= 1
+            if admitted:
+                flow["tokens"] -= 1
+        if not admitted:
+            self.suppressed[event_name] = self.suppressed.get(event_name, 0) + 1
+        return admitted
+
+    def asks(self, event_name: str) -> bool:
+        """Whether prefix events no rule decided wait for the client, like events with interceptors."""
+        return self.intercepts is None or event_name in self.intercepts or event_name not in self.rules
+
+    def decide(self, event_name: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The decision of the first matching rule, with plain params, or None when no rule matches."""
+        route = self.rules.get(event_name) if self.sharing else None
+        rules = route.select(params) if route is not None else ()
+        if not rules:
+            return None
+        self.rule_decisions += 1
+        return {"event": event_name, "params": rules[0].apply(params), "rule": True}
+
+    def subscribe(self, payload: Dict[str, Any]):
+        self.subscription = set(payload.get("events", ()))
+        self.filters = {event: Route([(order, True, criteria_from_json(match)) for order, match in enumerate(matches)])
+                        for event, matches in payload.get("filters", {}).items()}
+        self.intercepts = set(payload["intercepts"]) if "intercepts" in payload else None
+        rules: Dict[str, list] = {}
+        for rule in map(Rule.from_json, payload.get("rules", ())):
+            rules.setdefault(rule.event, []).append(rule)
+        self.rules = {event: Route([(order, rule, rule.match) for order, rule in enumerate(event_rules)])
+                      for event, event_rules in rules.items()}
+        if "flow" in payload:
+            self.flow = {event: dict(policy, seen=0, tokens=max(policy.get("throttle", 1.0), 1.0),
+                                     stamp=time.monotonic())
+                         for event, policy in payload["flow"].items() if "sample" in policy or "throttle" in policy}
+            self.send(self.encode(FLOW_EVENT, {"events": sorted(self.flow)}))
+
+    def handle(self, command: str, payload):
+        self.commands.append((command, payload))
+        if command == "START":
+            self.sharing = True
+            if payload is not None:
+                self.subscribe(payload)
+        elif command == "STOP":
+            self.sharing = False
+        elif command == "SUBSCRIBE":
+            self.subscribe(payload)
+        elif command == "INTERCEPTION_RESULT":
+            self.results.put(payload)
+        elif command == "HELLO" and self.binary and BINARY_PROTOCOL in payload.get("protocols", ()):
+            codec = next((c for c in available_codecs() if c.name in payload.get("codecs", ())), None)
+            if codec:
+                with self.lock:
+                    # Everything after this last text frame is binary
+                    self.socket.sendall(EngineSimulator.frame(BINARY_SWITCH_EVENT, {"protocol": BINARY_PROTOCOL,
+                                                                                     "codec": codec.name}))
+                    self.codec = codec
+
+    def handle_binary(self, kind: int, body: bytes):
+        if kind == FRAME_COMMAND:
+            for command, payload in parse_commands(body.decode('utf-8'))[0]:
+                self.handle(command, payload)
+        elif kind == FRAME_INTERCEPTION_RESULT:
+            self.handle("INTERCEPTION_RESULT", self.codec.decode(body))
+
+    def encode(self, event_name: str, params: Dict[str, Any], prefix: bool = False) -> bytes:
+        if self.codec:
+            return binary_frame(FRAME_PREFIX_EVENT if prefix else FRAME_EVENT,
+                                binary_event_body(event_name, self.codec.encode(params)))
+        return EngineSimulator.frame(event_name, dict(params, __is_prefix=True) if prefix else params)
+
+    def send(self, data: bytes):
+        with self.lock:
+            self.socket.sendall(data)
+            self.bytes_sent += len(data)
+
+
+class EngineSimulator:
+    """Pure-Python stand-in for the ProLeak engine, speaking the same protocol over TCP.
+
+    Meant for tests and benchmarks: no game, no BepInEx. Events are only serialized
+    for clients whose ``START``/``SUBSCRIBE`` subscription asks for them.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, binary: bool = True):
+        self.host = host
+        self.port = port
+        self.binary = binary
+        self.connections: List[EngineConnection] = []
+        self.events_skipped = 0  # Events no client subscribed to, never serialized
+        self._server: Optional[socket.socket] = None
+        self._threads: List[threading.Thread] = []
+        self._connected = threading.Condition()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+        for connection in self.connections:
+            try:
+                connection.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.socket.close()
+
+    def _accept(self):
+        while self._server:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = EngineConnection(sock, self.binary)
+            thread = threading.Thread(target=self._read_commands, args=(connection,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            with self._connected:
+                self.connections.append(connection)
+                self._connected.notify_all()
+
+    def _read_commands(self, connection: EngineConnection):
+        buffer = b""
+        while True:
+            try:
+                data = connection.socket.recv(65536)
+            except OSError:
+                connection.closed = True
+                return
+            if not data:
+                connection.closed = True
+                return
+            buffer += data
+            commands, buffer = split_commands(buffer)
+            for kind, command in commands:
+                if kind is None:
+                    connection.handle(*command)
+                else:
+                    connection.handle_binary(kind, command)
+
+    def wait_for_client(self, count: int = 1, timeout: float = 5) -> EngineConnection:
+        with self._connected:
+            if not self._connected.wait_for(lambda: len(self.connections) >= count, timeout):
+                raise TimeoutError("No ProLeak client connected to the simulator")
+            return self.connections[count - 1]
+
+    def wait_until(self, predicate, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise TimeoutError("Simulator condition not met in time")
+            time.sleep(0.001)
+
+    @staticmethod
+    def frame(event_name: str, params: Dict[str, Any]) -> bytes:
+        return f"Event: {event_name}\n{json.dumps(params)}\n---\n".encode('utf-8')
+
+    def emit(self, event_name: str, params: Dict[str, Any]) -> int:
+        """Send an event to every subscribed client. Returns how many got it."""
+        receivers = [connection for connection in self.connections
+                     if connection.wants(event_name, params) and connection.admits(event_name)]
+        if not receivers:
+            self.events_skipped += 1
+            return 0
+        encoded: Dict[Optional[str], bytes] = {}  # Serialize once per codec
+        for connection in receivers:
+            key = connection.codec.name if connection.codec else None
+            if key not in encoded:
+                encoded[key] = connection.encode(event_name, params)
+            connection.send(encoded[key])
+        return len(receivers)
+
+    def intercept(self, event_name: str, params: Dict[str, Any], timeout: float = 5,
+                  connection: Optional[EngineConnection] = None) -> Optional[Dict[str, Any]]:
+        """Send a prefix event and wait for the client's decision, like the game does.
+
+        Returns the ``INTERCEPTION_RESULT`` payload, whose ``params`` is None for a block,
+        or None when the client did not subscribe to the event and the game went on.
+        Events decided by the client's rules never reach it, see ``EngineConnection.decide``.
+        """
+        connection = connection or self.wait_for_client()
+        if connection.wants(event_name):
+            decision = connection.decide(event_name, params)
+            if decision is not None:
+                return decision
+        if not connection.wants(event_name, params) or not connection.asks(event_name):
+            self.events_skipped += 1
+            return None
+        connection.send(connection.encode(event_name, params, prefix=True))
+        return connection.results.get(timeout=timeout)
+
+    def run(self, profile: LoadProfile, connection: Optional[EngineConnection] = None,
+            seed: int = 0) -> Dict[str, Any]:
+        """Play a synthetic stream to one client and report what it took.
+
+        Each event carries ``__sent``, the ``time.time_ns()`` it was sent at, so clients
+        can measure their own delivery latency. Prefix events block until answered.
+        """
+        connection = connection or self.wait_for_client()
+        rtt = LatencyHistogram()
+        batch: List[bytes] = []
+        sent = skipped = 0
+
+        def flush():
+            if batch:
+                connection.send(b"".join(batch))
+                batch.clear()
+
+        started = time.perf_counter()
+        for index, (event_name, params, prefix) in enumerate(synthetic_events(profile, seed)):
+            if profile.rate:
+                ahead = started + index / profile.rate - time.perf_counter()
+                if ahead > 0.001:
+                    flush()
+                    time.sleep(ahead)
+            params["__sent"] = time.time_ns()
+            if prefix:
+                flush()
+                asked = time.perf_counter()
+                if self.intercept(event_name, params, connection=connection) is not None:
+                    rtt.record(time.perf_counter() - asked)
+                    sent += 1
+                else:
+                    skipped += 1
+            elif connection.wants(event_name, params) and connection.admits(event_name):
+                batch.append(connection.encode(event_name, params))
+                sent += 1
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+            else:
+                skipped += 1
+        flush()
+        elapsed = time.perf_counter() - started
+        return {
+            "profile": profile.name,
+            "sent": sent,
+            "skipped": skipped,
+            "elapsed": elapsed,
+            "events_per_second": sent / elapsed if elapsed else 0.0,
+            "interceptor_rtt": rtt.as_dict(),
+        }
+
+    def replay(self, frames: Iterable[bytes], rate: Optional[float] = None,
+               connection: Optional[EngineConnection] = None) -> Dict[str, Any]:
+        """Play captured text frames to one client, prefix frames waiting for their decision."""
+        connection = connection or self.wait_for_client()
+        rtt = LatencyHistogram()
+        sent = skipped = 0
+        started = time.perf_counter()
+        for index, frame in enumerate(frames):
+            if rate:
+                ahead = started + index / rate - time.perf_counter()
+                if ahead > 0:
+                    time.sleep(ahead)
+            header, _, body = frame.partition(b"\n")
+            event_name = header.decode('utf-8').split(': ', 1)[1]
+            if not connection.wants(event_name):
+                skipped += 1
+                continue
+            params = json.loads(body.split(b"\n")[0])
+            prefix = params.pop("__is_prefix", False)
+            if prefix and connection.decide(event_name, params) is not None:
+                sent += 1
+                continue
+            if (not connection.wants(event_name, params) or (prefix and not connection.asks(event_name))
+                    or (not prefix and not connection.admits(event_name))):
+                skipped += 1
+                continue
+            if prefix:
+                asked = time.perf_counter()
+                connection.send(connection.encode(event_name, params, prefix=True))
+                connection.results.get(timeout=5)
+                rtt.record(time.perf_counter() - asked)
+            else:
+                connection.send(frame if not connection.codec else connection.encode(event_name, params))
+            sent += 1
+        elapsed = time.perf_counter() - started
+        return {
+            "profile": "replay",
+            "sent": sent,
+            "skipped": skipped,
+            "elapsed": elapsed,
+            "events_per_second": sent / elapsed if elapsed else 0.0,
+            "interceptor_rtt": rtt.as_dict(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in ProLeak engine for tests and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port, printed as 'PORT <n>'")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="steady")
+    parser.add_argument("--count", type=int, help="Override the profile's event count")
+    parser.add_argument("--rate", type=float, help="Override the profile's events per second")
+    parser.add_argument("--replay", help="Play a captured text stream instead of a profile")
+    parser.add_argument("--text-only", action="store_true", help="Refuse the binary protocol")
+    args = parser.parse_args(argv)
+
+    profile = PROFILES[args.profile]
+    if args.count is not None:
+        profile = profile._replace(count=args.count)
+    if args.rate is not None:
+        profile = profile._replace(rate=args.rate or None)
+
+    with EngineSimulator(args.host, args.port, binary=not args.text_only) as engine:
+        print(f"PORT {engine.port}", flush=True)
+        connection = engine.wait_for_client(timeout=60)
+        engine.wait_until(lambda: connection.sharing, timeout=60)
+        if args.replay:
+            report = engine.replay(read_capture(args.replay), args.rate, connection)
+        else:
+            report = engine.run(profile, connection)
+        # The examples unplug on EndOfGame, so does the load-test client
+        connection.send(connection.encode("EndOfGame", {"__sent": time.time_ns()}))
+        engine.wait_until(lambda: connection.closed, timeout=60)
+        print(json.dumps(report), flush=True)
+
+
+if __name__ == "__main__":
+    main()
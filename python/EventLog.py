@@ -0,0 +1,445 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import asyncio
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ProLeak import CommandWriter, Codec, available_codecs
+
+DEFAULT_CHUNK_SIZE = 2 ** 20  # Uncompressed bytes per chunk
+INDEX_SUFFIX = ".idx"
+
+LOG_MAGIC = b"PLOG1\n"
+INDEX_MAGIC = b"PLIX1\n"
+KIND_TEXT = 0  # Text frame, without its delimiter. Binary frames keep their own kind
+
+# Log: the magic, then chunks of a header, the codec name of their binary frames
+# and the zlib compressed records
+_CHUNK = struct.Struct("<IIB")  # Compressed size, raw size, codec name size
+_RECORD = struct.Struct("<qBI")  # Received at (ns since the epoch), frame kind, frame size
+# Index: the magic, then one block per chunk: the header, the names first seen
+# in the chunk ("\n" joined), then one entry per frame
+_BLOCK = struct.Struct("<QII")  # Chunk offset, entries, names size
+_ENTRY = struct.Struct("<qII")  # Received at, record offset in the chunk, name id
+
+
+def _event_name(kind: int, data) -> str:
+    if kind == KIND_TEXT:
+        return bytes(data).lstrip().split(b"\n", 1)[0].decode('utf-8').split(': ', 1)[1]
+    size = int.from_bytes(data[:2], 'big')
+    return str(data[2:2 + size], 'utf-8')
+
+
+class EventRecorder:
+    """Appends the frames a client receives to a compressed, chunked log, with a sidecar index.
+
+    Frames are copied into the current chunk on the reader thread; chunks are
+    compressed and written by a background thread, so recording costs the reader
+    a copy per frame. Attach it with ``client.start_recording(recorder)``.
+    """
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, level: int = 1):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.chunk_size = chunk_size
+        self.level = level
+        self.frames = 0
+        self.chunks = 0
+        self.bytes_written = 0
+        self._log = open(path, 'wb')
+        self._index = open(self.index_path, 'wb')
+        self._log.write(LOG_MAGIC)
+        self._index.write(INDEX_MAGIC)
+        self._offset = len(LOG_MAGIC)
+        self._names: Dict[str, int] = {}
+        self._buffer = bytearray()
+        self._entries: List[bytes] = []
+        self._new_names: List[str] = []
+        self._codec: Optional[str] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._chunks: "queue.Queue[Optional[Tuple[bytes, List[bytes], List[str], Optional[str]]]]" = queue.Queue(8)
+        self._thread = threading.Thread(target=self._write, name="ProLeakRecorder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, frames: list, text: bool, codec: Optional[Codec] = None):
+        """Append frames read together: ``str`` text frames, or ``(kind, body)`` binary ones."""
+        received = time.time_ns()
+        with self._lock:
+            if self._closed:
+                return
+            if not text and codec and codec.name != self._codec:
+                self._seal()  # A chunk's binary frames all use the codec its header names
+                self._codec = codec.name
+            for frame in frames:
+                if text:
+                    kind, data = KIND_TEXT, frame.encode('utf-8')
+                else:
+                    kind, data = frame
+                name = _event_name(kind, data)
+                name_id = self._names.get(name)
+                if name_id is None:
+                    name_id = self._names[name] = len(self._names)
+                    self._new_names.append(name)
+                self._entries.append(_ENTRY.pack(received, len(self._buffer), name_id))
+                self._buffer += _RECORD.pack(received, kind, len(data))
+                self._buffer += data
+            self.frames += len(frames)
+            if len(self._buffer) >= self.chunk_size:
+                self._seal()
+
+    def flush(self):
+        """Close the current chunk, so everything recorded so far reaches the disk."""
+        with self._lock:
+            self._seal()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._seal()
+            self._closed = True
+        self._chunks.put(None)
+        self._thread.join()
+        self._log.close()
+        self._index.close()
+
+    def _seal(self):
+        # Called with _lock held
+        if self._entries:
+            self._chunks.put((bytes(self._buffer), self._entries, self._new_names, self._codec))
+            self._buffer = bytearray()
+            self._entries, self._new_names = [], []
+
+    def _write(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            raw, entries, names, codec = chunk
+            compressed = zlib.compress(raw, self.level)
+            codec_name = (codec or "").encode('utf-8')
+            self._log.write(_CHUNK.pack(len(compressed), len(raw), len(codec_name)) + codec_name)
+            self._log.write(compressed)
+            self._log.flush()
+            names_blob = "\n".join(names).encode('utf-8')
+            self._index.write(_BLOCK.pack(self._offset, len(entries), len(names_blob)))
+            self._index.write(names_blob + b"".join(entries))
+            self._index.flush()
+            self._offset += _CHUNK.size + len(codec_name) + len(compressed)
+            self.chunks += 1
+            self.bytes_written = self._offset
+
+
+class _ReplaySink:
+    """Stands in for the engine connection while replaying, counting the replies."""
+    transport = None  # AsyncProLeak stats look for a transport buffer
+
+    def __init__(self):
+        self.writes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+
+    def sendmsg(self, buffers):
+        self.writes += 1
+        return sum(len(buffer) for buffer in buffers)
+
+    def write(self, data):
+        self.writes += 1  # AsyncProLeak writes each reply on its own
+
+    async def drain(self):
+        pass
+
+
+class EventLog:
+    """A recorded log, memory-mapped, with its index loaded for seeking.
+
+    Entries are numbered in the order frames were received; ``seek_time`` and
+    ``seek_event`` find the entry to start a replay from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a ProLeak event log")
+        if self._map[:len(LOG_MAGIC)] != LOG_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a ProLeak event log")
+        self.names: List[str] = []
+        self.timestamps = array('q')  # Received at, ns since the epoch
+        self.name_ids = array('I')
+        self.chunk_offsets = array('Q')
+        self.record_offsets = array('I')
+        self._chunk: Tuple[int, Optional[bytes], Optional[str]] = (-1, None, None)  # Last decompressed chunk
+        index_path = path + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            self._load_index(index_path)
+        else:
+            self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    @property
+    def duration(self) -> float:
+        """Seconds between the first and the last frame."""
+        return (self.timestamps[-1] - self.timestamps[0]) / 1e9 if self.timestamps else 0.0
+
+    def counts(self) -> Dict[str, int]:
+        """Frames per event name."""
+        counts = [0] * len(self.names)
+        for name_id in self.name_ids:
+            counts[name_id] += 1
+        return {name: count for name, count in zip(self.names, counts) if count}
+
+    def seek_time(self, seconds: float) -> int:
+        """First entry received at least ``seconds`` after the start of the log."""
+        if not self.timestamps:
+            return 0
+        return bisect_left(self.timestamps, self.timestamps[0] + int(seconds * 1e9))
+
+    def seek_event(self, event_name: str, start: int = 0) -> Optional[int]:
+        """First entry from ``start`` on of an ``event_name`` frame, None if there is none."""
+        try:
+            name_id = self.names.index(event_name)
+        except ValueError:
+            return None
+        name_ids = self.name_ids
+        for entry in range(start, len(name_ids)):
+            if name_ids[entry] == name_id:
+                return entry
+        return None
+
+    def frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, int, Any, Optional[str]]]:
+        """``(received at, kind, frame, codec name)`` of the entries from ``start`` to ``stop``.
+
+        Text frames come as ``str``, binary ones as ``memoryview`` of their body.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for entry in range(start, stop):
+            chunk_offset = self.chunk_offsets[entry]
+            raw = self._raw(chunk_offset)
+            offset = self.record_offsets[entry]
+            received, kind, size = _RECORD.unpack_from(raw, offset)
+            data = memoryview(raw)[offset + _RECORD.size:offset + _RECORD.size + size]
+            yield received, kind, (str(data, 'utf-8') if kind == KIND_TEXT else data), self._chunk[2]
+
+    def _header(self, chunk_offset: int) -> Tuple[int, int, Optional[str]]:
+        """Where a chunk's compressed records start and end, and the codec of its binary frames."""
+        compressed_size, _, codec_size = _CHUNK.unpack_from(self._map, chunk_offset)
+        start = chunk_offset + _CHUNK.size + codec_size
+        return start, start + compressed_size, self._map[start - codec_size:start].decode('utf-8') or None
+
+    def _raw(self, chunk_offset: int) -> bytes:
+        if self._chunk[0] != chunk_offset:
+            start, end, codec = self._header(chunk_offset)
+            self._chunk = (chunk_offset, zlib.decompress(self._map[start:end]), codec)
+        return self._chunk[1]
+
+    def _load_index(self, index_path: str):
+        with open(index_path, 'rb') as f:
+            index = f.read()
+        if index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a ProLeak event log index")
+        position = len(INDEX_MAGIC)
+        while position + _BLOCK.size <= len(index):
+            chunk_offset, entries, names_size = _BLOCK.unpack_from(index, position)
+            position += _BLOCK.size
+            end = position + names_size + entries * _ENTRY.size
+            if end > len(index) or chunk_offset + _CHUNK.size > len(self._map):
+                break  # Cut short by a crash while recording
+            if names_size:
+                self.names.extend(index[position:position + names_size].decode('utf-8').split("\n"))
+            position += names_size
+            for received, record_offset, name_id in _ENTRY.iter_unpack(index[position:end]):
+                self.timestamps.append(received)
+                self.record_offsets.append(record_offset)
+                self.name_ids.append(name_id)
+            self.chunk_offsets.extend([chunk_offset] * entries)
+            position = end
+
+    def _scan(self):
+        # No index, rebuild it from the chunks
+        names: Dict[str, int] = {}
+        position = len(LOG_MAGIC)
+        while position + _CHUNK.size <= len(self._map):
+            try:
+                raw = self._raw(position)
+            except zlib.error:
+                break  # Cut short by a crash while recording
+            offset = 0
+            while offset < len(raw):
+                received, kind, size = _RECORD.unpack_from(raw, offset)
+                name = _event_name(kind, memoryview(raw)[offset + _RECORD.size:offset + _RECORD.size + size])
+                if name not in names:
+                    names[name] = len(self.names)
+                    self.names.append(name)
+                self.timestamps.append(received)
+                self.name_ids.append(names[name])
+                self.chunk_offsets.append(position)
+                self.record_offsets.append(offset)
+                offset += _RECORD.size + size
+            position = self._header(position)[1]
+
+    def _batches(self, start: int, stop: Optional[int]) -> Iterator[Tuple[int, bool, list, Optional[str]]]:
+        # Frames the client read together, as (received at, text, frames, codec name)
+        batch: list = []
+        batch_key = None
+        for received, kind, frame, codec in self.frames(start, stop):
+            key = (received, kind == KIND_TEXT, codec)
+            if key != batch_key and batch:
+                yield batch_key[0], batch_key[1], batch, batch_key[2]
+                batch = []
+            batch_key = key
+            batch.append(frame if kind == KIND_TEXT else (kind, frame))
+        if batch:
+            yield batch_key[0], batch_key[1], batch, batch_key[2]
+
+    @staticmethod
+    def _codec(name: Optional[str]) -> Optional[Codec]:
+        if name is None:
+            return None
+        codec = next((c for c in available_codecs() if c.name == name), None)
+        if codec is None:
+            raise ValueError(f"The log's binary frames need the {name} codec, which is not installed")
+        return codec
+
+    @staticmethod
+    def _ahead(started: float, first: int, received: int, speed: Optional[float]) -> float:
+        """Seconds to wait before replaying a frame received at ``received``, at ``speed``."""
+        return started + (received - first) / 1e9 / speed - time.perf_counter() if speed else 0.0
+
+    def replay(self, client, speed: Optional[float] = 1.0, start: int = 0,
+               stop: Optional[int] = None) -> Dict[str, Any]:
+        """Feed the entries from ``start`` to ``stop`` to a disconnected ``ProLeak`` client.
+
+        Frames go through the client's own dispatch, read together as they were
+        recorded. ``speed`` scales the recorded pace: 1.0 replays in real time, None as
+        fast as possible. Interception results are counted, then dropped.
+        """
+        if client.socket:
+            raise ValueError("Disconnect the client before replaying into it, its replies would reach the engine")
+        sink = _ReplaySink()
+        client.socket, client.writer = sink, CommandWriter(sink)
+        if client.executor:
+            client.executor.start()
+        if client.process_executor:
+            client.process_executor.start()
+        frames = 0
+        started = time.perf_counter()
+        try:
+            first = None
+            for received, text, batch, codec in self._batches(start, stop):
+                first = received if first is None else first
+                ahead = self._ahead(started, first, received, speed)
+                if ahead > 0:
+                    time.sleep(ahead)
+                client.codec = None if text else self._codec(codec)
+                client._process_frames(client.writer, batch,
+                                       client._process_event if text else client._process_binary_event, text)
+                frames += len(batch)
+        finally:
+            if client.executor:
+                client.executor.shutdown(drain=True)
+            if client.process_executor:
+                client.process_executor.shutdown(drain=True)
+            replies = client.writer.messages
+            client.socket = client.writer = client.codec = None
+        return self._report(frames, replies, time.perf_counter() - started)
+
+    async def replay_async(self, client, speed: Optional[float] = 1.0, start: int = 0,
+                           stop: Optional[int] = None) -> Dict[str, Any]:
+        """:meth:`replay` for a disconnected ``AsyncProLeak`` client."""
+        if client.writer:
+            raise ValueError("Disconnect the client before replaying into it, its replies would reach the engine")
+        client.writer = sink = _ReplaySink()
+        frames = 0
+        started = time.perf_counter()
+        try:
+            first = None
+            for received, text, batch, codec in self._batches(start, stop):
+                first = received if first is None else first
+                ahead = self._ahead(started, first, received, speed)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+                client.codec = None if text else self._codec(codec)
+                client.frames_received += len(batch)
+                for frame in batch:
+                    if text:
+                        await client._process_event(frame.strip().split('\n'))
+                    else:
+                        await client._process_binary_event(*frame)
+                frames += len(batch)
+        finally:
+            client.writer = client.codec = None
+        return self._report(frames, sink.writes, time.perf_counter() - started)
+
+    @staticmethod
+    def _report(frames: int, replies: int, elapsed: float) -> Dict[str, Any]:
+        return {
+            "frames": frames,
+            "replies": replies,
+            "elapsed": elapsed,
+            "frames_per_second": frames / elapsed if elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a recorded ProLeak event log.")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    with EventLog(args.path) as log:
+        print(f"{args.path}: {len(log)} frames over {log.duration:.1f}s, "
+              f"{os.path.getsize(args.path) / 2 ** 20:.1f} MiB on disk")
+        for name, count in sorted(log.counts().items(), key=lambda item: -item[1]):
+            print(f"  {name:<32} {count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ProLeak import EventRegistry
+
+DEFAULT_CAPACITY = 1024
+
+# Column kinds: interned strings as int32 codes (-1 when missing), numbers as float64 (NaN when
+# missing, exact for integers up to 2 ** 53), anything else as Python objects
+_STR, _NUM, _OBJ = "str", "num", "obj"
+
+
+class _Interner:
+    """Store-wide string table: each distinct string is kept once, columns hold its code."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def decode(self, codes) -> List[Optional[str]]:
+        strings = self.strings
+        return [strings[code] if code >= 0 else None for code in codes.tolist()]
+
+
+def _hashable(value: Any) -> Any:
+    # Group keys of list and dict params: lists become tuples, dicts sorted item tuples
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    return value
+
+
+def _factorize(column) -> Tuple[Any, List[Any]]:
+    """Codes and distinct values of an object column, found by hashing: None, strings and numbers don't sort together."""
+    codes: Dict[Any, int] = {}
+    inverse = np.empty(len(column), dtype=np.int64)
+    for row, value in enumerate(column.tolist()):
+        inverse[row] = codes.setdefault(_hashable(value), len(codes))
+    return inverse, list(codes)
+
+
+def _kind(value: Any) -> str:
+    if isinstance(value, str):
+        return _STR
+    if isinstance(value, (int, float)):  # bool included
+        return _NUM
+    return _OBJ
+
+
+class _Table:
+    """Columns of one event type, sharing a length and, when bounded, a ring position."""
+
+    def __init__(self, capacity: int, bounded: bool):
+        self.capacity = capacity
+        self.bounded = bounded
+        self.size = 0  # Rows held
+        self.next = 0  # Row the next event goes to
+        self.total = 0  # Events ever appended, including those pushed out of a bounded table
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.columns: Dict[str, Any] = {}
+        self.kinds: Dict[str, str] = {}
+        self.floats = set()  # Numeric columns that did not only get integers
+
+    @staticmethod
+    def _missing(kind: str):
+        return -1 if kind == _STR else np.nan if kind == _NUM else None
+
+    def _new_column(self, kind: str, capacity: int):
+        dtype = np.int32 if kind == _STR else np.float64 if kind == _NUM else object
+        return np.full(capacity, self._missing(kind), dtype=dtype)
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name, column in self.columns.items():
+            grown = self._new_column(self.kinds[name], capacity)
+            grown[:self.capacity] = column
+            self.columns[name] = grown
+        timestamps = np.empty(capacity, dtype=np.float64)
+        timestamps[:self.capacity] = self.timestamps
+        self.timestamps = timestamps
+        self.capacity = capacity
+
+    def _widen(self, name: str, interner: _Interner):
+        # A value did not fit the column's kind: keep it as objects from now on
+        column, kind = self.columns[name], self.kinds[name]
+        widened = np.full(self.capacity, None, dtype=object)
+        if kind == _STR:
+            widened[:] = interner.decode(column)
+        else:
+            cast = float if name in self.floats else int
+            widened[:] = [None if value != value else cast(value) for value in column.tolist()]  # NaN: missing
+        self.columns[name], self.kinds[name] = widened, _OBJ
+
+    def append(self, timestamp: float, params: Dict[str, Any], keys: Optional[Sequence[str]], interner: _Interner):
+        if self.next == self.capacity:
+            if self.bounded:
+                self.next = 0
+            else:
+                self._grow()
+        row = self.next
+        self.timestamps[row] = timestamp
+        if self.size == self.capacity:  # Overwriting the oldest event: clear what it left
+            for name, column in self.columns.items():
+                column[row] = self._missing(self.kinds[name])
+        for name in (params if keys is None else keys):
+            value = params.get(name) if keys is not None else params[name]
+            if value is None:
+                continue
+            kind = self.kinds.get(name)
+            if kind is None:
+                kind = self.kinds[name] = _kind(value)
+                self.columns[name] = self._new_column(kind, self.capacity)
+            elif kind != _OBJ and kind != _kind(value):
+                self._widen(name, interner)
+                kind = _OBJ
+            if kind == _STR:
+                self.columns[name][row] = interner.code(value)
+            else:
+                if kind == _NUM and type(value) is not int:
+                    self.floats.add(name)
+                self.columns[name][row] = value
+        self.next = row + 1
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def order(self):
+        """Row indices from oldest to newest, or a slice when no ring wrapped."""
+        if self.size < self.capacity or self.next == self.capacity:
+            return slice(0, self.size)
+        return np.concatenate((np.arange(self.next, self.capacity), np.arange(0, self.next)))
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(column.nbytes for column in self.columns.values())
+
+
+class EventStore:
+    """Columnar in-memory sink for events, queried with vectorized NumPy operations.
+
+    Each event type gets its own table: a float64 timestamp column plus one column
+    per param, strings interned store-wide. Tables double when full, or with
+    ``max_events`` keep only that many of the latest events per type.
+    ``keys`` limits the params kept per event type, e.g. ``{"MethodCall": ["Method", "DeclaringType"]}``.
+
+    ``attach(client)`` registers the store as a handler; ``append`` can also be called directly,
+    with timestamps that never go back in time.
+    """
+
+    def __init__(self, events: Union[str, List[str], None] = None, keys: Optional[Dict[str, Sequence[str]]] = None,
+                 max_events: Optional[int] = None, capacity: int = DEFAULT_CAPACITY):
+        if np is None:
+            raise ImportError("EventStore needs the numpy package")
+        self.events = [events] if isinstance(events, str) else events  # None: every event
+        self.keys = keys or {}
+        self.max_events = max_events
+        self.capacity = max_events or capacity
+        self.tables: Dict[str, _Table] = {}
+        self.interner = _Interner()
+        self._lock = threading.Lock()
+
+    def attach(self, client: EventRegistry):
+        if self.events is None:
+            client.register_global_handler(self._on_event)
+        else:
+            client.register_handler(self.events, self._on_event)
+
+    def detach(self, client: EventRegistry):
+        if self.events is None:
+            client.unregister_global_handler(self._on_event)
+        else:
+            client.unregister_handler(self.events, self._on_event)
+
+    def _on_event(self, event_name: str, params: Dict[str, Any]):
+        self.append(event_name, params)
+
+    def append(self, event_name: str, params: Dict[str, Any], timestamp: Optional[float] = None):
+        with self._lock:
+            table = self.tables.get(event_name)
+            if table is None:
+                table = self.tables[event_name] = _Table(self.capacity, self.max_events is not None)
+            table.append(time.time() if timestamp is None else timestamp, params, self.keys.get(event_name),
+                         self.interner)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the columns, strings interned once aside."""
+        return sum(table.nbytes for table in self.tables.values())
+
+    # Queries work on a snapshot of the columns, taken under the lock, oldest event first
+
+    def _snapshot(self, event_name: str, names: Iterable[str]) -> Tuple[Any, Dict[str, Any]]:
+        with self._lock:
+            table = self.tables.get(event_name)
+            if table is None:
+                return np.empty(0), {name: np.empty(0) for name in names}
+            order = table.order()
+            columns = {}
+            for name in names:
+                column = table.columns.get(name)
+                if column is None:
+                    columns[name] = np.full(table.size, -1, dtype=np.int32)
+                else:
+                    columns[name] = column[order].copy()
+            return table.timestamps[order].copy(), columns
+
+    def _column_kind(self, event_name: str, name: str) -> Optional[str]:
+        """Kind of a param's column, None when no event of that type had it."""
+        table = self.tables.get(event_name)
+        return table.kinds.get(name) if table else None
+
+    def _mask(self, event_name: str, timestamps, columns, where: Optional[Dict[str, Any]],
+              since: Optional[float], until: Optional[float]):
+        mask = np.ones(len(timestamps), dtype=bool)
+        if since is not None:
+            mask &= timestamps >= since
+        if until is not None:
+            mask &= timestamps < until
+        for name, value in (where or {}).items():
+            kind = self._column_kind(event_name, name)
+            if kind is None:
+                mask[:] = False  # No event had the param, none can match it
+            elif kind == _STR:
+                code = self.interner.codes.get(value, -2) if isinstance(value, str) else -2
+                mask &= columns[name] == code
+            else:
+                mask &= columns[name] == value
+        return mask
+
+    def _values(self, event_name: str, name: str, column) -> List[Any]:
+        table = self.tables.get(event_name)
+        kind = table.kinds.get(name) if table else None
+        if kind == _STR or kind is None:
+            return self.interner.decode(column)
+        if kind == _NUM:
+            cast = float if name in table.floats else int
+            return [None if value != value else cast(value) for value in column.tolist()]
+        return column.tolist()
+
+    def timestamps(self, event_name: str, where: Optional[Dict[str, Any]] = None):
+        """Timestamps of the matching events, oldest first, e.g. wave starts to bucket other events by."""
+        timestamps, columns = self._snapshot(event_name, list(where or ()))
+        return timestamps[self._mask(event_name, timestamps, columns, where, None, None)]
+
+    def column(self, event_name: str, name: str) -> List[Any]:
+        """Values of one param, oldest first; None where an event did not have it."""
+        _, columns = self._snapshot(event_name, [name])
+        return self._values(event_name, name, columns[name])
+
+    def count(self, event_name: str, where: Optional[Dict[str, Any]] = None,
+              since: Optional[float] = None, until: Optional[float] = None) -> int:
+        timestamps, columns = self._snapshot(event_name, list(where or ()))
+        return int(self._mask(event_name, timestamps, columns, where, since, until).sum())
+
+    def group_count(self, event_name: str, by: Union[str, Sequence[str]], where: Optional[Dict[str, Any]] = None,
+                    since: Optional[float] = None, until: Optional[float] = None,
+                    edges: Optional[Sequence[float]] = None) -> Dict[Any, int]:
+        """Count events per distinct value of the ``by`` params.
+
+        Keys are values for a single ``by`` name, tuples otherwise; list params are
+        grouped as tuples, missing ones as None. With ``edges``
+        (sorted timestamps, e.g. wave starts), the bin index comes first in each
+        key: bin ``i`` holds events from ``edges[i]`` up to ``edges[i + 1]``.
+        """
+        names = [by] if isinstance(by, str) else list(by)
+        timestamps, columns = self._snapshot(event_name, set(names) | set(where or ()))
+        mask = self._mask(event_name, timestamps, columns, where, since, until)
+        factors, labels = [], []
+        if edges is not None:
+            bins = np.searchsorted(np.asarray(edges, dtype=np.float64), timestamps[mask], side='right') - 1
+            inside = bins >= 0
+            mask[np.flatnonzero(mask)[~inside]] = False
+            bins = bins[inside]
+            factors.append(bins)
+            labels.append(None)
+        for name in names:
+            column = columns[name][mask]
+            if column.dtype == object:
+                inverse, values = _factorize(column)
+            else:
+                uniques, inverse = np.unique(column, return_inverse=True)
+                values = self._values(event_name, name, uniques)
+            factors.append(inverse.reshape(-1))
+            labels.append(values)
+        if not factors or not len(factors[0]):
+            return {}
+        # One int64 key per row, mixed radix over the factorized columns
+        combined = np.zeros(len(factors[0]), dtype=np.int64)
+        radices = [int(factor.max()) + 1 for factor in factors]
+        for factor, radix in zip(factors, radices):
+            combined = combined * radix + factor
+        keys, counts = np.unique(combined, return_counts=True)
+        result = {}
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            parts = []
+            for radix, values in zip(reversed(radices), reversed(labels)):
+                key, index = divmod(key, radix)
+                parts.append(index if values is None else values[index])
+            parts.reverse()
+            result[parts[0] if len(parts) == 1 else tuple(parts)] = count
+        return result
+
+    def window_counts(self, event_name: str, width: float, step: Optional[float] = None,
+                      where: Optional[Dict[str, Any]] = None, start: Optional[float] = None,
+                      end: Optional[float] = None):
+        """Events per rolling time window of ``width`` seconds, every ``step`` (default ``width``).
+
+        Returns ``(starts, counts)`` arrays; windows are ``[start, start + width)``.
+        """
+        return self.rolling(event_name, None, width, step, "count", where, start, end)
+
+    def rolling(self, event_name: str, name: Optional[str], width: float, step: Optional[float] = None,
+                aggregate: str = "sum", where: Optional[Dict[str, Any]] = None,
+                start: Optional[float] = None, end: Optional[float] = None):
+        """Aggregate a numeric param over rolling time windows: ``count``, ``sum`` or ``mean``.
+
+        Each window costs two binary searches over the sorted timestamps, whatever its width.
+        Returns ``(starts, values)`` arrays.
+        """
+        if aggregate not in ("count", "sum", "mean"):
+            raise ValueError(f"Unknown aggregate: {aggregate!r}")
+        kind = self._column_kind(event_name, name) if aggregate != "count" else None
+        if kind not in (None, _NUM):
+            raise TypeError(f"Cannot {aggregate} {name!r} of {event_name}: it holds {kind} values, not numbers")
+        names = ([name] if name else []) + list(where or ())
+        timestamps, columns = self._snapshot(event_name, names)
+        mask = self._mask(event_name, timestamps, columns, where, None, None)
+        timestamps = timestamps[mask]
+        if not len(timestamps) and (start is None or end is None):
+            return np.empty(0), np.empty(0)
+        start = timestamps[0] if start is None else start
+        end = timestamps[-1] if end is None else end
+        starts = np.arange(start, end + (step or width) / 2, step or width)
+        if not len(starts):
+            starts = np.array([start], dtype=np.float64)
+        left = np.searchsorted(timestamps, starts, side='left')
+        right = np.searchsorted(timestamps, starts + width, side='left')
+        counts = right - left
+        if aggregate == "count":
+            return starts, counts
+        if kind is None:
+            values = np.zeros(len(timestamps))  # No event had the param
+        else:
+            values = np.nan_to_num(columns[name][mask], nan=0.0)
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        totals = sums[right] - sums[left]
+        if aggregate == "sum":
+            return starts, totals
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return starts, np.where(counts > 0, totals / counts, np.nan)
@@ -0,0 +1,289 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import inspect
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from ProLeak import EventRegistry
+
+_UPDATE, _DELETE, _RESET = "update", "delete", "reset"
+GAME = None  # Collection name of the game-wide record
+
+
+class Record:
+    """Compact state record, with one slot per field its collection declared.
+
+    Records a snapshot may hold are never modified again: the view replaces them with
+    an updated copy instead. Treat them as read-only.
+    """
+    __slots__ = ('key', '_generation')
+    _fields: Tuple[str, ...] = ()
+
+    def __init__(self, key: Any, generation: int):
+        self.key = key
+        self._generation = generation
+        for field in self._fields:
+            setattr(self, field, None)
+
+    def _copy(self, generation: int) -> 'Record':
+        record = self.__class__.__new__(self.__class__)
+        record.key = self.key
+        record._generation = generation
+        for field in self._fields:
+            setattr(record, field, getattr(self, field))
+        return record
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{self.__class__.__name__}(key={self.key!r}, {values})"
+
+
+def _record_class(collection: Optional[str], fields: Iterable[str]) -> type:
+    fields = tuple(sorted(set(fields)))
+    name = "Game" if collection is GAME else collection.title().replace("_", "")
+    return type(f"{name}Record", (Record,), {"__slots__": fields, "_fields": fields})
+
+
+class Change(NamedTuple):
+    """Fields of one record an event changed, with their new values.
+
+    ``removed`` is set for a deleted record, and for a reset, which comes as a single
+    change of the game record.
+    """
+    collection: Optional[str]
+    key: Any
+    fields: Dict[str, Any]
+    removed: bool = False
+
+
+class ChangeSet(NamedTuple):
+    version: int
+    event: str
+    changes: Tuple[Change, ...]
+
+
+class _Rule(NamedTuple):
+    kind: str
+    event: str
+    collection: Optional[str]
+    key: Optional[Callable[[Dict[str, Any]], Any]]
+    fields: Tuple[Tuple[str, Callable, bool], ...]  # (field, getter, whether it takes the current value too)
+    match: Dict[str, Any]
+
+
+def _takes_current(spec: Union[str, Callable]) -> bool:
+    """Whether a field spec is called with the current value after the params: it requires two arguments."""
+    if not callable(spec):
+        return False
+    try:
+        params = inspect.signature(spec).parameters.values()
+    except (TypeError, ValueError):
+        return False  # Builtins and C callables like int or itemgetter: the params alone
+    required = [param for param in params
+                if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD) and param.default is param.empty]
+    return len(required) >= 2
+
+
+def _getter(spec: Union[str, Callable]) -> Callable:
+    if callable(spec):
+        return spec
+    return lambda params: params.get(spec)
+
+
+class GameSnapshot:
+    """The state at one version. Reading it takes no lock, and later events never change it."""
+
+    def __init__(self, version: int, game: Record, collections: Dict[str, Mapping[Any, Record]]):
+        self.version = version
+        self.game = game
+        self.collections = collections
+
+    def __getitem__(self, collection: str) -> Mapping[Any, Record]:
+        return self.collections[collection]
+
+
+class GameState:
+    """Game state maintained from the events as they arrive, shared by every consumer.
+
+    Declare how events change it, then ``attach(client)``::
+
+        state = GameState()
+        state.update("WaveStarted", fields={"wave": "Wave"})
+        state.update("GoldChanged", "players", key="Player", fields={"gold": "Gold"})
+        state.update("UnitSpawned", "units", key="UnitId", fields={"owner": "Player", "type": "Unit"})
+        state.delete("UnitDied", "units", key="UnitId")
+        state.reset("GameStarted")
+
+    Field specs are param names or callables of the params, or of the params and the
+    current value: ``{"gold": lambda params, gold: (gold or 0) + params["Amount"]}``.
+
+    Subscribers get a :class:`ChangeSet` per event that changed something, with only
+    the fields that did. :meth:`snapshot` freezes the current state for other threads:
+    records and collections are shared with the live state until the next write to
+    them, which copies the record, or the collection's mapping once (not its records).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._rules: List[_Rule] = []
+        self._classes: Dict[Optional[str], type] = {}  # Set when the first client gets attached
+        self._game: Optional[Record] = None
+        self._tables: Dict[str, Dict[Any, Record]] = {}
+        self._owned: Dict[str, int] = {}  # Collection -> generation its mapping was copied at
+        self._generation = 0  # Bumped by each snapshot: older records and mappings are shared
+        self._lock = threading.Lock()
+        self._subscribers: List[Tuple[Callable[[ChangeSet], None], Optional[frozenset]]] = []
+        self._handlers: Dict[EventRegistry, List[Tuple[str, Callable, Dict[str, Any]]]] = {}
+
+    def update(self, event: str, collection: Optional[str] = GAME, key: Union[str, Callable, None] = None,
+               fields: Optional[Dict[str, Union[str, Callable]]] = None, **match):
+        """Set ``fields`` of the record ``key`` of ``collection`` (or of the game record) on ``event``.
+
+        Keywords restrict it to some param values, as for :meth:`ProLeak.register_handler`.
+        """
+        if not fields:
+            raise ValueError("An update needs fields to set")
+        if (collection is GAME) != (key is None):
+            raise ValueError("Records of a collection need a key, the game record has none")
+        specs = tuple((field, _getter(spec), _takes_current(spec)) for field, spec in fields.items())
+        self._add(_Rule(_UPDATE, event, collection, _getter(key) if key is not None else None, specs, match))
+
+    def delete(self, event: str, collection: str, key: Union[str, Callable], **match):
+        """Remove the record ``key`` of ``collection`` on ``event``."""
+        self._add(_Rule(_DELETE, event, collection, _getter(key), (), match))
+
+    def reset(self, event: str, **match):
+        """Forget everything on ``event``, e.g. when a new game starts."""
+        self._add(_Rule(_RESET, event, GAME, None, (), match))
+
+    def _add(self, rule: _Rule):
+        if self._classes:
+            raise ValueError("Declare the updates before attaching the state to a client")
+        self._rules.append(rule)
+
+    def _freeze(self):
+        fields: Dict[Optional[str], set] = {GAME: set()}
+        for rule in self._rules:
+            fields.setdefault(rule.collection, set()).update(field for field, _, _ in rule.fields)
+        self._classes = {collection: _record_class(collection, names) for collection, names in fields.items()}
+        self._clear()
+
+    def _clear(self):
+        self._game = self._classes[GAME](None, self._generation)
+        self._tables = {collection: {} for collection in self._classes if collection is not GAME}
+        self._owned = dict.fromkeys(self._tables, self._generation)
+
+    def attach(self, client: EventRegistry):
+        if not self._classes:
+            self._freeze()
+        handlers = self._handlers.setdefault(client, [])
+        for rule in self._rules:
+            handler = self._handler(rule)
+            handlers.append((rule.event, handler, rule.match))
+            client.register_handler(rule.event, handler, **rule.match)
+
+    def _handler(self, rule: _Rule) -> Callable[[str, Dict[str, Any]], None]:
+        def handler(event_name, event_params):
+            self.apply(rule, event_name, event_params)
+
+        handler.__qualname__ = f"GameState.{rule.kind}({rule.event})"
+        return handler
+
+    def detach(self, client: EventRegistry):
+        for event, handler, _ in self._handlers.pop(client, ()):
+            client.unregister_handler(event, handler)
+
+    def subscribe(self, callback: Callable[[ChangeSet], None], collections: Optional[Iterable[Optional[str]]] = None):
+        """Call ``callback`` with the change set of each event, limited to some collections
+        (``GAME`` for the game record). It runs on the thread that handled the event."""
+        self._subscribers = self._subscribers + [(callback, None if collections is None else frozenset(collections))]
+
+    def unsubscribe(self, callback: Callable[[ChangeSet], None]):
+        self._subscribers = [entry for entry in self._subscribers if entry[0] is not callback]
+
+    def _writable(self, collection: str) -> Dict[Any, Record]:
+        # The mapping may be in a snapshot: copy it, once per snapshot
+        table = self._tables[collection]
+        if self._owned[collection] != self._generation:
+            table = self._tables[collection] = dict(table)
+            self._owned[collection] = self._generation
+        return table
+
+    def apply(self, rule: _Rule, event_name: str, event_params: Dict[str, Any]):
+        with self._lock:
+            change = self._change(rule, event_params)
+            if change is None:
+                return
+            self.version += 1
+            change_set = ChangeSet(self.version, event_name, (change,))
+        for callback, collections in self._subscribers:
+            if collections is None or change.collection in collections:
+                callback(change_set)
+
+    def _change(self, rule: _Rule, params: Dict[str, Any]) -> Optional[Change]:
+        if rule.kind == _RESET:
+            self._clear()
+            return Change(GAME, None, {}, True)
+        collection = rule.collection
+        key = rule.key(params) if rule.key is not None else None
+        if rule.kind == _DELETE:
+            if key not in self._tables[collection]:
+                return None
+            del self._writable(collection)[key]
+            return Change(collection, key, {}, True)
+
+        record = self._game if collection is GAME else self._tables[collection].get(key)
+        changed = {}
+        for field, getter, with_current in rule.fields:
+            current = getattr(record, field) if record is not None else None
+            value = getter(params, current) if with_current else getter(params)
+            if record is None or value != current:
+                changed[field] = value
+        if not changed:
+            return None
+        if record is None or record._generation != self._generation:
+            # New, or maybe held by a snapshot: write a copy
+            record = record._copy(self._generation) if record else self._classes[collection](key, self._generation)
+            if collection is GAME:
+                self._game = record
+            else:
+                self._writable(collection)[key] = record
+        for field, value in changed.items():
+            setattr(record, field, value)
+        return Change(collection, key, changed)
+
+    def snapshot(self) -> GameSnapshot:
+        """The current state, frozen. Costs a lock held for a few instructions, whatever the state's size."""
+        with self._lock:
+            self._generation += 1
+            return GameSnapshot(self.version, self._game,
+                                {collection: MappingProxyType(table) for collection, table in self._tables.items()})
+
+    # Live reads, for the thread handling the events; other threads should read snapshots
+
+    @property
+    def game(self) -> Record:
+        return self._game
+
+    def __getitem__(self, collection: str) -> Mapping[Any, Record]:
+        return MappingProxyType(self._tables[collection])
@@ -0,0 +1,163 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from ProLeak import EventRegistry, LatencyHistogram
+
+DEFAULT_METRICS_PORT = 9469
+
+# Histogram bounds as Prometheus "le" labels, +Inf last
+_LE = [repr(bound) for bound in LatencyHistogram.BOUNDS] + ["+Inf"]
+
+
+def _label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    return "{" + ",".join(f'{key}="{_label(value)}"' for key, value in labels.items()) + "}" if labels else ""
+
+
+def _histogram(lines: List[str], metric: str, labels: Dict[str, Any], histogram: Dict[str, Any]):
+    for le, count in zip(_LE, histogram["buckets"]):
+        lines.append(f"{metric}_bucket{_labels(dict(labels, le=le))} {count}")
+    lines.append(f"{metric}_sum{_labels(labels)} {histogram['sum']}")
+    lines.append(f"{metric}_count{_labels(labels)} {histogram['count']}")
+
+
+def prometheus_text(stats: Dict[str, Any]) -> str:
+    """Render ``stats(buckets=True)`` in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP proleak_{name} {help_text}")
+        lines.append(f"# TYPE proleak_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"proleak_{name}{_labels(labels)} {value}")
+
+    metric("uptime_seconds", "gauge", "Seconds since the client connected.", [({}, stats["uptime"])])
+    metric("bytes_received_total", "counter", "Bytes read from the engine.", [({}, stats["bytes_received"])])
+    metric("frames_received_total", "counter", "Frames read from the engine.", [({}, stats["frames_received"])])
+    metric("events_received_total", "counter", "Events read from the engine, by name.",
+           [({"event": name}, count) for name, count in sorted(stats["events_received"].items())])
+    metric("events_ignored_total", "counter", "Events nobody listened to.", [({}, stats["events_ignored"])])
+    metric("late_interceptions_total", "counter", "Interceptions answered with the fallback after a deadline.",
+           [({}, stats["late_interceptions"])])
+    cache = stats["decision_cache"]
+    metric("decision_cache_hits_total", "counter", "Interceptions answered from the decision cache.",
+           [({}, cache["hits"])])
+    metric("decision_cache_misses_total", "counter", "Pure interceptor chains run for lack of a cached decision.",
+           [({}, cache["misses"])])
+    metric("decision_cache_entries", "gauge", "Decisions in the decision cache.", [({}, cache["size"])])
+    metric("flow_suppressed_total", "counter", "Events dropped or coalesced by the client's flow policies.",
+           [({"event": event}, flow["suppressed"]) for event, flow in stats["flow"].items()])
+    buffer = stats["reader_buffer"]
+    metric("reader_buffer_bytes", "gauge", "Bytes waiting in the reader buffer.", [({}, buffer["buffered"])])
+    metric("reader_buffer_capacity_bytes", "gauge", "Size of the reader buffer.", [({}, buffer["capacity"])])
+    if "writer" in stats:
+        metric("writer_pending", "gauge", "Commands or bytes waiting to be written.",
+               [({}, stats["writer"]["pending"])])
+    if "dispatch_queue" in stats:
+        queue = stats["dispatch_queue"]
+        metric("dispatch_queue_depth", "gauge", "Events waiting for a handler worker.", [({}, queue["depth"])])
+        metric("events_dropped_total", "counter", "Events dropped by the dispatch queue overflow policy.",
+               [({}, queue["dropped"])])
+
+    lines.append("# HELP proleak_handler_seconds Time spent in each handler.")
+    lines.append("# TYPE proleak_handler_seconds histogram")
+    for histogram in stats["handlers"]:
+        _histogram(lines, "proleak_handler_seconds",
+                   {"event": histogram["event"], "callable": histogram["callable"]}, histogram)
+    lines.append("# HELP proleak_interceptor_seconds Time spent in each interceptor.")
+    lines.append("# TYPE proleak_interceptor_seconds histogram")
+    for histogram in stats["interceptors"]:
+        _histogram(lines, "proleak_interceptor_seconds",
+                   {"event": histogram["event"], "callable": histogram["callable"]}, histogram)
+    lines.append("# HELP proleak_interception_seconds Time from reading a prefix event to answering it.")
+    lines.append("# TYPE proleak_interception_seconds histogram")
+    for event_name, stages in sorted(stats["interceptions"].items()):
+        for stage, histogram in sorted(stages.items()):
+            _histogram(lines, "proleak_interception_seconds", {"event": event_name, "stage": stage}, histogram)
+
+    if "profiler" in stats:
+        metric("budget_overruns_total", "counter", "Handler and interceptor calls over the profiler budget.",
+               [({"callable": name}, count) for name, count in sorted(stats["profiler"]["overruns"].items())])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Serves a client's :meth:`~ProLeak.EventRegistry.stats` over HTTP on a local port.
+
+    ``/metrics`` answers in the Prometheus text format, ``/stats`` in JSON. Binds to
+    localhost by default: the stats name the mod's callables and events.
+    """
+
+    def __init__(self, client: EventRegistry, host: str = '127.0.0.1', port: int = DEFAULT_METRICS_PORT):
+        self.client = client
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == "/metrics":
+                    body = prometheus_text(exporter.client.stats(buckets=True)).encode('utf-8')
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/stats":
+                    body = json.dumps(exporter.client.stats()).encode('utf-8')
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the console
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ProLeakMetrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
@@ -17,59 +17,2030 @@
 #
 
 import socket
+import struct
+import sys
 import threading
 import time
-from typing import Callable, Dict, Any, List, Union, Optional
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Any, Iterable, List, NamedTuple, Tuple, Union, Optional
+import heapq
 import inspect
+import itertools
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FRAME_DELIMITER = b"---\n"
+DEFAULT_READ_SIZE = 65536
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_COALESCE = "coalesce"
+
+# Answer to a prefix event whose interceptor chain failed or overran interceptor_deadline
+FALLBACK_PASS = "pass"  # The event goes on with the params it came with
+FALLBACK_BLOCK = "block"
+
+PROTOCOL_TEXT = "text"
+PROTOCOL_AUTO = "auto"  # Offer the binary protocol, keep text if the engine does not answer
+BINARY_PROTOCOL = "binary/1"
+BINARY_SWITCH_EVENT = "__binary"  # Last text frame sent by the engine before it switches to binary
+FLOW_EVENT = "__flow"  # Sent by engines enforcing flow policies, listing the events they enforce them for
+
+# Binary frames: magic byte, kind, big-endian body length, body
+BINARY_MAGIC = 0xB1
+FRAME_EVENT = 1
+FRAME_PREFIX_EVENT = 2
+FRAME_COMMAND = 3
+FRAME_INTERCEPTION_RESULT = 4
+BINARY_HEADER = struct.Struct(">BBI")
+_BINARY_START_BYTES = bytes([BINARY_MAGIC])
+_BINARY_START = _BINARY_START_BYTES.decode('utf-8', 'surrogateescape')
+_command_decoder = json.JSONDecoder()
+
+
 class ProLeakConnectionError(Exception):
     """Exception raised when ProLeak fails to connect to the C# engine."""
     pass
 
-class ProLeak:
-    def __init__(self, host='localhost', port=69420, connection_timeout=5):
+
+class ProLeakProtocolError(Exception):
+    """Exception raised when the engine sends something the client cannot decode."""
+    pass
+
+
+JSON_BACKEND = "json"
+json_loads = json.loads
+json_dumps = json.dumps
+
+
+def use_json_backend(name: Optional[str] = None) -> str:
+    """Select the JSON library of the text protocol: ``orjson``, ``ujson`` or ``json``.
+
+    Without a name, the fastest installed one is used. Returns the selected name.
+    """
+    global JSON_BACKEND, json_loads, json_dumps
+    if name is None:
+        name = "orjson" if orjson else "ujson" if ujson else "json"
+    if name == "orjson" and orjson:
+        json_loads, json_dumps = orjson.loads, lambda obj: orjson.dumps(obj).decode('utf-8')
+    elif name == "ujson" and ujson:
+        json_loads, json_dumps = ujson.loads, ujson.dumps
+    elif name == "json":
+        json_loads, json_dumps = json.loads, json.dumps
+    else:
+        raise ValueError(f"JSON backend {name!r} is not installed")
+    JSON_BACKEND = name
+    return name
+
+
+use_json_backend()
+
+
+class Codec(ABC):
+    """Serializes the parameters carried by binary frames.
+
+    Subclasses set ``name``, announced in ``HELLO``, and implement both methods.
+    """
+    name = ""
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data) -> Any:
+        ...
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def encode(self, obj):
+        return json_dumps(obj).encode('utf-8')
+
+    def decode(self, data):
+        return json_loads(bytes(data))
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack codec needs the msgpack package")
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+def available_codecs() -> List[Codec]:
+    """Codecs this client can offer, most compact first."""
+    return ([MsgpackCodec()] if msgpack else []) + [JsonCodec()]
+
+
+class LazyParams(MutableMapping):
+    """Event parameters left encoded until a handler first looks at them.
+
+    Decoding happens once, on the first access, with the codec of the connection.
+    ``to_dict()`` gives a plain dict, e.g. for ``json.dumps``.
+    """
+    __slots__ = ('_raw', '_loads', '_data')
+
+    def __init__(self, raw, loads: Optional[Callable[[Any], Any]] = None):
+        self._raw = raw
+        self._loads = loads
+        self._data: Optional[Dict[str, Any]] = None
+
+    @property
+    def decoded(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = self._data
+        if data is None:
+            data = self._data = (self._loads or json_loads)(self._raw)
+            data.pop('__is_prefix', None)
+            self._raw = None
+        return data
+
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+    def __contains__(self, key):
+        return key in self.to_dict()
+
+    def __setitem__(self, key, value):
+        self.to_dict()[key] = value
+
+    def __delitem__(self, key):
+        del self.to_dict()[key]
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return repr(self.to_dict()) if self.decoded else f"LazyParams(<{len(self._raw)} bytes>)"
+
+
+def binary_frame(kind: int, body: bytes) -> bytes:
+    return BINARY_HEADER.pack(BINARY_MAGIC, kind, len(body)) + body
+
+
+def binary_event_body(event_name: str, params: bytes) -> bytes:
+    """Body of an event frame: length-prefixed name, then the encoded parameters."""
+    name = event_name.encode('utf-8')
+    return len(name).to_bytes(2, 'big') + name + params
+
+
+def split_binary_event(body) -> Tuple[str, Any]:
+    """Event name and still encoded parameters of an event frame body."""
+    size = int.from_bytes(body[:2], 'big')
+    return str(body[2:2 + size], 'utf-8'), body[2 + size:]
+
+
+class FrameDecoder:
+    """Incremental splitter for the ``---\\n`` delimited frames sent by the engine.
+
+    Bytes are received straight into a reusable ``bytearray``, the delimiter scan
+    resumes where the previous one stopped, and each frame is decoded from UTF-8
+    exactly once, so multi-byte characters split across reads are never mangled.
+    """
+
+    def __init__(self, read_size: int = DEFAULT_READ_SIZE, delimiter: bytes = FRAME_DELIMITER):
+        if read_size <= 0:
+            raise ValueError("read_size must be positive")
+        self.read_size = read_size
+        self.delimiter = delimiter
+        self._buffer = bytearray(read_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # First byte of the current (incomplete) frame
+        self._scan = 0   # Where the next delimiter search resumes
+        self._end = 0    # One past the last received byte
+        # Frame prefix announcing that what follows is no longer delimited text
+        self.switch_marker: Optional[bytes] = None
+        self.switched = False
+
+    @property
+    def buffered(self) -> int:
+        """Number of received bytes not yet returned as a frame."""
+        return self._end - self._start
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buffer)
+
+    def _reserve(self, size: int):
+        if len(self._buffer) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if self._start and len(self._buffer) - pending >= size:
+            # Compact in place: move the partial frame to the front
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            self._view.release()
+            grown = bytearray(max(len(self._buffer) * 2, pending + size))
+            grown[:pending] = self._buffer[self._start:self._end]
+            self._buffer = grown
+            self._view = memoryview(self._buffer)
+        self._scan -= self._start
+        self._start = 0
+        self._end = pending
+
+    def recv_from(self, sock) -> int:
+        """Read up to ``read_size`` bytes from ``sock``. Returns 0 on EOF."""
+        self._reserve(self.read_size)
+        received = sock.recv_into(self._view[self._end:self._end + self.read_size])
+        self._end += received
+        return received
+
+    def feed(self, data):
+        """Append already received bytes, e.g. from a stream or a capture."""
+        size = len(data)
+        self._reserve(size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def frames(self) -> List[str]:
+        """Return every complete frame currently buffered, as decoded text."""
+        buffer, view, delimiter = self._buffer, self._view, self.delimiter
+        step = len(delimiter)
+        start, end = self._start, self._end
+        find = buffer.find
+        marker = self.switch_marker
+        frames = []
+        index = find(delimiter, self._scan, end)
+        while index >= 0:
+            frames.append(str(view[start:index], 'utf-8'))
+            if marker is not None and buffer.startswith(marker, start, index):
+                # Stop right there, the rest of the buffer belongs to another protocol
+                self.switched = True
+                start = index + step
+                break
+            start = index + step
+            index = find(delimiter, start, end)
+        if start == end:
+            self._start = self._scan = self._end = 0
+        else:
+            # Keep a tail in case the delimiter itself was split across reads
+            self._start = start
+            self._scan = max(start, end - step + 1)
+        return frames
+
+
+class LatencyHistogram:
+    """Log2-bucketed latency histogram, cheap enough to update on every event.
+
+    Durations are in seconds; buckets go from 1 µs to about 16 s, doubling each time.
+    """
+    BOUNDS = tuple(2 ** i / 1e6 for i in range(25))
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the given percentile (0 when empty)."""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return self.max
+
+    def as_dict(self, buckets: bool = False) -> Dict[str, Any]:
+        summary = {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+        if buckets:
+            # Cumulative counts for each of BOUNDS, then +Inf, the way Prometheus wants them
+            summary["sum"] = self.total
+            summary["buckets"] = [sum(self.counts[:index + 1]) for index in range(len(self.counts))]
+        return summary
+
+
+class HandlerProfiler:
+    """Flags handlers and interceptors running longer than ``budget`` seconds.
+
+    Callables report when they start and finish; a sampling thread looks at the
+    ones over budget every ``interval`` seconds and records which line of code
+    they are stuck on, so slow mod code shows up without attaching a debugger.
+    """
+
+    def __init__(self, budget: float = 0.004, interval: float = 0.001):
+        self.budget = budget
+        self.interval = interval
+        self.overruns: Dict[str, int] = {}  # Callable name -> calls over budget
+        self.samples: Dict[str, Dict[str, int]] = {}  # Callable name -> "file:line in function" -> samples
+        self._running: Dict[int, Tuple[str, float]] = {}  # Thread id -> (callable name, started)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not self._thread:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._sample, name="ProLeakProfiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def enter(self, name: str, started: float):
+        self._running[threading.get_ident()] = (name, started)
+
+    def exit(self, name: str, elapsed: float):
+        self._running.pop(threading.get_ident(), None)
+        if elapsed > self.budget:
+            overruns = self.overruns.get(name, 0)
+            if not overruns:
+                print(f"{name} took {elapsed * 1000:.1f} ms, over the {self.budget * 1000:.1f} ms budget")
+            self.overruns[name] = overruns + 1
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            running = [(ident, name) for ident, (name, started) in list(self._running.items())
+                       if now - started > self.budget]
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for ident, name in running:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                location = f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+                samples = self.samples.setdefault(name, {})
+                samples[location] = samples.get(location, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "overruns": dict(self.overruns),
+            "hotspots": {name: sorted(samples.items(), key=lambda item: -item[1])[:10]
+                         for name, samples in list(self.samples.items())},
+        }
+
+
+def _qualname(func: Callable) -> str:
+    return getattr(func, '__qualname__', None) or repr(func)
+
+
+class BinaryFrameDecoder(FrameDecoder):
+    """Incremental decoder for the length-prefixed frames of the binary protocol."""
+
+    def __init__(self, read_size: int = DEFAULT_READ_SIZE):
+        super().__init__(read_size)
+
+    @classmethod
+    def resume(cls, decoder: FrameDecoder) -> 'BinaryFrameDecoder':
+        """Take over the bytes a text decoder received after the protocol switch."""
+        binary = cls(decoder.read_size)
+        binary.feed(decoder._view[decoder._start:decoder._end])
+        return binary
+
+    def frames(self) -> List[Tuple[int, bytes]]:
+        """Return every complete ``(kind, body)`` frame currently buffered."""
+        buffer, view = self._buffer, self._view
+        header = BINARY_HEADER.size
+        start, end = self._start, self._end
+        frames = []
+        while end - start >= header:
+            magic, kind, size = BINARY_HEADER.unpack_from(buffer, start)
+            if magic != BINARY_MAGIC:
+                raise ProLeakProtocolError(f"Bad binary frame magic: {magic:#x}")
+            if end - start - header < size:
+                break
+            frames.append((kind, bytes(view[start + header:start + header + size])))
+            start += header + size
+        if start == end:
+            self._start = self._scan = self._end = 0
+        else:
+            self._start = self._scan = start
+        return frames
+
+
+def _arity(func: Callable) -> int:
+    """Number of positional arguments a handler or interceptor accepts."""
+    try:
+        params = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return 3  # Builtins and C callables: assume they take everything
+    positional = 0
+    for param in params:
+        if param.kind == param.VAR_POSITIONAL:
+            return 3
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            positional += 1
+    return positional
+
+
+def _compile(func: Callable) -> Callable[[str, Dict[str, Any], Callable[[], None]], Any]:
+    """Wrap a user callable into a uniform ``(event, params, stop)`` adapter, inspecting it only once."""
+    arity = _arity(func)
+    if arity == 2:
+        return lambda event_name, event_params, stop: func(event_name, event_params)
+    if arity >= 3:
+        return func
+    raise TypeError(f"{getattr(func, '__qualname__', func)!r} must accept (event, params) or (event, params, stop)")
+
+
+_FALLBACK = object()  # An interceptor chain failed or overran: answer with the fallback
+
+
+def _no_stop():
+    pass  # Interceptors get a stop function that does nothing
+
+
+def _fallback_params(fallback: str, raw_params, params: Optional[Dict[str, Any]],
+                     loads: Optional[Callable[[Any], Any]] = None) -> Optional[Dict[str, Any]]:
+    """Answer for an interceptor chain that failed or overran its deadline.
+
+    A pass-through resends the params as the engine sent them: decoded again from
+    ``raw_params``, or ``params``, a copy taken before the chain ran, for events
+    without a raw form (params merged from extra lines, events dispatched by hand).
+    """
+    if fallback == FALLBACK_BLOCK:
+        return None
+    if raw_params is None:
+        return params
+    params = (loads or json_loads)(raw_params)
+    params.pop('__is_prefix', None)
+    return params
+
+
+def _wire_value(value: Any) -> str:
+    # The text protocol carries strings only; anything else goes as JSON so lists survive the trip
+    return value if isinstance(value, str) else json_dumps(value)
+
+
+def _interception_result(event_name: str, params: Optional[Dict[str, Any]]) -> str:
+    """Build the ``INTERCEPTION_RESULT`` command; ``None`` params block the event."""
+    wrapped_params = None if params is None else {
+        "entries": [{"key": k, "value": _wire_value(v)} for k, v in params.items()]
+    }
+    response = json_dumps({
+        "event": event_name,
+        "params": wrapped_params
+    })
+    return f"INTERCEPTION_RESULT:{response}"
+
+
+def _binary_interception_result(codec: Codec, event_name: str, params: Optional[Dict[str, Any]]) -> bytes:
+    """Binary ``INTERCEPTION_RESULT`` frame, with typed values."""
+    return binary_frame(FRAME_INTERCEPTION_RESULT, codec.encode({"event": event_name, "params": params}))
+
+
+def _hello(codecs: List[Codec]) -> str:
+    return f"HELLO:{json.dumps({'protocols': [BINARY_PROTOCOL], 'codecs': [c.name for c in codecs]})}"
+
+
+def _accept_protocol(frame: str, codecs: List[Codec]) -> Codec:
+    """Codec chosen by the engine in its protocol switch frame."""
+    answer = json.loads(frame.strip().split('\n')[1])
+    for codec in codecs:
+        if codec.name == answer.get("codec"):
+            return codec
+    raise ProLeakProtocolError(f"Engine switched to an unknown codec: {answer!r}")
+
+
+def parse_commands(buffer: str):
+    """Split the unframed command stream sent by a client, as the engine does.
+
+    Returns the parsed ``(command, payload)`` pairs and the unparsed remainder.
+    Commands with a payload are ``NAME:{json}``, the JSON object marking the end.
+    Parsing stops at the first binary frame.
+    """
+    commands = []
+    while buffer and not buffer.startswith(_BINARY_START):
+        if buffer.startswith("START") and not buffer.startswith("START:"):
+            commands.append(("START", None))
+            buffer = buffer[5:]
+        elif buffer.startswith("STOP"):
+            commands.append(("STOP", None))
+            buffer = buffer[4:]
+        else:
+            name, sep, rest = buffer.partition(':')
+            if not sep:
+                break
+            try:
+                payload, end = _command_decoder.raw_decode(rest)
+            except ValueError:
+                break  # Incomplete JSON, wait for more bytes
+            commands.append((name, payload))
+            buffer = rest[end:]
+    return commands, buffer
+
+
+def parse_binary_commands(buffer: bytes):
+    """Split binary ``(kind, body)`` frames off ``buffer``; returns them and the remainder."""
+    frames = []
+    header = BINARY_HEADER.size
+    while len(buffer) >= header and buffer[0] == BINARY_MAGIC:
+        _, kind, size = BINARY_HEADER.unpack_from(buffer)
+        if len(buffer) - header < size:
+            break
+        frames.append((kind, buffer[header:header + size]))
+        buffer = buffer[header + size:]
+    return frames, buffer
+
+
+def split_commands(buffer: bytes):
+    """Split what a client sent, text commands first and then binary frames.
+
+    Returns ``(None, (command, payload))`` for text commands and ``(kind, body)``
+    for binary frames, along with the incomplete remainder.
+    """
+    items = []
+    if buffer[:1] != _BINARY_START_BYTES:
+        # surrogateescape keeps a following binary frame, or a split character, byte for byte
+        commands, rest = parse_commands(buffer.decode('utf-8', 'surrogateescape'))
+        items.extend((None, command) for command in commands)
+        buffer = rest.encode('utf-8', 'surrogateescape')
+    if buffer[:1] == _BINARY_START_BYTES:
+        frames, buffer = parse_binary_commands(buffer)
+        items.extend(frames)
+    return items, buffer
+
+
+class CompiledInterceptor(NamedTuple):
+    call: Callable[[str, Dict[str, Any], Callable[[], None]], Any]
+    name: str
+    deadline: Optional[float]  # Seconds, None for no deadline of its own
+    pure: bool = False  # Its decisions only depend on the event and its params, see pure()
+
+
+def pure(func: Callable) -> Callable:
+    """Mark an interceptor as a pure function of ``(event, params)``.
+
+    When every interceptor of a chain is pure, the client remembers the chain's
+    decisions in its ``decision_cache`` and answers repeated events from there.
+    """
+    func.__proleak_pure__ = True
+    return func
+
+
+class CompiledHandler(NamedTuple):
+    call: Callable[[str, Dict[str, Any], Callable[[], None]], Any]
+    name: str
+
+
+class Prefix(NamedTuple):
+    """Match criterion for a string param starting with ``value``, e.g. ``DeclaringType=Prefix("Lisk.Game.")``."""
+    value: str
+
+
+_MISSING = object()
+
+
+def _criteria(match: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """Normalize ``register_*`` match keywords: a value, a :class:`Prefix`, or a collection of values."""
+    criteria = []
+    for name, expected in match.items():
+        if isinstance(expected, (list, tuple, set, frozenset)) and not isinstance(expected, Prefix):
+            expected = frozenset(expected)
+        criteria.append((name, expected))
+    return tuple(criteria)
+
+
+def _matches(criteria: Tuple[Tuple[str, Any], ...], params) -> bool:
+    for name, expected in criteria:
+        value = params.get(name, _MISSING)
+        if isinstance(expected, Prefix):
+            if not (isinstance(value, str) and value.startswith(expected.value)):
+                return False
+        elif isinstance(expected, frozenset):
+            try:
+                if value not in expected:
+                    return False
+            except TypeError:  # Unhashable param, e.g. a list
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _criteria_json(criteria: Tuple[Tuple[str, Any], ...]) -> Dict[str, Any]:
+    return {name: {"prefix": expected.value} if isinstance(expected, Prefix)
+            else sorted(expected, key=str) if isinstance(expected, frozenset) else expected
+            for name, expected in criteria}
+
+
+def criteria_from_json(match: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """Criteria of a ``filters`` entry sent in a subscription, the inverse of ``_criteria_json``."""
+    return _criteria({name: Prefix(expected["prefix"]) if isinstance(expected, dict) else expected
+                      for name, expected in match.items()})
+
+
+class _RouteEntry(NamedTuple):
+    order: int  # Registration order, which chains keep
+    callable: Any  # CompiledInterceptor, CompiledHandler or a process handler
+    criteria: Tuple[Tuple[str, Any], ...]  # Left to check once found through an index
+
+
+class Route:
+    """Callables registered for one event, indexed on the param values they match.
+
+    Callables registered with match criteria are found with one dict lookup per
+    indexed param name, so ``select`` costs the same with 2 or 200 of them.
+    Only criteria without an exact value (a lone :class:`Prefix`) are checked one by one.
+    """
+    __slots__ = ('always', 'indexes', 'filtered', 'unconditional')
+
+    def __init__(self, entries: List[Tuple[int, Any, Tuple[Tuple[str, Any], ...]]]):
+        always, filtered = [], []
+        indexes: Dict[str, Dict[Any, List[_RouteEntry]]] = {}
+        for order, func, criteria in entries:
+            # Index on the first exact criterion, check the others after the lookup
+            exact = next((i for i, (_, expected) in enumerate(criteria) if not isinstance(expected, Prefix)), None)
+            if not criteria:
+                always.append(_RouteEntry(order, func, ()))
+            elif exact is None:
+                filtered.append(_RouteEntry(order, func, criteria))
+            else:
+                name, expected = criteria[exact]
+                entry = _RouteEntry(order, func, criteria[:exact] + criteria[exact + 1:])
+                index = indexes.setdefault(name, {})
+                for value in (expected if isinstance(expected, frozenset) else (expected,)):
+                    index.setdefault(value, []).append(entry)
+        self.always = tuple(always)
+        self.indexes = tuple((name, {value: tuple(found) for value, found in index.items()})
+                             for name, index in indexes.items())
+        self.filtered = tuple(filtered)
+        self.unconditional = tuple(entry.callable for entry in always)
+
+    @property
+    def conditional(self) -> bool:
+        return bool(self.indexes or self.filtered)
+
+    def select(self, params) -> tuple:
+        """Callables matching ``params``, in registration order."""
+        if not self.indexes and not self.filtered:
+            return self.unconditional
+        found = []
+        for name, index in self.indexes:
+            try:
+                entries = index.get(params.get(name, _MISSING))
+            except TypeError:  # Unhashable param, e.g. a list
+                entries = None
+            if entries:
+                found.extend(entry for entry in entries if not entry.criteria or _matches(entry.criteria, params))
+        found.extend(entry for entry in self.filtered if _matches(entry.criteria, params))
+        if not found:
+            return self.unconditional
+        if len(found) > 1 or self.always:
+            found = sorted(found + list(self.always))
+        return tuple(entry.callable for entry in found)
+
+
+RULE_BLOCK = "block"  # Block the event, like an interceptor returning None
+RULE_SET = "set"  # Overwrite some params and let the event go on
+RULE_PASS = "pass"  # Let the event go on untouched, skipping the interceptors
+RULE_ACTIONS = (RULE_BLOCK, RULE_SET, RULE_PASS)
+
+
+def _set_param(params: Dict[str, Any], path: str, value: Any):
+    """Set ``path``, dots reaching into nested params: ``"Arguments.0"`` is ``params["Arguments"][0]``.
+
+    Nested containers on the way are copied, so only ``params`` itself is modified.
+    """
+    *parents, last = path.split(".")
+    target = params
+    for key in parents:
+        index = int(key) if isinstance(target, list) else key
+        child = target[index]
+        target[index] = child = list(child) if isinstance(child, list) else dict(child)
+        target = child
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = value
+
+
+class Rule(NamedTuple):
+    """A decision taken for matching prefix events without running any Python.
+
+    Rules are pushed to the engine with the subscription, which applies the first
+    matching one itself. Clients apply them too, for engines or hubs that don't.
+    """
+    event: str
+    action: str  # One of RULE_ACTIONS
+    match: Tuple[Tuple[str, Any], ...] = ()  # As built by _criteria
+    values: Optional[Dict[str, Any]] = None  # Param path -> value, for RULE_SET
+
+    def apply(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The params this rule sends the event on with, None when it blocks it."""
+        if self.action == RULE_BLOCK:
+            return None
+        if self.action == RULE_SET:
+            params = dict(params)
+            for path, value in self.values.items():
+                try:
+                    _set_param(params, path, value)
+                except (LookupError, TypeError, ValueError):
+                    pass  # Like the engine, leave params the rule's paths don't fit alone
+        return params
+
+    def to_json(self) -> Dict[str, Any]:
+        rule = {"event": self.event, "action": self.action, "match": _criteria_json(self.match)}
+        if self.values:
+            rule["values"] = self.values
+        return rule
+
+    @classmethod
+    def from_json(cls, rule: Dict[str, Any]) -> "Rule":
+        return cls(rule["event"], rule["action"], criteria_from_json(rule.get("match", {})), rule.get("values"))
+
+
+class DispatchTable(NamedTuple):
+    """Immutable snapshot of the registered callables, as ready-to-call adapters.
+
+    The reader thread only ever reads ``ProLeak._dispatch``; registration builds a
+    new table and swaps it in, so no lock is needed on the event path.
+    """
+    interceptors: Dict[str, Route]  # Routes of CompiledInterceptor
+    handlers: Dict[str, Route]  # Routes of CompiledHandler
+    global_handlers: Tuple[CompiledHandler, ...]
+    process_handlers: Dict[str, Route] = {}  # Routes of plain callables, run by the client's process_executor
+    filters: Dict[str, List[Dict[str, Any]]] = {}  # Events only wanted for some param values, see _subscription
+    rules: Dict[str, Route] = {}  # Routes of Rule, tried before the interceptors
+
+
+class Sample(NamedTuple):
+    """Flow policy keeping the first of every ``every`` events."""
+    every: int
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"sample": self.every}
+
+
+class Throttle(NamedTuple):
+    """Flow policy letting through at most ``per_second`` events a second, dropping the others."""
+    per_second: float
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"throttle": self.per_second}
+
+
+class Coalesce(NamedTuple):
+    """Flow policy delivering only the latest event of a ``window`` (seconds), per value of the ``key`` param."""
+    window: float
+    key: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"coalesce": self.window, "key": self.key}
+
+
+class _Flow:
+    """Client side state of an event's flow policy. Prefix events are never held back."""
+
+    def __init__(self, policy: Union[Sample, Throttle, Coalesce]):
+        if not isinstance(policy, (Sample, Throttle, Coalesce)):
+            raise ValueError(f"Unknown flow policy: {policy!r}")
+        if policy[0] is None or policy[0] <= 0:
+            raise ValueError(f"Flow policy {policy!r} would let nothing through")
+        self.policy = policy
+        self.engine = False  # The engine enforces the policy, everything received passes
+        self.suppressed = 0
+        self._seen = 0
+        self._tokens = max(policy.per_second, 1.0) if isinstance(policy, Throttle) else 0.0
+        self._stamp = time.perf_counter()
+        self._held: Dict[Any, tuple] = {}  # Key -> latest event of the open window
+        self._lock = threading.Lock()
+
+    @property
+    def window(self) -> Optional[float]:
+        return self.policy.window if isinstance(self.policy, Coalesce) and not self.engine else None
+
+    def admit(self, now: float) -> bool:
+        """Whether a non prefix event received at ``now`` goes on, for sampling and throttling."""
+        policy = self.policy
+        if self.engine or isinstance(policy, Coalesce):
+            return True
+        if isinstance(policy, Sample):
+            self._seen += 1
+            if (self._seen - 1) % policy.every == 0:
+                return True
+        else:
+            # Token bucket, holding up to a second worth of events
+            self._tokens = min(max(policy.per_second, 1.0), self._tokens + (now - self._stamp) * policy.per_second)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+        self.suppressed += 1
+        return False
+
+    def key(self, event_params) -> Any:
+        key = event_params.get(self.policy.key) if self.policy.key else None
+        try:
+            hash(key)
+        except TypeError:
+            key = repr(key)
+        return key
+
+    def hold(self, key, event: tuple) -> bool:
+        """Keep ``event`` as the latest of its key's window. True when it opens a new window."""
+        with self._lock:
+            opens = key not in self._held
+            if not opens:
+                self.suppressed += 1
+            self._held[key] = event
+        return opens
+
+    def release(self, key) -> tuple:
+        with self._lock:
+            return self._held.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"policy": self.policy.to_json(), "engine": self.engine, "suppressed": self.suppressed,
+                "held": len(self._held)}
+
+
+class _Timer:
+    """Runs callbacks at their due time on one thread, for coalesced events and stream timers."""
+
+    def __init__(self):
+        self._due: List[Tuple[float, int, Callable[[], Any]]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay: float, func: Callable[[], Any]):
+        with self._condition:
+            heapq.heappush(self._due, (time.monotonic() + delay, next(self._order), func))
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="ProLeakFlowTimer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    self._condition.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                _, _, func = heapq.heappop(self._due)
+            try:
+                func()
+            except Exception as e:
+                print(f"Error in a delayed call: {e!r}")
+
+
+def _key_function(key: Union[str, Callable[[Any], Any], None]) -> Callable[[Any], Any]:
+    """Key of stream values: a param name, a callable, or None for the value itself."""
+    if key is None:
+        return lambda value: value
+    if callable(key):
+        return key
+    return lambda value: value.get(key)
+
+
+class StreamSubscription:
+    """A running stream pipeline. Its stages all run under one lock, events and timers alike."""
+
+    def __init__(self, registry: 'EventRegistry'):
+        self.registry = registry  # Whose timer the time based stages use
+        self.lock = threading.RLock()
+        self.live = True
+        self._handlers: List[Tuple['EventRegistry', Union[str, List[str]], Callable]] = []
+
+    def _register(self, registry: 'EventRegistry', events: Union[str, List[str]], emit: Callable[[Any], None],
+                  match: Dict[str, Any]):
+        def handler(event_name, event_params):
+            with self.lock:
+                if self.live:
+                    emit(event_params)
+
+        handler.__qualname__ = f"stream({events})"
+        self._handlers.append((registry, events, handler))
+        registry.register_handler(events, handler, **match)
+
+    def _later(self, delay: float, func: Callable[[], None]):
+        def fire():
+            with self.lock:
+                if self.live:
+                    func()
+
+        self.registry._call_later(delay, fire)
+
+    def cancel(self):
+        """Unregister the pipeline. Pending windows and debounced values are dropped."""
+        with self.lock:
+            self.live = False
+        for registry, events, handler in self._handlers:
+            registry.unregister_handler(events, handler)
+
+
+class Stream:
+    """Lazy pipeline of operators over the params of some events, see :meth:`EventRegistry.stream`.
+
+    Operators return new streams and nothing runs until :meth:`subscribe`, which fuses
+    the stages into nested calls: each event goes through all of them in one pass,
+    holding only the state the stages need (a fold, the last value of a key...).
+    Keys are param names or callables of the value.
+    """
+
+    def __init__(self, registry: 'EventRegistry', build: Callable[[StreamSubscription, Callable[[Any], None]], None]):
+        self._registry = registry
+        self._build = build  # Connects the sources to the function the values go to
+
+    def _then(self, stage: Callable[[StreamSubscription, Callable[[Any], None]], Callable[[Any], None]]) -> 'Stream':
+        build = self._build
+        return Stream(self._registry, lambda subscription, emit: build(subscription, stage(subscription, emit)))
+
+    def filter(self, predicate: Callable[[Any], bool]) -> 'Stream':
+        def stage(subscription, emit):
+            def push(value):
+                if predicate(value):
+                    emit(value)
+            return push
+        return self._then(stage)
+
+    def map(self, func: Callable[[Any], Any]) -> 'Stream':
+        return self._then(lambda subscription, emit: lambda value: emit(func(value)))
+
+    def reduce(self, func: Callable[[Any, Any], Any], initial: Any = _MISSING) -> 'Stream':
+        """Running fold: the accumulated value after each value."""
+        def stage(subscription, emit):
+            accumulated = initial
+
+            def push(value):
+                nonlocal accumulated
+                accumulated = value if accumulated is _MISSING else func(accumulated, value)
+                emit(accumulated)
+            return push
+        return self._then(stage)
+
+    def distinct(self, key: Union[str, Callable[[Any], Any], None] = None, ttl: Optional[float] = None) -> 'Stream':
+        """Only the first value of each key, or the first again once ``ttl`` seconds went by.
+
+        Without ``ttl`` every key seen is remembered.
+        """
+        key_of = _key_function(key)
+
+        def stage(subscription, emit):
+            seen: "OrderedDict[Any, float]" = OrderedDict()  # Key -> when it last went through, oldest first
+
+            def push(value):
+                now = time.monotonic()
+                if ttl is not None:
+                    while seen and now - next(iter(seen.values())) >= ttl:
+                        seen.popitem(last=False)
+                value_key = key_of(value)
+                if value_key not in seen:
+                    seen[value_key] = now
+                    emit(value)
+            return push
+        return self._then(stage)
+
+    def debounce(self, seconds: float, key: Union[str, Callable[[Any], Any], None] = None) -> 'Stream':
+        """The last value of a burst, once ``seconds`` went by without another one (per key, with ``key``)."""
+        key_of = _key_function(key) if key is not None else lambda value: None
+
+        def stage(subscription, emit):
+            pending: Dict[Any, list] = {}  # Key -> [quiet from, latest value]; one timer each
+
+            def fire(value_key):
+                entry = pending[value_key]
+                remaining = entry[0] - time.monotonic()
+                if remaining > 0:
+                    subscription._later(remaining, lambda: fire(value_key))
+                else:
+                    del pending[value_key]
+                    emit(entry[1])
+
+            def push(value):
+                value_key = key_of(value)
+                entry = pending.get(value_key)
+                if entry is not None:
+                    entry[0], entry[1] = time.monotonic() + seconds, value
+                    return
+                pending[value_key] = [time.monotonic() + seconds, value]
+                subscription._later(seconds, lambda: fire(value_key))
+            return push
+        return self._then(stage)
+
+    def window(self, seconds: Optional[float] = None, count: Optional[int] = None) -> 'StreamWindow':
+        """Group values in tumbling windows closing ``seconds`` after their first value, or at ``count`` values."""
+        if seconds is None and count is None:
+            raise ValueError("A window needs seconds, a count, or both")
+        if (seconds is not None and seconds <= 0) or (count is not None and count <= 0):
+            raise ValueError("Window seconds and count must be positive")
+        return StreamWindow(self, seconds, count)
+
+    def join(self, other: 'Stream', key: Union[str, Callable[[Any], Any]],
+             other_key: Union[str, Callable[[Any], Any], None] = None, within: Optional[float] = None) -> 'Stream':
+        """Pairs ``(value, other value)`` sharing a key: each value meets the latest one of the
+        other stream with the same key, if it arrived less than ``within`` seconds ago.
+
+        ``other`` may come from another client.
+        """
+        key_of, other_key_of = _key_function(key), _key_function(other_key if other_key is not None else key)
+
+        def side(own, opposite, own_key, emit, pair):
+            def push(value):
+                now = time.monotonic()
+                value_key = own_key(value)
+                own.pop(value_key, None)
+                own[value_key] = (now, value)
+                if within is not None:
+                    while own and now - next(iter(own.values()))[0] > within:
+                        own.popitem(last=False)
+                match = opposite.get(value_key)
+                if match is not None and (within is None or now - match[0] <= within):
+                    emit(pair(value, match[1]))
+            return push
+
+        def build(subscription, emit):
+            left: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()  # Key -> latest value, oldest first
+            right: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+            self._build(subscription, side(left, right, key_of, emit, lambda mine, theirs: (mine, theirs)))
+            other._build(subscription, side(right, left, other_key_of, emit, lambda mine, theirs: (theirs, mine)))
+        return Stream(self._registry, build)
+
+    def subscribe(self, sink: Callable[[Any], None]) -> StreamSubscription:
+        """Start the pipeline, handing what comes out of it to ``sink``."""
+        subscription = StreamSubscription(self._registry)
+        self._build(subscription, sink)
+        return subscription
+
+
+class StreamWindow:
+    """Windows of a stream, folded as their values arrive and emitted when they close."""
+
+    def __init__(self, stream: Stream, seconds: Optional[float], count: Optional[int]):
+        self.stream = stream
+        self._seconds = seconds
+        self._count = count
+
+    def reduce(self, func: Callable[[Any, Any], Any], initial: Any = _MISSING) -> Stream:
+        """Fold each window with ``func``, from ``initial`` (not mutated) or its first value. Empty windows emit nothing."""
+        seconds, count = self._seconds, self._count
+
+        def stage(subscription, emit):
+            accumulated, size, generation = _MISSING, 0, 0
+
+            def close(closing):
+                nonlocal accumulated, size, generation
+                if closing != generation or not size:
+                    return  # Closed by its count already
+                result = accumulated
+                accumulated, size, generation = _MISSING, 0, generation + 1
+                emit(result)
+
+            def push(value):
+                nonlocal accumulated, size
+                if not size:
+                    accumulated = initial
+                    if seconds is not None:
+                        opened = generation
+                        subscription._later(seconds, lambda: close(opened))
+                accumulated = value if accumulated is _MISSING else func(accumulated, value)
+                size += 1
+                if count is not None and size >= count:
+                    close(generation)
+            return push
+        return self.stream._then(stage)
+
+    def count(self) -> Stream:
+        return self.reduce(lambda total, value: total + 1, 0)
+
+    def sum(self, key: Union[str, Callable[[Any], Any], None] = None) -> Stream:
+        value_of = _key_function(key)
+        return self.reduce(lambda total, value: total + value_of(value), 0)
+
+
+class DecisionCache:
+    """Bounded LRU of interceptor chain decisions, keyed by event name and raw params.
+
+    Entries older than ``ttl`` seconds are missed and dropped. Registration changes
+    invalidate the entries of the events they touch.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("A decision cache needs room for at least one entry")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Tuple[str, Any]):
+        """The cached decision, or ``_MISSING``. A cached None blocks the event."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key: Tuple[str, Any], decision: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), decision)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, events: Optional[Iterable[str]] = None):
+        """Forget the decisions taken for ``events``, or all of them."""
+        with self._lock:
+            if events is None:
+                self._entries.clear()
+                return
+            events = set(events)
+            for key in [key for key in self._entries if key[0] in events]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0, "evictions": self.evictions}
+
+
+class _Shard:
+    __slots__ = ('queue', 'pending', 'condition', 'thread')
+
+    def __init__(self):
+        self.queue = deque()
+        self.pending: Dict[Any, list] = {}  # Coalescing key -> queued entry
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+
+class DispatchExecutor:
+    """Runs event handlers on worker threads so they never hold up the socket reader.
+
+    Work is sharded by key over ``workers`` threads, each draining its own queue in
+    order, so events sharing a key (the event name by default, with the connection
+    when the executor is shared by a pool's connections) keep their order.
+    ``queue_size`` bounds each shard; when it is full, ``overflow`` decides:
+
+    * ``block``: the reader waits for room (nothing is lost)
+    * ``drop-oldest``: the oldest queued event of the shard is discarded
+    * ``drop-newest``: the incoming event is discarded
+    * ``coalesce``: the incoming event replaces a queued one with the same key,
+      or the oldest one if there is none
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 1024, overflow: str = OVERFLOW_BLOCK,
+                 shard_key: Optional[Callable[[str, Dict[str, Any]], Any]] = None):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_COALESCE):
+            raise ValueError(f"Unknown overflow policy: {overflow!r}")
+        if workers <= 0 or queue_size <= 0:
+            raise ValueError("workers and queue_size must be positive")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.shard_key = shard_key
+        self.dropped = 0
+        self.accepting = False
+        self._shards = [_Shard() for _ in range(workers)]
+
+    @property
+    def depth(self) -> int:
+        """Number of queued, not yet started, events over all shards."""
+        return sum(len(shard.queue) for shard in self._shards)
+
+    def start(self):
+        self.accepting = True
+        for index, shard in enumerate(self._shards):
+            if not (shard.thread and shard.thread.is_alive()):
+                shard.thread = threading.Thread(target=self._work, args=(shard,),
+                                                name=f"ProLeakDispatch-{index}", daemon=True)
+                shard.thread.start()
+
+    def key(self, event_name: str, event_params: Dict[str, Any], source: Any = None):
+        """Shard key of an event. ``source`` is the connection it came from, when several share this executor."""
+        if self.shard_key is not None:
+            return self.shard_key(event_name, event_params)
+        return event_name if source is None else (source, event_name)
+
+    def submit(self, key, func: Callable, *args) -> bool:
+        """Queue ``func(*args)`` on the shard owning ``key``. Returns False if it was dropped."""
+        shard = self._shards[hash(key) % self.workers]
+        with shard.condition:
+            if not self.accepting:
+                return False
+            queue = shard.queue
+            if len(queue) >= self.queue_size:
+                if self.overflow == OVERFLOW_BLOCK:
+                    while len(queue) >= self.queue_size and self.accepting:
+                        shard.condition.wait()
+                    if not self.accepting:
+                        return False
+                elif self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self.overflow == OVERFLOW_COALESCE and key in shard.pending:
+                    entry = shard.pending[key]
+                    entry[1], entry[2] = func, args
+                    self.dropped += 1
+                    return True
+                else:
+                    oldest = queue.popleft()
+                    if shard.pending.get(oldest[0]) is oldest:
+                        del shard.pending[oldest[0]]
+                    self.dropped += 1
+            entry = [key, func, args]
+            queue.append(entry)
+            if self.overflow == OVERFLOW_COALESCE:
+                shard.pending[key] = entry
+            shard.condition.notify_all()
+        return True
+
+    def _work(self, shard: _Shard):
+        queue = shard.queue
+        while True:
+            with shard.condition:
+                while not queue and self.accepting:
+                    shard.condition.wait()
+                if not queue:
+                    return
+                key, func, args = entry = queue.popleft()
+                if shard.pending.get(key) is entry:
+                    del shard.pending[key]
+                shard.condition.notify_all()
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Handler error: {e!r}")
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = None):
+        """Stop accepting work, run (or discard) what is queued and stop the workers."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self._shards:
+            with shard.condition:
+                self.accepting = False
+                if not drain:
+                    self.dropped += len(shard.queue)
+                    shard.queue.clear()
+                    shard.pending.clear()
+                shard.condition.notify_all()
+        current = threading.current_thread()
+        for shard in self._shards:
+            if shard.thread and shard.thread is not current:
+                shard.thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+
+class EventRegistry:
+    """The ``register_*`` API shared by the ProLeak clients."""
+
+    def __init__(self):
+        self.interceptors: Dict[str, List[Callable[..., Optional[Dict[str, Any]]]]] = {}
+        self.event_handlers: Dict[str, List[Callable[..., None]]] = {}
+        self.global_handlers: List[Callable[..., None]] = []
+        self.process_handlers: Dict[str, List[Callable[..., None]]] = {}
+        self.process_executor = None  # ProcessDispatch.ProcessExecutor running the process handlers
+        self._registry_lock = threading.Lock()
+        self.interceptor_deadlines: Dict[Callable, float] = {}
+        # (event, callable) -> match criteria it was registered with for that event
+        self.match_criteria: Dict[Tuple[str, Callable], Tuple[Tuple[str, Any], ...]] = {}
+        self.rules: List[Rule] = []
+        self.pure_interceptors: set = set()  # Registered with pure=True
+        self.decision_cache = DecisionCache()
+        self._chain_signatures: Dict[str, Any] = {}  # Event -> what its interception depends on
+        self._adapters: Dict[Callable, Callable] = {}
+        self._dispatch = DispatchTable({}, {}, ())
+        # (event name, stage) -> histogram, stage being "decision", "send" or an interceptor name
+        self.latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+        # (event name, handler name) -> histogram
+        self.handler_latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.late_interceptions = 0
+        self.events_ignored = 0  # Dropped after reading their name, nobody listens to them
+        self.events_received: Dict[str, int] = {}
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.connected_at: Optional[float] = None
+        self.profiler: Optional[HandlerProfiler] = None
+        self.recorder = None  # EventLog.EventRecorder writing down the frames received
+        self._flows: Dict[str, _Flow] = {}  # Event -> its flow policy state, replaced as a whole on changes
+        self._timer: Optional[_Timer] = None
+        self.priority = 0  # Behind a hub, clients with a higher priority have the last word on interceptions
+
+    def _record_latency(self, event_name: str, stage: str, seconds: float):
+        histogram = self.latency.get((event_name, stage))
+        if histogram is None:
+            histogram = self.latency[(event_name, stage)] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def _record_handler(self, event_name: str, name: str, seconds: float):
+        histogram = self.handler_latency.get((event_name, name))
+        if histogram is None:
+            histogram = self.handler_latency[(event_name, name)] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def enable_profiler(self, budget: float = 0.004, interval: float = 0.001) -> HandlerProfiler:
+        """Start flagging handlers and interceptors that run longer than ``budget`` seconds."""
+        self.disable_profiler()
+        self.profiler = HandlerProfiler(budget, interval)
+        self.profiler.start()
+        return self.profiler
+
+    def disable_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler:
+            profiler.stop()
+
+    def start_recording(self, recorder):
+        """Append every frame received from now on to ``recorder``, an ``EventLog.EventRecorder``."""
+        self.stop_recording()
+        self.recorder = recorder
+        return recorder
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+
+    def stats(self, buckets: bool = False) -> Dict[str, Any]:
+        """Counters and latency histograms of the event pipeline, as plain JSON-ready data.
+
+        ``buckets`` adds the raw histogram buckets (see :meth:`LatencyHistogram.as_dict`).
+        Safe to call from any thread while events flow.
+        """
+        uptime = time.monotonic() - self.connected_at if self.connected_at else 0.0
+        interceptors, interceptions = [], {}
+        for (event_name, stage), histogram in list(self.latency.items()):
+            if stage in ("decision", "send"):
+                interceptions.setdefault(event_name, {})[stage] = histogram.as_dict(buckets)
+            else:
+                interceptors.append(dict(histogram.as_dict(buckets), event=event_name, callable=stage))
+        stats = {
+            "uptime": uptime,
+            "bytes_received": self.bytes_received,
+            "frames_received": self.frames_received,
+            "frames_per_second": self.frames_received / uptime if uptime else 0.0,
+            "events_received": dict(self.events_received),
+            "events_ignored": self.events_ignored,
+            "late_interceptions": self.late_interceptions,
+            "interceptions": interceptions,
+            "interceptors": interceptors,
+            "handlers": [dict(histogram.as_dict(buckets), event=event_name, callable=name)
+                         for (event_name, name), histogram in list(self.handler_latency.items())],
+            "decision_cache": self.decision_cache.stats(),
+            "flow": {event_name: flow.stats() for event_name, flow in self._flows.items()},
+        }
+        stats.update(self._transport_stats())
+        if self.profiler:
+            stats["profiler"] = self.profiler.report()
+        return stats
+
+    def _transport_stats(self) -> Dict[str, Any]:
+        decoder = getattr(self, 'decoder', None)
+        return {"reader_buffer": {"buffered": decoder.buffered if decoder else 0,
+                                  "capacity": decoder.capacity if decoder else 0}}
+
+    def _adapter(self, func):
+        adapter = self._adapters.get(func)
+        if adapter is None:
+            adapter = self._adapters[func] = _compile(func)
+        return adapter
+
+    def _rebuild_dispatch(self):
+        # Called with _registry_lock held. The new table is published with a single assignment
+        live = set(self.global_handlers)
+        pairs = set()
+        for registry in (self.interceptors, self.event_handlers, self.process_handlers):
+            for event, funcs in registry.items():
+                live.update(funcs)
+                pairs.update((event, func) for func in funcs)
+        self._adapters = {func: adapter for func, adapter in self._adapters.items() if func in live}
+        self.interceptor_deadlines = {func: deadline for func, deadline in self.interceptor_deadlines.items()
+                                      if func in live}
+        self.match_criteria = {pair: criteria for pair, criteria in self.match_criteria.items() if pair in pairs}
+        self.pure_interceptors &= live
+
+        def routes(registry, compiled):
+            return {event: Route([(order, compiled(f), self.match_criteria.get((event, f), ()))
+                                  for order, f in enumerate(funcs)])
+                    for event, funcs in registry.items() if funcs}
+
+        by_event: Dict[str, List[Rule]] = {}
+        for rule in self.rules:
+            by_event.setdefault(rule.event, []).append(rule)
+        rules = {event: Route([(order, rule, rule.match) for order, rule in enumerate(event_rules)])
+                 for event, event_rules in by_event.items()}
+        signatures = {event: (tuple((f, self.match_criteria.get((event, f)), self.interceptor_deadlines.get(f),
+                                     f in self.pure_interceptors) for f in self.interceptors.get(event, ())),
+                              tuple(by_event.get(event, ())))
+                      for event in set(self.interceptors) | set(by_event)}
+        changed = {event for event in set(signatures) | set(self._chain_signatures)
+                   if signatures.get(event) != self._chain_signatures.get(event)}
+        if changed:
+            self.decision_cache.invalidate(changed)
+        self._chain_signatures = signatures
+        filters = {}
+        for event in {event for event, _ in pairs}:
+            criteria = [self.match_criteria.get((event, func), ())
+                        for registry in (self.interceptors, self.event_handlers, self.process_handlers)
+                        for func in registry.get(event, ())]
+            if all(criteria):  # A single unconditional callable needs the whole event
+                filters[event] = [_criteria_json(c) for c in criteria]
+        self._dispatch = DispatchTable(
+            interceptors=routes(self.interceptors, lambda f: CompiledInterceptor(
+                self._adapter(f), _qualname(f), self.interceptor_deadlines.get(f),
+                f in self.pure_interceptors or getattr(f, '__proleak_pure__', False))),
+            handlers=routes(self.event_handlers, lambda f: CompiledHandler(self._adapter(f), _qualname(f))),
+            global_handlers=tuple(CompiledHandler(self._adapter(f), _qualname(f)) for f in self.global_handlers),
+            process_handlers=routes(self.process_handlers, lambda f: f),
+            filters=filters,
+            rules=rules,
+        )
+        self._registry_changed()
+
+    def _registry_changed(self):
+        pass  # Clients override this to push the new subscription to the engine
+
+    def _wants(self, event_name: str, dispatch: DispatchTable) -> int:
+        """0 when nobody listens to the event, 1 for handlers only, 2 when it has interceptors."""
+        if event_name in dispatch.interceptors or event_name in dispatch.rules:
+            return 2
+        return 1 if (event_name in dispatch.handlers or dispatch.global_handlers
+                     or event_name in dispatch.process_handlers) else 0
+
+    @staticmethod
+    def _decision_key(chain: tuple, event_name: str, event_params, raw_params) -> Optional[Tuple[str, Any]]:
+        """Key of the chain's decision in the decision cache, None when it can't be cached."""
+        if not all(interceptor.pure for interceptor in chain):
+            return None
+        if isinstance(raw_params, memoryview):
+            raw_params = raw_params.tobytes()
+        if isinstance(raw_params, (str, bytes)):
+            return event_name, raw_params
+        try:  # Params merged from extra lines have no raw form
+            return event_name, json.dumps(dict(event_params), sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _chain(dispatch: DispatchTable, event_name: str, event_params) -> tuple:
+        """What decides a prefix event: its first matching rule alone, or else its matching interceptors."""
+        route = dispatch.rules.get(event_name)
+        if route is not None:
+            rules = route.select(event_params)
+            if rules:
+                return rules[:1]
+        route = dispatch.interceptors.get(event_name)
+        return route.select(event_params) if route is not None else ()
+
+    def _known_decision(self, chain: tuple, event_name: str, event_params, raw_params) -> Tuple[Any, Any]:
+        """Decision taken without running any interceptor, and the chain's decision cache key.
+
+        The decision is ``_MISSING`` when the chain has to run, which the clients do their own way.
+        """
+        if not chain:
+            return event_params, None  # No interceptor matches these params, nothing to run
+        if isinstance(chain[0], Rule):
+            return chain[0].apply(event_params), None
+        key = self._decision_key(chain, event_name, event_params, raw_params)
+        return (self.decision_cache.get(key) if key is not None else _MISSING), key
+
+    def _fallback(self, raw_params, params: Optional[Dict[str, Any]]):
+        return _fallback_params(self.interceptor_fallback, raw_params, params,
+                                self.codec.decode if self.codec else None)
+
+    def _parse_event(self, event_data: List[str]) -> Optional[tuple]:
+        """The ``_dispatch_event`` arguments of a text frame, None when it is not to be dispatched now.
+
+        Events nobody listens to, dropped by their flow policy or held by a coalescing
+        one are left out, and ``FLOW_EVENT`` is handled here.
+        """
+        received = time.perf_counter()
+        event_name = event_data[0].split(': ', 1)[1]
+        if event_name == FLOW_EVENT:
+            self._flow_event(json_loads(event_data[1]))
+            return None
+        self.events_received[event_name] = self.events_received.get(event_name, 0) + 1
+        wants = self._wants(event_name, self._dispatch)
+        if not wants:
+            self.events_ignored += 1
+            return None
+        flow = self._flows.get(event_name)
+        # Checked before decoding the params, the prefix marker being in the raw JSON
+        if flow is not None and '"__is_prefix"' not in event_data[1] and not flow.admit(received):
+            return None
+        is_prefix = False
+        if wants == 2 or not self.lazy_params:
+            event_params = json_loads(event_data[1])
+            is_prefix = event_params.pop('__is_prefix', False)
+        else:
+            event_params = LazyParams(event_data[1])
+        raw_params = event_data[1]
+        if not is_prefix and len(event_data) > 2:
+            for line in event_data[2:]:
+                key, value = line.split(': ', 1)
+                event_params[key] = value
+            raw_params = None  # No longer what the params are
+        event = (event_name, event_params, is_prefix, raw_params, received)
+        if flow is not None and not is_prefix and self._coalesce(flow, event_params, event):
+            return None
+        return event
+
+    def _parse_binary_event(self, kind: int, body) -> Optional[tuple]:
+        """The ``_dispatch_event`` arguments of a binary frame, see :meth:`_parse_event`."""
+        received = time.perf_counter()
+        if kind not in (FRAME_EVENT, FRAME_PREFIX_EVENT):
+            raise ProLeakProtocolError(f"Unexpected binary frame kind: {kind}")
+        event_name, raw_params = split_binary_event(body)
+        if event_name == FLOW_EVENT:
+            self._flow_event(self.codec.decode(raw_params))
+            return None
+        self.events_received[event_name] = self.events_received.get(event_name, 0) + 1
+        wants = self._wants(event_name, self._dispatch)
+        if not wants:
+            self.events_ignored += 1
+            return None
+        is_prefix = kind == FRAME_PREFIX_EVENT
+        flow = self._flows.get(event_name)
+        if flow is not None and not is_prefix and not flow.admit(received):
+            return None
+        if wants == 2 or not self.lazy_params:
+            event_params = self.codec.decode(raw_params)
+        else:
+            event_params = LazyParams(raw_params, self.codec.decode)
+        event = (event_name, event_params, is_prefix, raw_params, received)
+        if flow is not None and not is_prefix and self._coalesce(flow, event_params, event):
+            return None
+        return event
+
+    def _subscription(self) -> Dict[str, Any]:
+        """Events the engine has to send for the callables registered right now.
+
+        ``intercepts`` lists the events this client answers, so a hub knows whose decision to wait for.
+        ``rules`` is the rule table, in the order the engine has to try it, and ``flow``
+        the flow policies the engine may enforce itself, answering with a ``FLOW_EVENT``.
+        """
+        dispatch = self._dispatch
+        subscription = {
+            "events": ["*"] if dispatch.global_handlers else sorted(set(dispatch.interceptors) | set(dispatch.handlers)
+                                                                    | set(dispatch.process_handlers)
+                                                                    | set(dispatch.rules)),
+            "intercepts": sorted(dispatch.interceptors),
+        }
+        if self.rules:
+            subscription["rules"] = [rule.to_json() for rule in self.rules]
+        if self._flows:
+            subscription["flow"] = {event: self._flows[event].policy.to_json() for event in sorted(self._flows)}
+        if dispatch.filters and not dispatch.global_handlers:
+            # Events only wanted when their params match one of these, e.g. {"Method": "SpawnUnit"}
+            subscription["filters"] = {event: dispatch.filters[event] for event in sorted(dispatch.filters)}
+        if self.priority:
+            subscription["priority"] = self.priority
+        return subscription
+
+    def _register(self, registry, events, func, deadline=None, match=None):
+        if isinstance(events, str):
+            events = [events]
+        _compile(func)  # Reject unusable signatures before touching the registry
+        criteria = _criteria(match or {})
+        with self._registry_lock:
+            if deadline is not None:
+                self.interceptor_deadlines[func] = deadline
+            for event in events:
+                registry[event] = registry.get(event, []) + [func]
+                if criteria:
+                    self.match_criteria[(event, func)] = criteria
+                else:
+                    self.match_criteria.pop((event, func), None)
+            self._rebuild_dispatch()
+
+    def _unregister(self, registry, events, func):
+        if isinstance(events, str):
+            events = [events]
+        with self._registry_lock:
+            for event in events:
+                if event in registry and func in registry[event]:
+                    funcs = list(registry[event])
+                    funcs.remove(func)
+                    registry[event] = funcs
+            self._rebuild_dispatch()
+
+    def register_interceptor(self,
+                             events: Union[str, List[str]],
+                             interceptor: Callable[..., Optional[Dict[str, Any]]],
+                             deadline: Optional[float] = None,
+                             pure: bool = False,
+                             **match):
+        """Register an interceptor. ``deadline`` (seconds) bounds this interceptor alone,
+        on top of the client's ``interceptor_deadline`` for the whole chain.
+
+        Keywords restrict it to events whose params match them all: a value, one of a
+        list of values, or a :class:`Prefix`, e.g. ``Method="SpawnUnit"``. Prefix events
+        matching no interceptor are passed through right away.
+
+        ``pure`` works as decorating it with :func:`pure`.
+        """
+        if pure:
+            with self._registry_lock:
+                self.pure_interceptors.add(interceptor)
+        self._register(self.interceptors, events, interceptor, deadline, match)
+
+    def unregister_interceptor(self,
+                               events: Union[str, List[str]],
+                               interceptor: Callable[..., Optional[Dict[str, Any]]]):
+        self._unregister(self.interceptors, events, interceptor)
+
+    def add_rule(self,
+                 event: str,
+                 action: str,
+                 values: Optional[Dict[str, Any]] = None,
+                 **match) -> Rule:
+        """Decide matching prefix events of ``event`` in the engine, without asking Python.
+
+        ``action`` is RULE_BLOCK, RULE_SET (overwriting ``values``, whose keys may reach
+        into lists: ``{"Arguments.0": 42}``) or RULE_PASS. ``match`` keywords work as for
+        :meth:`register_interceptor`. The first matching rule wins, before any interceptor.
+        """
+        if action not in RULE_ACTIONS:
+            raise ValueError(f"Unknown rule action {action!r}, expected one of {RULE_ACTIONS}")
+        if (action == RULE_SET) != bool(values):
+            raise ValueError("Values are needed by RULE_SET rules, and only by them")
+        rule = Rule(event, action, _criteria(match), dict(values) if values else None)
+        json.dumps(rule.to_json())  # Rules travel to the engine, reject what can't get there
+        with self._registry_lock:
+            self.rules = self.rules + [rule]
+            self._rebuild_dispatch()
+        return rule
+
+    def remove_rule(self, rule: Rule):
+        with self._registry_lock:
+            if rule in self.rules:
+                rules = list(self.rules)
+                rules.remove(rule)
+                self.rules = rules
+                self._rebuild_dispatch()
+
+    def register_handler(self,
+                         events: Union[str, List[str]],
+                         handler: Callable[..., None],
+                         process: bool = False,
+                         flow: Optional[Union[Sample, Throttle, Coalesce]] = None,
+                         **match):
+        """Register a handler. With ``process``, it runs in a worker of the client's
+        ``process_executor`` instead, getting the params as a plain dict.
+
+        ``flow`` sets the flow policy of the events, see :meth:`set_flow`.
+        Keywords restrict it to some param values, as for :meth:`register_interceptor`.
+        """
+        if flow is not None:
+            for event in ([events] if isinstance(events, str) else events):
+                self.set_flow(event, flow)
+        if process:
+            if self.process_executor is None:
+                raise ValueError("Process handlers need a client created with a process_executor")
+            self.process_executor.add(handler)
+            self._register(self.process_handlers, events, handler, match=match)
+        else:
+            self._register(self.event_handlers, events, handler, match=match)
+
+    def unregister_handler(self,
+                           events: Union[str, List[str]],
+                           handler: Callable[..., None]):
+        self._unregister(self.event_handlers, events, handler)
+        self._unregister(self.process_handlers, events, handler)
+
+    def set_flow(self, event: str, policy: Optional[Union[Sample, Throttle, Coalesce]]):
+        """Thin out an event that arrives faster than its consumers need, for every callable of it.
+
+        ``Sample(n)`` keeps 1 event in n, ``Throttle(n)`` at most n a second, and
+        ``Coalesce(window, key)`` only the latest per ``key`` param value of each window,
+        delivered when the window closes: :class:`ProLeak` hands it to its callables on the
+        flow timer thread, while the reader waits, and :class:`AsyncProLeak` on the event
+        loop. None removes the policy. Engines supporting it enforce the policy before
+        sending, otherwise the client does before decoding the params. Prefix events
+        always go through.
+        """
+        flow = _Flow(policy) if policy is not None else None
+        with self._registry_lock:
+            flows = dict(self._flows)
+            if flow:
+                flows[event] = flow
+            else:
+                flows.pop(event, None)
+            self._flows = flows
+            self._registry_changed()
+
+    def _flow_event(self, event_params: Dict[str, Any]):
+        # The engine's answer to the flow policies of the last subscription
+        enforced = set(event_params.get("events", ()))
+        for event_name, flow in self._flows.items():
+            flow.engine = event_name in enforced
+
+    def _coalesce(self, flow: _Flow, event_params, event: tuple) -> bool:
+        """Hold a non prefix event of a coalesced flow. False when it is to be dispatched right away."""
+        if flow.window is None:
+            return False
+        key = flow.key(event_params)
+        if flow.hold(key, event):
+            self._call_later(flow.window, lambda: self._release_held(flow, key))
+        return True
+
+    def _release_held(self, flow: _Flow, key):
+        # The latest event held for ``key`` once its window closed, on whatever runs _call_later
+        return self._dispatch_event(*flow.release(key))
+
+    def _call_later(self, delay: float, func: Callable[[], Any]):
+        if self._timer is None:
+            self._timer = _Timer()
+        self._timer.call_later(delay, func)
+
+    def stream(self, events: Union[str, List[str]], **match) -> Stream:
+        """A lazy operator pipeline over the params of ``events``, run as a handler once subscribed::
+
+            spawns = api.stream("MethodCall", Method="SpawnUnit").window(seconds=5).count()
+            spawns.subscribe(print)  # Spawns per 5 seconds
+
+        Keywords restrict it to some param values, as for :meth:`register_handler`.
+        """
+        def build(subscription, emit):
+            subscription._register(self, events, emit, match)
+        return Stream(self, build)
+
+    def register_global_handler(self, handler: Callable[..., None]):
+        _compile(handler)
+        with self._registry_lock:
+            self.global_handlers = self.global_handlers + [handler]
+            self._rebuild_dispatch()
+
+    def unregister_global_handler(self, handler: Callable[..., None]):
+        with self._registry_lock:
+            if handler in self.global_handlers:
+                handlers = list(self.global_handlers)
+                handlers.remove(handler)
+                self.global_handlers = handlers
+                self._rebuild_dispatch()
+
+
+class CommandWriter:
+    """Writes commands to the engine, batching those that pile up while a write is in flight.
+
+    Whoever finds the writer idle sends right away on its own thread, so an idle
+    connection adds no hand-off latency. Commands queued meanwhile are flushed by
+    the thread holding the writer, with one ``sendmsg`` call, and interception
+    results are always sent ahead of control commands. While corked (the reader
+    does it for a burst of frames received together), commands only queue up.
+    """
+    MAX_BATCH = 512  # Stay well under IOV_MAX
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.writes = 0    # Send syscalls
+        self.messages = 0  # Commands written
+        self._urgent: deque = deque()
+        self._normal: deque = deque()
+        self._lock = threading.Lock()
+        self._gather = hasattr(sock, 'sendmsg')
+        self._corked = False
+        self.closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._urgent) + len(self._normal)
+
+    def send(self, data: bytes, urgent: bool = False):
+        (self._urgent if urgent else self._normal).append(data)
+        if not self._corked:
+            self.flush()
+
+    def cork(self):
+        self._corked = True
+
+    def uncork(self):
+        self._corked = False
+        self.flush()
+
+    def flush(self):
+        # Loop until the queues are empty or another thread is writing: it will see our command
+        while (self._urgent or self._normal) and self._lock.acquire(blocking=False):
+            try:
+                if self.closed:
+                    self._urgent.clear()
+                    self._normal.clear()
+                    raise BrokenPipeError("The command writer is closed")
+                self._write_batch()
+            finally:
+                self._lock.release()
+
+    def close(self):
+        """Write everything queued, waiting for a write in flight on another thread, then refuse commands.
+
+        Called before closing the socket, so nothing is half written into a closed descriptor.
+        """
+        with self._lock:
+            try:
+                while self._urgent or self._normal:
+                    self._write_batch()
+            finally:
+                self.closed = True
+
+    def _write_batch(self):
+        batch = []
+        for queue in (self._urgent, self._normal):
+            while queue and len(batch) < self.MAX_BATCH:
+                batch.append(queue.popleft())
+        self.messages += len(batch)
+        if len(batch) == 1 or not self._gather:
+            self.socket.sendall(batch[0] if len(batch) == 1 else b"".join(batch))
+            self.writes += 1
+            return
+        buffers = [memoryview(data) for data in batch]
+        while buffers:
+            sent = self.socket.sendmsg(buffers)
+            self.writes += 1
+            while sent:  # Drop what went out, keep the tail of a partial write
+                if sent >= len(buffers[0]):
+                    sent -= len(buffers.pop(0))
+                else:
+                    buffers[0] = buffers[0][sent:]
+                    sent = 0
+
+
+class _BoundedInterception:
+    """Progress of an interceptor chain running under a deadline, shared with the reader."""
+    __slots__ = ('condition', 'index', 'started', 'done', 'result', 'overrun')
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.index = -1  # Interceptor currently running, -1 while still queued
+        self.started = 0.0
+        self.done = False
+        self.result = None
+        self.overrun: Optional[str] = None  # Who was running when the reader gave up
+
+
+class ProLeak(EventRegistry):
+    def __init__(self, host='localhost', port=69420, connection_timeout=5, read_size=DEFAULT_READ_SIZE,
+                 executor: Optional[DispatchExecutor] = None,
+                 interceptor_deadline: Optional[float] = None, interceptor_fallback: str = FALLBACK_PASS,
+                 interceptor_workers: int = 4, subscribe: bool = False,
+                 protocol: str = PROTOCOL_TEXT, codecs: Optional[List[Codec]] = None,
+                 lazy_params: bool = False, unix_socket: Optional[str] = None, priority: int = 0,
+                 process_executor=None):
+        super().__init__()
+        # Hand LazyParams instead of dicts to handlers, decoded only if they are read
+        self.lazy_params = lazy_params
+        self.process_executor = process_executor
+        self.unix_socket = unix_socket  # Path of a local hub's socket, instead of host and port
+        self.priority = priority
+        if interceptor_fallback not in (FALLBACK_PASS, FALLBACK_BLOCK):
+            raise ValueError(f"Unknown interceptor fallback: {interceptor_fallback!r}")
+        if protocol not in (PROTOCOL_TEXT, PROTOCOL_AUTO):
+            raise ValueError(f"Unknown protocol: {protocol!r}")
+        self.protocol = protocol
+        self.codecs = codecs or available_codecs()
+        self.codec: Optional[Codec] = None  # Set once the engine switched to the binary protocol
+        self.executor = executor
+        self.interceptor_deadline = interceptor_deadline
+        self.interceptor_fallback = interceptor_fallback
+        self.interceptor_workers = interceptor_workers
+        self._interceptor_pool: Optional[ThreadPoolExecutor] = None
+        # Ask the engine for the registered events only (needs an engine supporting SUBSCRIBE)
+        self.subscribe = subscribe
+        self._subscribed: Optional[Dict[str, List[str]]] = None
         self.thread = None
+        self.pool = None  # ProLeakPool reading this connection, instead of a thread of its own
+        self._dispatch_lock = threading.Lock()  # Held by whoever dispatches events: the reader, or the flow timer
         self.host = host
         self.port = port
         self.connection_timeout = connection_timeout
+        self.read_size = read_size
+        self.decoder: Optional[FrameDecoder] = None
+        self.writer: Optional[CommandWriter] = None
         self.running = False
         self.sharing = False
         self.socket = None
-        self.interceptors: Dict[str, List[Callable[..., Optional[Dict[str, Any]]]]] = {}
-        self.handlers: Dict[str, List[Callable[..., None]]] = {}
 
     def connect(self):
+        if not self.socket:
+            self._open()
+            self.thread = threading.Thread(target=self._read_events)
+            self.thread.start()
+
+    def _open(self):
+        """Connect and get ready to read, everything :meth:`connect` does but starting the reader."""
         if not self.socket:
             try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.settimeout(self.connection_timeout)
-                self.socket.connect((self.host, self.port))
+                if self.unix_socket:
+                    self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.socket.settimeout(self.connection_timeout)
+                    self.socket.connect(self.unix_socket)
+                else:
+                    self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    self.socket.settimeout(self.connection_timeout)
+                    self.socket.connect((self.host, self.port))
+                    self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Replies must not wait
                 self.socket.settimeout(None)  # Reset to blocking mode
+                self.writer = CommandWriter(self.socket)
                 self.running = True
-                self.thread = threading.Thread(target=self._read_events)
-                self.thread.start()
+                self.connected_at = time.monotonic()
+                self.codec = None
+                self.decoder = FrameDecoder(self.read_size)
+                if self.protocol == PROTOCOL_AUTO:
+                    # Engines without binary support ignore it and keep talking text
+                    self.decoder.switch_marker = f"Event: {BINARY_SWITCH_EVENT}\n".encode('utf-8')
+                    self._send_command(_hello(self.codecs))
+                if self.executor:
+                    self.executor.start()
+                if self.process_executor:
+                    self.process_executor.start()
             except socket.error as e:
                 self.socket = None
                 raise ProLeakConnectionError(f"Failed to connect to ProLeak Engine: {e}. Is the C# server running?")
 
     def disconnect(self):
         self.running = False
-        if self.socket:
+        sock, self.socket = self.socket, None  # The reader thread may be disconnecting too
+        if sock and self.pool is not None:
+            self.pool._detach(self)  # Out of the pool's selector before the descriptor gets reused
+        if sock:
+            if self.writer:
+                try:
+                    self.writer.close()  # STOP and interception results already queued still go out
+                except socket.error:
+                    pass  # The engine is gone, there is nobody to tell
             try:
-                self.socket.shutdown(socket.SHUT_RDWR)
+                sock.shutdown(socket.SHUT_RDWR)
             except socket.error:
                 pass  # The socket might already be closed
-            self.socket.close()
-            self.socket = None
-        if self.thread and self.thread.is_alive():
+            sock.close()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
             self.thread.join()
+        if self.pool is None:  # Otherwise the pool owns the executor and interceptor threads
+            if self.executor:
+                self.executor.shutdown(drain=True)
+            if self._interceptor_pool:
+                self._interceptor_pool.shutdown(wait=False)
+                self._interceptor_pool = None
+        if self.process_executor:
+            self.process_executor.shutdown(drain=True)
+        if self.recorder:
+            self.recorder.flush()  # The game so far is on disk, even if the client is never closed
 
     def start_leaking(self):
         if not self.socket:
             raise ProLeakConnectionError("Not connected to ProLeak Engine. Call connect() first.")
         if not self.sharing:
-            self._send_command("START")
+            if self.subscribe:
+                self._subscribed = self._subscription()
+                self._send_command(f"START:{json.dumps(self._subscribed)}")
+            else:
+                self._send_command("START")
             self.sharing = True
 
     def stop_leaking(self):
@@ -79,104 +2050,221 @@ class ProLeak:
             self._send_command("STOP")
             self.sharing = False
 
+    def _transport_stats(self):
+        stats = super()._transport_stats()
+        if self.writer:
+            stats["writer"] = {"pending": self.writer.pending, "writes": self.writer.writes,
+                               "messages": self.writer.messages}
+        if self.executor:
+            stats["dispatch_queue"] = {"depth": self.executor.depth, "dropped": self.executor.dropped}
+        if self.process_executor:
+            stats["process_pool"] = self.process_executor.stats()
+        return stats
+
+    def _registry_changed(self):
+        if self.subscribe and self.sharing and self.socket:
+            subscription = self._subscription()
+            if subscription != self._subscribed:
+                self._subscribed = subscription
+                self._send_command(f"SUBSCRIBE:{json.dumps(subscription)}")
+
     def _send_command(self, command):
+        data = command.encode('utf-8')
+        self._send_bytes(binary_frame(FRAME_COMMAND, data) if self.codec else data)
+
+    def _send_bytes(self, data, urgent=False):
         if not self.socket:
             raise ProLeakConnectionError("Not connected to ProLeak Engine. Call connect() first.")
         try:
-            self.socket.sendall(command.encode('ascii'))
+            self.writer.send(data, urgent)
         except socket.error as e:
             raise ProLeakConnectionError(f"Failed to send command to ProLeak Engine: {e}")
 
     def _read_events(self):
-        buffer = ""
         while self.running:
             try:
-                data = self.socket.recv(4096).decode('utf-8')
-                if not data:
+                if not self._read_once():
                     break
-                buffer += data
-                while "---\n" in buffer:
-                    event, buffer = buffer.split("---\n", 1)
-                    self._process_event(event.strip().split('\n'))
-            except socket.error as e:
-                print(f"Socket error: {e}")
+            except (socket.error, ProLeakProtocolError, ProLeakConnectionError) as e:
+                if self.running:  # Otherwise disconnect() closed the socket under our feet
+                    print(f"Socket error: {e}")
                 break
         self.disconnect()
 
+    def _read_once(self) -> bool:
+        """Read what the socket has and process the complete frames. False once the engine closed it."""
+        decoder, writer = self.decoder, self.writer
+        received = decoder.recv_from(self.socket)
+        if not received:
+            return False
+        self.bytes_received += received
+        if not self.codec:
+            frames = decoder.frames()
+            switch = frames.pop() if decoder.switched else None
+            self._process_frames(writer, frames, self._process_event, True)
+            if switch is None:
+                return True
+            self.codec = _accept_protocol(switch, self.codecs)
+            decoder = self.decoder = BinaryFrameDecoder.resume(decoder)
+        self._process_frames(writer, decoder.frames(), self._process_binary_event, False)
+        return True
+
+    def _process_frames(self, writer, frames, process, text):
+        self.frames_received += len(frames)
+        if self.recorder:
+            self.recorder.record(frames, text, self.codec)
+        # Replies to a burst of frames received together leave in one write
+        if len(frames) > 1:
+            writer.cork()
+        try:
+            with self._dispatch_lock:
+                for frame in frames:
+                    if text:
+                        process(frame.strip().split('\n'))
+                    else:
+                        process(*frame)
+        finally:
+            writer.uncork()
+
+    def _release_held(self, flow, key):
+        # Coalesced events leave on the flow timer thread: they wait for the reader to be between two
+        # batches of frames, so handlers never run alongside the reader's, nor out of order with them
+        with self._dispatch_lock:
+            super()._release_held(flow, key)
+
     def _process_event(self, event_data):
-        event_name = event_data[0].split(': ', 1)[1]
-        event_params = json.loads(event_data[1])
-        is_prefix = event_params.pop('__is_prefix', False)
-
-        if is_prefix and event_name in self.interceptors:
-            for interceptor in self.interceptors[event_name]:
-                result = self._execute_interceptor(interceptor, event_name, event_params)
-                if result is None:  # Intercept and block
-                    self._send_interception_result(event_name, None)
-                    return
-                elif isinstance(result, dict):  # Intercept and modify
-                    event_params = result
+        event = self._parse_event(event_data)
+        if event is not None:
+            self._dispatch_event(*event)
 
-            self._send_interception_result(event_name, event_params)
-        else:
-            for line in event_data[1:]:
-                key, value = line.split(': ', 1)
-                event_params[key] = value
+    def _process_binary_event(self, kind, body):
+        event = self._parse_binary_event(kind, body)
+        if event is not None:
+            self._dispatch_event(*event)
 
-            def stop_function():
-                self.running = False
+    def _dispatch_event(self, event_name, event_params, is_prefix, raw_params, received):
+        dispatch = self._dispatch
 
-            # Call specific event handlers
-            if event_name in self.event_handlers:
-                for handler in self.event_handlers[event_name]:
-                    self._call_handler(handler, event_name, event_params, stop_function)
+        if is_prefix and (event_name in dispatch.interceptors or event_name in dispatch.rules):
+            self._intercept(self._chain(dispatch, event_name, event_params), event_name, event_params,
+                            raw_params, received)
+        else:
+            route = dispatch.process_handlers.get(event_name)
+            process_handlers = route.select(event_params) if route else ()
+            if process_handlers:
+                self.process_executor.submit(process_handlers, event_name, event_params, raw_params, self.codec)
+            route = dispatch.handlers.get(event_name)
+            handlers = (route.select(event_params) if route else ()) + dispatch.global_handlers
+            if not handlers:
+                return
+            if self.executor:
+                pool = self.pool  # Its connections spread over the shared workers, each one in order
+                key = self.executor.key(event_name, event_params,
+                                        self if pool is not None and self.executor is pool.executor else None)
+                self.executor.submit(key, self._call_handlers, handlers, event_name, event_params)
+            else:
+                if self.writer and self.writer.pending:
+                    self.writer.flush()  # Never keep the game waiting behind inline handlers
+                self._call_handlers(handlers, event_name, event_params)
 
-            # Call global handlers
-            for handler in self.global_handlers:
-                self._call_handler(handler, event_name, event_params, stop_function)
+    def _call_handlers(self, handlers, event_name, event_params):
+        # Specific event handlers first, then global handlers
+        profiler = self.profiler
+        for handler in handlers:
+            started = time.perf_counter()
+            if profiler:
+                profiler.enter(handler.name, started)
+            try:
+                handler.call(event_name, event_params, self._stop)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record_handler(event_name, handler.name, elapsed)
+                if profiler:
+                    profiler.exit(handler.name, elapsed)
 
-    def _execute_interceptor(self, interceptor, event_name, event_params):
-        params = inspect.signature(interceptor).parameters
-        if len(params) == 2:
-            return interceptor(event_name, event_params)
-        elif len(params) == 3:
-            return interceptor(event_name, event_params, lambda: None)  # Dummy stop function
+    def _stop(self):
+        self.running = False
 
-    def _send_interception_result(self, event_name, params):
-        wrapped_params = {
-            "entries": [{"key": k, "value": str(v)} for k, v in params.items()]
-        }
-        response = json.dumps({
-            "event": event_name,
-            "params": wrapped_params
-        })
-        self._send_command(f"INTERCEPTION_RESULT:{response}")
+    def _intercept(self, chain, event_name, event_params, raw_params, received):
+        result, key = self._known_decision(chain, event_name, event_params, raw_params)
+        original = None  # What a pass-through fallback resends, for params without a raw form
+        if result is _MISSING:
+            if raw_params is None:
+                original = dict(event_params)
+            if self.interceptor_deadline is None and not any(interceptor.deadline for interceptor in chain):
+                result = self._run_interceptors(chain, event_name, event_params)
+            else:
+                result = self._run_bounded(chain, event_name, event_params, received)
+            if key is not None and result is not _FALLBACK:
+                self.decision_cache.put(key, result)
+        if result is _FALLBACK:
+            result = self._fallback(raw_params, original)
+        decided = time.perf_counter()
+        self._send_interception_result(event_name, result)
+        self._record_latency(event_name, "decision", decided - received)
+        self._record_latency(event_name, "send", time.perf_counter() - decided)
 
-    def register_interceptor(self,
-                             events: Union[str, List[str]],
-                             interceptor: Callable[..., Optional[Dict[str, Any]]]):
-        if isinstance(events, str):
-            events = [events]
-        for event in events:
-            if event not in self.interceptors:
-                self.interceptors[event] = []
-            self.interceptors[event].append(interceptor)
+    def _run_interceptors(self, chain, event_name, event_params, progress=None):
+        profiler = self.profiler
+        for index, interceptor in enumerate(chain):
+            started = time.perf_counter()
+            if progress:
+                with progress.condition:
+                    progress.index, progress.started = index, started
+                    progress.condition.notify_all()
+            if profiler:
+                profiler.enter(interceptor.name, started)
+            try:
+                result = interceptor.call(event_name, event_params, _no_stop)
+            except Exception as e:
+                print(f"Interceptor error in {interceptor.name}: {e!r}")
+                return _FALLBACK
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record_latency(event_name, interceptor.name, elapsed)
+                if profiler:
+                    profiler.exit(interceptor.name, elapsed)
+            if result is None:  # Intercept and block
+                return None
+            elif isinstance(result, dict):  # Intercept and modify
+                event_params = result
+        return event_params
 
-    def unregister_interceptor(self,
-                               events: Union[str, List[str]],
-                               interceptor: Callable[..., Optional[Dict[str, Any]]]):
-        if isinstance(events, str):
-            events = [events]
-        for event in events:
-            if event in self.interceptors and interceptor in self.interceptors[event]:
-                self.interceptors[event].remove(interceptor)
+    def _run_bounded(self, chain, event_name, event_params, received):
+        # The chain runs on a pool thread so the reader can answer the engine on time even if it hangs
+        if not self._interceptor_pool:
+            self._interceptor_pool = ThreadPoolExecutor(self.interceptor_workers, "ProLeakInterceptor")
+        progress = _BoundedInterception()
+        self._interceptor_pool.submit(self._run_chain, progress, chain, event_name, event_params)
+        chain_deadline = None if self.interceptor_deadline is None else received + self.interceptor_deadline
+        with progress.condition:
+            while not progress.done:
+                limit = chain_deadline
+                if progress.index >= 0 and chain[progress.index].deadline is not None:
+                    own_deadline = progress.started + chain[progress.index].deadline
+                    limit = own_deadline if limit is None else min(limit, own_deadline)
+                timeout = None if limit is None else limit - time.perf_counter()
+                if timeout is not None and timeout <= 0:
+                    progress.overrun = chain[progress.index].name if progress.index >= 0 else "queued"
+                    self.late_interceptions += 1
+                    return _FALLBACK
+                progress.condition.wait(timeout)
+            return progress.result
 
-    def _call_handler(self, handler, event_name, event_params, stop_function):
-        params = inspect.signature(handler).parameters
-        if len(params) == 2:
-            handler(event_name, event_params)
-        elif len(params) == 3:
-            handler(event_name, event_params, stop_function)
+    def _run_chain(self, progress, chain, event_name, event_params):
+        result = self._run_interceptors(chain, event_name, event_params, progress)
+        with progress.condition:
+            progress.result, progress.done = result, True
+            progress.condition.notify_all()
+            if progress.overrun:
+                print(f"Late interception result for {event_name} ({progress.overrun}) dropped, "
+                      f"the {self.interceptor_fallback} fallback was sent")
+
+    def _send_interception_result(self, event_name, params):
+        if self.codec:
+            self._send_bytes(_binary_interception_result(self.codec, event_name, params), urgent=True)
+        else:
+            self._send_bytes(_interception_result(event_name, params).encode('utf-8'), urgent=True)
 
     def plug(self, callback: Callable[[str, Dict[str, Any], Callable[[], None]], None]):
         def unplug():
@@ -185,7 +2273,7 @@ class ProLeak:
         try:
             self.connect()
             self.start_leaking()
-            self.handlers["__global__"] = [lambda e, p: callback(e, p, unplug)]
+            self.register_global_handler(lambda e, p: callback(e, p, unplug))
 
             while self.running:
                 time.sleep(0.1)  # Small delay to prevent CPU hogging
@@ -194,29 +2282,3 @@ class ProLeak:
         finally:
             self.stop_leaking()
             self.disconnect()
-
-    def register_handler(self,
-                         events: Union[str, List[str]],
-                         handler: Callable[..., None]):
-        if isinstance(events, str):
-            events = [events]
-        for event in events:
-            if event not in self.event_handlers:
-                self.event_handlers[event] = []
-            self.event_handlers[event].append(handler)
-
-    def unregister_handler(self,
-                           events: Union[str, List[str]],
-                           handler: Callable[..., None]):
-        if isinstance(events, str):
-            events = [events]
-        for event in events:
-            if event in self.event_handlers and handler in self.event_handlers[event]:
-                self.event_handlers[event].remove(handler)
-
-    def register_global_handler(self, handler: Callable[..., None]):
-        self.global_handlers.append(handler)
-
-    def unregister_global_handler(self, handler: Callable[..., None]):
-        if handler in self.global_handlers:
-            self.global_handlers.remove(handler)
\ No newline at end of file
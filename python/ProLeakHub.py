@@ -0,0 +1,475 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import argparse
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ProLeak import (BINARY_PROTOCOL, BINARY_SWITCH_EVENT, DEFAULT_READ_SIZE, FLOW_EVENT, FRAME_COMMAND,
+                     FRAME_EVENT, FRAME_INTERCEPTION_RESULT, FRAME_PREFIX_EVENT, PROTOCOL_AUTO, PROTOCOL_TEXT, Codec,
+                     CommandWriter, ProLeak, Route, binary_event_body, binary_frame, criteria_from_json,
+                     parse_commands, split_binary_event, split_commands)
+import ProLeak as proleak  # The JSON backend can be swapped at runtime
+
+DEFAULT_HUB_SOCKET = os.path.join(tempfile.gettempdir(), "proleak-hub.sock")
+DEFAULT_HUB_PORT = 6942  # Where Unix sockets are missing
+DEFAULT_DECISION_TIMEOUT = 0.5
+
+_CLOSED = object()
+
+
+def _text_frame(event_name: str, params: Dict[str, Any]) -> bytes:
+    return f"Event: {event_name}\n{proleak.json_dumps(params)}\n---\n".encode('utf-8')
+
+
+def _decision(payload: Optional[Dict[str, Any]], params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Params of an ``INTERCEPTION_RESULT`` payload, None for a block.
+
+    Text results carry ``entries`` of strings: values that were not strings in the
+    event are decoded back from JSON, so unchanged ones compare equal.
+    """
+    decided = payload.get("params") if payload else None
+    if decided is None or "entries" not in decided:
+        return decided
+    result = {}
+    for entry in decided["entries"]:
+        key, value = entry["key"], entry["value"]
+        if key in params and not isinstance(params[key], str) and isinstance(value, str):
+            try:
+                value = proleak.json_loads(value)
+            except ValueError:
+                pass
+        result[key] = value
+    return result
+
+
+def merge_decisions(params: Dict[str, Any], decisions: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Merge interception decisions listed by priority, highest first.
+
+    The first block wins. Otherwise each key takes the value of the highest-priority
+    decision that changed it, so a lower priority never undoes a higher one.
+    """
+    changes: Dict[str, Any] = {}
+    for decision in decisions:
+        if decision is None:
+            return None
+        for key, value in decision.items():
+            if key not in changes and (key not in params or params[key] != value):
+                changes[key] = value
+    return dict(params, **changes) if changes else params
+
+
+class HubSubscriber:
+    """A local client of the hub, seen the way the engine sees its clients."""
+
+    def __init__(self, sock: socket.socket, index: int):
+        self.socket = sock
+        self.index = index  # Connection order, breaks priority ties
+        self.writer = CommandWriter(sock)
+        self.write_lock = threading.Lock()  # Keeps the protocol switch in order with events
+        self.codec: Optional[Codec] = None
+        self.sharing = False
+        self.events: Optional[frozenset] = None  # None: every event
+        self.intercepts: frozenset = frozenset()
+        self.filters: Dict[str, List[Dict[str, Any]]] = {}  # As subscribed, merged for the engine
+        self.routes: Dict[str, Route] = {}  # The same filters, checked before fan-out
+        self.flow: Dict[str, Dict[str, Any]] = {}
+        self.rules: List[Dict[str, Any]] = []
+        self.priority = 0
+        self.results: "queue.Queue[Any]" = queue.Queue()
+        self.results_lock = threading.Lock()
+        self.stale = 0  # Results still to come for interceptions decided without them
+        self.closed = False
+
+    def wants(self, event_name: str) -> bool:
+        return self.sharing and (self.events is None or event_name in self.events)
+
+    def accepts(self, event_name: str, params: Dict[str, Any]) -> bool:
+        """False when the mod's filters for the event leave these params out."""
+        route = self.routes.get(event_name)
+        return route is None or bool(route.select(params))
+
+
+class ProLeakHub(ProLeak):
+    """One engine connection shared by every local mod.
+
+    Mods connect to the hub as they would to the engine, with
+    ``ProLeak(unix_socket=DEFAULT_HUB_SOCKET, subscribe=True)`` (or a local port where
+    Unix sockets are missing). The hub asks the engine for the union of their
+    subscriptions only, and hands each event to the mods that asked for it, param
+    filters included: engine
+    frames are forwarded as read, encoded again at most once per event for mods
+    speaking the other protocol.
+
+    Prefix events go to every interested mod at once. The decisions of the mods
+    declaring the event in their ``intercepts`` are merged by priority, see
+    :func:`merge_decisions`; mods that do not answer within ``decision_timeout``
+    are left out of the merge.
+    """
+
+    def __init__(self, host='localhost', port=69420, listen: Union[str, Tuple[str, int], None] = None,
+                 decision_timeout: float = DEFAULT_DECISION_TIMEOUT, subscriber_timeout: float = 1.0, **kwargs):
+        kwargs.setdefault('subscribe', True)
+        super().__init__(host, port, **kwargs)
+        if listen is None:
+            listen = DEFAULT_HUB_SOCKET if hasattr(socket, 'AF_UNIX') else ('127.0.0.1', DEFAULT_HUB_PORT)
+        self.listen = listen
+        self.decision_timeout = decision_timeout
+        self.subscriber_timeout = subscriber_timeout  # Mods blocking a write longer than this are dropped
+        self.subscribers: Tuple[HubSubscriber, ...] = ()
+        self.decisions_missed = 0
+        self._subscribers_lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        self._accepted = 0
+
+    def start(self):
+        """Connect to the engine, then accept mods."""
+        self.connect()
+        self.start_leaking()
+        if isinstance(self.listen, str):
+            if os.path.exists(self.listen):
+                os.unlink(self.listen)  # Left over by a hub that did not stop cleanly
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(self.listen)
+            self._server.listen()
+        else:
+            self._server = socket.create_server(self.listen)
+            self.listen = self._server.getsockname()[:2]
+        threading.Thread(target=self._accept, args=(self._server,), name="ProLeakHub", daemon=True).start()
+        return self
+
+    def stop(self):
+        server, self._server = self._server, None
+        if server:
+            server.close()
+            if isinstance(self.listen, str) and os.path.exists(self.listen):
+                os.unlink(self.listen)
+        for subscriber in self.subscribers:
+            self._drop(subscriber)
+        if self.sharing and self.socket:
+            self.stop_leaking()
+        self.disconnect()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _accept(self, server: socket.socket):
+        while self._server is server:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                return
+            if sock.family != getattr(socket, 'AF_UNIX', None):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self.subscriber_timeout)
+            with self._subscribers_lock:
+                self._accepted += 1
+                subscriber = HubSubscriber(sock, self._accepted)
+                self.subscribers = self.subscribers + (subscriber,)
+            threading.Thread(target=self._serve, args=(subscriber,), daemon=True).start()
+
+    def _serve(self, subscriber: HubSubscriber):
+        buffer = b""
+        try:
+            while not subscriber.closed:
+                try:
+                    data = subscriber.socket.recv(DEFAULT_READ_SIZE)
+                except socket.timeout:
+                    continue  # The timeout is meant for writes, a quiet mod is fine
+                if not data:
+                    break
+                commands, buffer = split_commands(buffer + data)
+                for kind, command in commands:
+                    if kind is None:
+                        self._handle(subscriber, *command)
+                    elif kind == FRAME_COMMAND:
+                        for text_command in parse_commands(command.decode('utf-8'))[0]:
+                            self._handle(subscriber, *text_command)
+                    elif kind == FRAME_INTERCEPTION_RESULT and subscriber.codec:
+                        self._handle(subscriber, "INTERCEPTION_RESULT", subscriber.codec.decode(command))
+        except OSError:
+            pass
+        self._drop(subscriber)
+
+    def _handle(self, subscriber: HubSubscriber, command: str, payload):
+        if command == "INTERCEPTION_RESULT":
+            with subscriber.results_lock:
+                if subscriber.stale:
+                    subscriber.stale -= 1  # Answer to an interception already decided without it
+                else:
+                    subscriber.results.put(payload)
+            return
+        if command == "HELLO":
+            codec = self.codec  # Mods can only switch to the protocol the engine link speaks
+            if (codec and BINARY_PROTOCOL in payload.get("protocols", ())
+                    and codec.name in payload.get("codecs", ())):
+                with subscriber.write_lock:
+                    self._write(subscriber, _text_frame(BINARY_SWITCH_EVENT,
+                                                        {"protocol": BINARY_PROTOCOL, "codec": codec.name}))
+                    subscriber.codec = codec
+            return
+        if command in ("START", "SUBSCRIBE") and payload is not None:
+            events = payload.get("events", ())
+            subscriber.events = None if "*" in events else frozenset(events)
+            subscriber.filters = payload.get("filters", {})
+            subscriber.routes = {event: Route([(order, True, criteria_from_json(match))
+                                               for order, match in enumerate(matches)])
+                                 for event, matches in subscriber.filters.items()}
+            subscriber.flow = payload.get("flow", {})
+            subscriber.rules = payload.get("rules", [])
+            # Rules only reach the engine for events no other mod wants, see _subscription
+            subscriber.intercepts = frozenset(payload.get("intercepts", ())) | {
+                rule["event"] for rule in payload.get("rules", ())}
+            subscriber.priority = payload.get("priority", 0)
+        if command == "START":
+            subscriber.sharing = True
+        elif command == "STOP":
+            subscriber.sharing = False
+        self._subscriptions_changed()
+
+    def _write(self, subscriber: HubSubscriber, data: bytes):
+        try:
+            subscriber.writer.send(data)
+        except OSError as e:
+            self._lost(subscriber, e)
+
+    def _lost(self, subscriber: HubSubscriber, error: OSError):
+        if not subscriber.closed:
+            print(f"Dropping hub subscriber #{subscriber.index}: {error}")
+            self._drop(subscriber)
+
+    def _drop(self, subscriber: HubSubscriber):
+        with self._subscribers_lock:
+            if subscriber.closed:
+                return
+            subscriber.closed = True
+            self.subscribers = tuple(s for s in self.subscribers if s is not subscriber)
+        subscriber.results.put(_CLOSED)
+        try:
+            subscriber.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        subscriber.socket.close()
+        self._subscriptions_changed()
+
+    def _subscriptions_changed(self):
+        with self._registry_lock:
+            self._registry_changed()
+
+    def _subscription(self):
+        """The union of the mods' subscriptions.
+
+        A filter, flow policy or rule only reaches the engine when it holds for every
+        mod wanting the event: filters are merged as long as each of these mods filters
+        the event, flow policies are kept when they all agree, and rules are kept for
+        events a single mod wants, since the others would miss the events they decide.
+        """
+        sharing = [subscriber for subscriber in self.subscribers if subscriber.sharing]
+        events, intercepts = set(), set()
+        for subscriber in sharing:
+            if subscriber.events is None:
+                events.add("*")
+            else:
+                events.update(subscriber.events)
+            intercepts.update(subscriber.intercepts)
+        subscription = {"events": ["*"] if "*" in events else sorted(events), "intercepts": sorted(intercepts)}
+        filters, flow = {}, {}
+        for event in sorted(events - {"*"}):
+            wanting = [subscriber for subscriber in sharing if subscriber.wants(event)]
+            if "*" not in events and all(event in subscriber.filters for subscriber in wanting):
+                merged = []
+                for subscriber in wanting:
+                    merged.extend(match for match in subscriber.filters[event] if match not in merged)
+                filters[event] = merged
+            policies = [subscriber.flow.get(event) for subscriber in wanting]
+            if policies[0] is not None and all(policy == policies[0] for policy in policies):
+                flow[event] = policies[0]
+        rules = [rule for subscriber in sharing for rule in subscriber.rules
+                 if [s for s in sharing if s.wants(rule["event"])] == [subscriber]]
+        if rules:
+            subscription["rules"] = rules
+        if any(subscriber.flow for subscriber in sharing):
+            subscription["flow"] = flow  # Even empty, so the engine says it enforces none of them anymore
+        if filters:
+            subscription["filters"] = filters
+        return subscription
+
+    def _flow_event(self, event_params: Dict[str, Any]):
+        # Each mod learns which of its own flow policies the engine enforces
+        enforced = set(event_params.get("events", ()))
+        for subscriber in self.subscribers:
+            if subscriber.flow:
+                params = {"events": sorted(event for event in subscriber.flow if event in enforced)}
+                with subscriber.write_lock:
+                    if subscriber.codec:
+                        self._write(subscriber, binary_frame(FRAME_EVENT, binary_event_body(
+                            FLOW_EVENT, subscriber.codec.encode(params))))
+                    else:
+                        self._write(subscriber, _text_frame(FLOW_EVENT, params))
+
+    def _transport_stats(self):
+        stats = super()._transport_stats()
+        stats["decisions_missed"] = self.decisions_missed
+        stats["subscribers"] = [{"index": s.index, "priority": s.priority, "pending": s.writer.pending,
+                                 "writes": s.writer.writes} for s in self.subscribers]
+        return stats
+
+    def _process_frames(self, writer, frames, process, text):
+        # Events read together reach each mod in one write, as they reach the hub
+        subscribers = self.subscribers if len(frames) > 1 else ()
+        for subscriber in subscribers:
+            subscriber.writer.cork()
+        try:
+            super()._process_frames(writer, frames, process, text)
+        finally:
+            for subscriber in subscribers:
+                try:
+                    subscriber.writer.uncork()
+                except OSError as e:
+                    self._lost(subscriber, e)
+
+    def _process_event(self, event_data):
+        received = time.perf_counter()
+        event_name = event_data[0].split(': ', 1)[1]
+        self.events_received[event_name] = self.events_received.get(event_name, 0) + 1
+        raw_params = event_data[1]
+        params, is_prefix = None, False
+        if '__is_prefix' in raw_params:  # Only prefix events need decoding here
+            params = proleak.json_loads(raw_params)
+            is_prefix = params.pop('__is_prefix', False)
+        text = ("\n".join(event_data) + "\n---\n").encode('utf-8')
+        self._forward(event_name, is_prefix, params, raw_params, received, text=text)
+
+    def _process_binary_event(self, kind, body):
+        received = time.perf_counter()
+        event_name, raw_params = split_binary_event(body)
+        self.events_received[event_name] = self.events_received.get(event_name, 0) + 1
+        is_prefix = kind == FRAME_PREFIX_EVENT
+        params = self.codec.decode(raw_params) if is_prefix else None
+        self._forward(event_name, is_prefix, params, raw_params, received, binary=binary_frame(kind, body))
+
+    def _forward(self, event_name, is_prefix, params, raw_params, received, text=None, binary=None):
+        if event_name == FLOW_EVENT:
+            self._flow_event(self.codec.decode(raw_params) if self.codec else proleak.json_loads(raw_params))
+            return
+        targets = [subscriber for subscriber in self.subscribers if subscriber.wants(event_name)]
+        if any(event_name in subscriber.routes for subscriber in targets):
+            # The engine sends what any of these mods wants, each one only gets its own matches
+            if params is None:
+                params = self.codec.decode(raw_params) if self.codec else proleak.json_loads(raw_params)
+            targets = [subscriber for subscriber in targets if subscriber.accepts(event_name, params)]
+        if not targets:
+            self.events_ignored += 1
+            if is_prefix:
+                self._send_interception_result(event_name, params)  # Nobody to ask, let the game go on
+            return
+
+        encoded: Dict[Optional[str], bytes] = {}  # Codec name (None for text) -> frame
+
+        def frame_for(codec: Optional[Codec]) -> bytes:
+            nonlocal params
+            key = codec.name if codec else None
+            frame = encoded.get(key)
+            if frame is None:
+                if key is None and text is not None:
+                    frame = text
+                elif codec and binary is not None and codec is self.codec:
+                    frame = binary
+                else:
+                    if params is None:
+                        params = self.codec.decode(raw_params) if self.codec else proleak.json_loads(raw_params)
+                    if codec:
+                        frame = binary_frame(FRAME_PREFIX_EVENT if is_prefix else FRAME_EVENT,
+                                             binary_event_body(event_name, codec.encode(params)))
+                    else:
+                        frame = _text_frame(event_name, dict(params, __is_prefix=True) if is_prefix else params)
+                encoded[key] = frame
+            return frame
+
+        for subscriber in targets:
+            with subscriber.write_lock:
+                self._write(subscriber, frame_for(subscriber.codec))
+        if is_prefix:
+            self._decide(targets, event_name, params, received)
+
+    def _decide(self, targets, event_name, params, received):
+        deciders = sorted((s for s in targets if event_name in s.intercepts), key=lambda s: (-s.priority, s.index))
+        for subscriber in deciders:
+            try:
+                subscriber.writer.flush()  # The hub may be corked on a burst, the game is waiting
+            except OSError as e:
+                self._lost(subscriber, e)
+        deadline = received + self.decision_timeout
+        decisions = []
+        for subscriber in deciders:
+            try:
+                payload = subscriber.results.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                self.decisions_missed += 1
+                with subscriber.results_lock:
+                    subscriber.stale += 1
+                    while subscriber.stale and not subscriber.results.empty():  # It answered meanwhile
+                        subscriber.results.get_nowait()
+                        subscriber.stale -= 1
+                continue
+            if payload is not _CLOSED:
+                decisions.append(_decision(payload, params))
+        result = merge_decisions(params, decisions)
+        decided = time.perf_counter()
+        self._send_interception_result(event_name, result)
+        self._record_latency(event_name, "decision", decided - received)
+        self._record_latency(event_name, "send", time.perf_counter() - decided)
+
+    def serve_forever(self):
+        """Run the hub until the engine connection closes or Ctrl+C."""
+        try:
+            with self:
+                while self.running:
+                    time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share one ProLeak Engine connection with many local mods.")
+    parser.add_argument("--host", default="localhost", help="ProLeak Engine host")
+    parser.add_argument("--port", type=int, default=69420, help="ProLeak Engine port")
+    parser.add_argument("--listen", help=f"Unix socket path for the mods (default: {DEFAULT_HUB_SOCKET})")
+    parser.add_argument("--listen-port", type=int, help="Listen on this local TCP port instead of a Unix socket")
+    parser.add_argument("--protocol", choices=(PROTOCOL_TEXT, PROTOCOL_AUTO), default=PROTOCOL_TEXT)
+    parser.add_argument("--decision-timeout", type=float, default=DEFAULT_DECISION_TIMEOUT,
+                        help="Seconds to wait for the mods' interception decisions")
+    args = parser.parse_args(argv)
+
+    listen = ('127.0.0.1', args.listen_port) if args.listen_port is not None else args.listen
+    hub = ProLeakHub(args.host, args.port, listen=listen, decision_timeout=args.decision_timeout,
+                     protocol=args.protocol)
+    print(f"ProLeak hub on {hub.listen or DEFAULT_HUB_SOCKET}", flush=True)
+    hub.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import selectors
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from ProLeak import DispatchExecutor, ProLeak, ProLeakConnectionError, ProLeakProtocolError, _Timer, _arity
+
+
+def _bind(func: Callable, client: ProLeak) -> Callable:
+    """Turn a pool callable taking the client first into a callable of that client's registry."""
+    if _arity(func) >= 4:
+        def bound(event_name, event_params, stop):
+            return func(client, event_name, event_params, stop)
+    else:
+        def bound(event_name, event_params):
+            return func(client, event_name, event_params)
+    bound.__qualname__ = getattr(func, '__qualname__', None) or repr(func)  # What stats() reports
+    return bound
+
+
+class _Loop:
+    """One thread reading every connection it was given, as they get readable."""
+
+    def __init__(self, index: int):
+        self.selector = selectors.DefaultSelector()
+        self.clients: Dict[ProLeak, socket.socket] = {}
+        self.running = True
+        self._lock = threading.Lock()  # Registrations come from any thread, select() runs without it
+        self._wakeup, self._waker = socket.socketpair()  # Gets select() to see new registrations
+        self._wakeup.setblocking(False)
+        self._waker.setblocking(False)
+        self.selector.register(self._wakeup, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._run, name=f"ProLeakPool-{index}", daemon=True)
+        self.thread.start()
+
+    def attach(self, client: ProLeak):
+        with self._lock:
+            self.clients[client] = client.socket
+            self.selector.register(client.socket, selectors.EVENT_READ, client)
+        self.wake()
+
+    def detach(self, client: ProLeak):
+        with self._lock:
+            sock = self.clients.pop(client, None)
+            if sock is not None:
+                self.selector.unregister(sock)
+
+    def wake(self):
+        try:
+            self._waker.send(b"\0")
+        except OSError:
+            pass  # Full: select() is waking up anyway
+
+    def _run(self):
+        while self.running:
+            for key, _ in self.selector.select():
+                client = key.data
+                if client is None:
+                    try:
+                        self._wakeup.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                alive = client.running  # Stopped by a handler, or disconnected since select() returned
+                if alive:
+                    try:
+                        alive = client._read_once()
+                    except (socket.error, ProLeakProtocolError, ProLeakConnectionError) as e:
+                        if client.running:
+                            print(f"Socket error: {e}")
+                        alive = False
+                    except Exception as e:  # A bad frame, or a disconnect() racing the read: only lose this one
+                        if client.running:
+                            print(f"Connection error: {e!r}")
+                        alive = False
+                if not alive:
+                    self._drop(client)
+        self.selector.close()
+        self._wakeup.close()
+        self._waker.close()
+
+    def _drop(self, client: ProLeak):
+        # Out of the selector first: a socket left there stays readable and keeps select() spinning
+        self.detach(client)
+        pool = client.pool
+        client.disconnect()
+        if pool is not None:
+            pool._release(client)
+
+    def stop(self):
+        self.running = False
+        self.wake()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+
+class ProLeakPool:
+    """Drives many engine connections from ``loops`` selector threads instead of a thread each.
+
+    Every connection keeps its own client, with its own registrations, while all of
+    them share one :class:`DispatchExecutor` for their handlers (unless a client brings
+    its own), one interceptor thread pool and one flow timer. A connection is read by the
+    loop with the fewest connections when it joins.
+
+    Callables registered on the pool get the client the event came from first:
+    ``handler(client, event, params)``; they apply to current and future connections.
+
+    Interceptors run on the loop: one that takes its time holds up every connection of
+    its loop, so bound them with deadlines or use more loops.
+    """
+
+    def __init__(self, loops: int = 1, executor: Optional[DispatchExecutor] = None, dispatch_workers: int = 4,
+                 interceptor_workers: int = 4):
+        if loops <= 0 or interceptor_workers <= 0:
+            raise ValueError("loops and interceptor_workers must be positive")
+        self.executor = executor or DispatchExecutor(dispatch_workers)
+        self.executor.start()
+        self.interceptor_workers = interceptor_workers
+        self._interceptor_pool = ThreadPoolExecutor(interceptor_workers, "ProLeakInterceptor")
+        self._timer = _Timer()
+        self._loops = [_Loop(index) for index in range(loops)]
+        self._assigned: Dict[ProLeak, _Loop] = {}
+        self._registrations: List[tuple] = []  # (register method name, events, callable, options)
+        self._bound: Dict[tuple, Callable] = {}  # (callable, client) -> what the client got
+        self._lock = threading.RLock()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._assigned)
+
+    @property
+    def clients(self) -> List[ProLeak]:
+        return list(self._assigned)
+
+    def connect(self, host='localhost', port=69420, **options) -> ProLeak:
+        """Open a new connection, read by the pool. ``options`` are those of :class:`ProLeak`."""
+        return self.add(ProLeak(host, port, **options))
+
+    def add(self, client: ProLeak) -> ProLeak:
+        """Connect ``client`` and read it from the pool."""
+        if self.closed:
+            raise ProLeakConnectionError("The pool is closed")
+        if client.socket:
+            raise ValueError("Add clients to a pool before connecting them")
+        with self._lock:
+            client.pool = self
+            if client.executor is None:
+                client.executor = self.executor
+            client._interceptor_pool = self._interceptor_pool
+            if client._timer is None:
+                client._timer = self._timer
+            for method, events, func, options in self._registrations:
+                self._apply(client, method, events, func, options)
+            try:
+                client._open()
+            except ProLeakConnectionError:
+                self._release(client)
+                raise
+            loop = min(self._loops, key=lambda candidate: len(candidate.clients))
+            self._assigned[client] = loop
+            loop.attach(client)
+        return client
+
+    def remove(self, client: ProLeak):
+        """Disconnect ``client`` and give it back its independence."""
+        client.disconnect()
+        self._release(client)
+
+    def _detach(self, client: ProLeak):
+        # Called by ProLeak.disconnect(), from any thread, while the socket is still open
+        with self._lock:
+            loop = self._assigned.pop(client, None)
+        if loop:
+            loop.detach(client)
+
+    def _release(self, client: ProLeak):
+        with self._lock:
+            for (func, owner) in [pair for pair in self._bound if pair[1] is client]:
+                del self._bound[(func, owner)]
+            if client.executor is self.executor:
+                client.executor = None
+            if client._interceptor_pool is self._interceptor_pool:
+                client._interceptor_pool = None
+            if client._timer is self._timer:
+                client._timer = None
+            client.pool = None
+
+    def _apply(self, client: ProLeak, method: str, events, func: Callable, options: Dict[str, Any]):
+        bound = self._bound.get((func, client))
+        if bound is None:
+            bound = self._bound[(func, client)] = _bind(func, client)
+        getattr(client, method)(events, bound, **options)
+
+    def _register(self, method: str, events, func: Callable, options: Dict[str, Any]):
+        with self._lock:
+            self._registrations.append((method, events, func, options))
+            for client in list(self._assigned):
+                self._apply(client, method, events, func, options)
+
+    def _unregister(self, method: str, events, func: Callable):
+        with self._lock:
+            self._registrations = [entry for entry in self._registrations
+                                   if not (entry[0] == method and entry[1] == events and entry[2] is func)]
+            for client in list(self._assigned):
+                bound = self._bound.get((func, client))
+                if bound is not None:
+                    getattr(client, method)(events, bound)
+
+    def register_handler(self, events: Union[str, List[str]], handler: Callable[..., None], **options):
+        """Register ``handler(client, event, params)`` on every connection, see :meth:`ProLeak.register_handler`."""
+        self._register('register_handler', events, handler, options)
+
+    def unregister_handler(self, events: Union[str, List[str]], handler: Callable[..., None]):
+        self._unregister('unregister_handler', events, handler)
+
+    def register_interceptor(self, events: Union[str, List[str]],
+                             interceptor: Callable[..., Optional[Dict[str, Any]]], **options):
+        """Register ``interceptor(client, event, params)`` on every connection, see
+        :meth:`ProLeak.register_interceptor`."""
+        self._register('register_interceptor', events, interceptor, options)
+
+    def unregister_interceptor(self, events: Union[str, List[str]],
+                               interceptor: Callable[..., Optional[Dict[str, Any]]]):
+        self._unregister('unregister_interceptor', events, interceptor)
+
+    def start_leaking(self):
+        for client in self.clients:
+            client.start_leaking()
+
+    def stop_leaking(self):
+        for client in self.clients:
+            client.stop_leaking()
+
+    def stats(self) -> Dict[str, Any]:
+        clients = self.clients
+        return {
+            "connections": len(clients),
+            "loops": [len(loop.clients) for loop in self._loops],
+            "bytes_received": sum(client.bytes_received for client in clients),
+            "frames_received": sum(client.frames_received for client in clients),
+            "events_ignored": sum(client.events_ignored for client in clients),
+            "executor": {"depth": self.executor.depth, "dropped": self.executor.dropped},
+        }
+
+    def close(self):
+        """Disconnect every connection, then stop the loops and the shared workers."""
+        if self.closed:
+            return
+        self.closed = True
+        for client in self.clients:
+            self.remove(client)
+        for loop in self._loops:
+            loop.stop()
+        self.executor.shutdown(drain=True)
+        self._interceptor_pool.shutdown(wait=False)
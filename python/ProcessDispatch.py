@@ -0,0 +1,330 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import multiprocessing
+import multiprocessing.connection
+import pickle
+import struct
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ProLeak import OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, Codec, JsonCodec, LazyParams, MsgpackCodec, _compile, _no_stop
+import ProLeak as proleak  # The JSON backend can be swapped at runtime
+
+DEFAULT_RING_SIZE = 4 * 2 ** 20
+
+# Record: total size, params codec, handler count, event name size; then the handler ids (u16),
+# the event name and the params exactly as they came off the wire when possible
+_RECORD = struct.Struct("<IBBH")
+_SIZE = struct.Struct("<I")
+_CODEC_IDS = {"json": 0, "msgpack": 1}
+
+# Ring header slots, 8 bytes each. CLOSING is 1 to stop once drained, 2 to stop right away
+_HEAD, _TAIL, _SLEEPING, _PROCESSED, _ERRORS, _CLOSING = range(6)
+_HEADER_SIZE = 64
+
+
+class _Ring:
+    """Single-producer, single-consumer byte ring in a shared memory block.
+
+    ``head`` and ``tail`` only ever grow: the producer owns the first, the consumer
+    the second, so neither needs a lock. Records may wrap around the end.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int):
+        self.shm = shm
+        self.capacity = capacity
+        self.header = shm.buf[:_HEADER_SIZE].cast('Q')
+        self.data = shm.buf[_HEADER_SIZE:_HEADER_SIZE + capacity]
+
+    @classmethod
+    def create(cls, capacity: int) -> '_Ring':
+        return cls(shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity), capacity)
+
+    @property
+    def used(self) -> int:
+        return self.header[_HEAD] - self.header[_TAIL]
+
+    def write(self, parts: List[bytes]) -> bool:
+        header, data, capacity = self.header, self.data, self.capacity
+        head = header[_HEAD]
+        if capacity - (head - header[_TAIL]) < sum(len(part) for part in parts):
+            return False
+        for part in parts:
+            position, size = head % capacity, len(part)
+            first = min(size, capacity - position)
+            data[position:position + first] = part[:first]
+            if first < size:
+                data[:size - first] = part[first:]
+            head += size
+        header[_HEAD] = head  # Published once the whole record is in
+        return True
+
+    def read(self, offset: int, size: int) -> bytes:
+        position = offset % self.capacity
+        first = min(size, self.capacity - position)
+        if first == size:
+            return bytes(self.data[position:position + size])
+        return bytes(self.data[position:]) + bytes(self.data[:size - first])
+
+    def close(self):
+        self.header.release()
+        self.data.release()
+        self.shm.close()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Before Python 3.13: the worker shares the parent's tracker, which unlinks it once
+        return shared_memory.SharedMemory(name)
+
+
+def _work(name: str, capacity: int, handlers: Dict[int, Callable], control, wakeup):
+    """Worker process: runs the records of its ring in order."""
+    ring = _Ring(_attach(name), capacity)
+    header = ring.header
+    calls = {handler_id: _compile(handler) for handler_id, handler in handlers.items()}
+    codecs: List[Codec] = [JsonCodec(), None]
+    try:
+        while header[_CLOSING] < 2:
+            tail = header[_TAIL]
+            if header[_HEAD] == tail:
+                if header[_CLOSING]:
+                    return
+                header[_SLEEPING] = 1
+                if header[_HEAD] == tail:
+                    wakeup.acquire(timeout=0.05)  # The timeout covers a wakeup lost to a race
+                header[_SLEEPING] = 0
+                continue
+            size = _SIZE.unpack(ring.read(tail, 4))[0]
+            record = ring.read(tail, size)
+            header[_TAIL] = tail + size  # Before running it: an event crashing the worker is not replayed
+            _, codec_id, count, name_size = _RECORD.unpack_from(record)
+            offset = _RECORD.size
+            handler_ids = struct.unpack_from(f"<{count}H", record, offset)
+            offset += 2 * count
+            event_name = record[offset:offset + name_size].decode('utf-8')
+            if codecs[codec_id] is None:
+                codecs[codec_id] = MsgpackCodec()
+            params = codecs[codec_id].decode(record[offset + name_size:])
+            params.pop('__is_prefix', None)
+            for handler_id in handler_ids:
+                while handler_id not in calls:  # Registered after this worker started
+                    added_id, handler = control.get()
+                    calls[added_id] = _compile(handler)
+                try:
+                    calls[handler_id](event_name, params, _no_stop)
+                except Exception:
+                    header[_ERRORS] += 1
+                    traceback.print_exc()
+            header[_PROCESSED] += 1
+    finally:
+        ring.close()
+
+
+class _Worker:
+    __slots__ = ('ring', 'process', 'control', 'wakeup', 'handlers')
+
+    def __init__(self, ring: _Ring, control, wakeup):
+        self.ring = ring
+        self.process = None
+        self.control = control
+        self.wakeup = wakeup
+        self.handlers: Dict[int, Callable] = {}
+
+
+class ProcessExecutor:
+    """Runs selected handlers in worker processes, out of reach of the reader's GIL.
+
+    Handlers registered with ``register_handler(..., process=True)`` are each pinned to
+    one of ``workers`` processes, so every handler sees its events in order. Events
+    reach a worker through its own shared memory ring of ``ring_size`` bytes, carrying
+    the params as they came off the wire when possible, never pickled.
+
+    When a ring is full, ``overflow`` decides: ``block`` waits for room, ``drop-newest``
+    discards the event. Workers that die are reported and restarted; the event they
+    were running is not replayed.
+
+    Handlers must be picklable (module-level functions), and scripts using the
+    ``spawn`` start method (the only one on Windows) need an ``if __name__ == "__main__"`` guard.
+    """
+
+    def __init__(self, workers: int = 2, ring_size: int = DEFAULT_RING_SIZE, overflow: str = OVERFLOW_BLOCK,
+                 start_method: Optional[str] = None):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy: {overflow!r}")
+        if workers <= 0 or ring_size <= 0:
+            raise ValueError("workers and ring_size must be positive")
+        self.workers = workers
+        self.ring_size = ring_size
+        self.overflow = overflow
+        self.dropped = 0
+        self.restarts = 0
+        self.accepting = False
+        self._context = multiprocessing.get_context(start_method)
+        self._workers: List[_Worker] = []
+        self._ids: Dict[Callable, Tuple[int, int]] = {}  # Handler -> (worker index, handler id)
+        self._routes: Dict[Tuple[Callable, ...], List[Tuple[_Worker, bytes, int]]] = {}
+        self._lock = threading.RLock()
+        self._monitor: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self.accepting:
+                return
+            if not self._workers:
+                self._routes.clear()
+                self._workers = [_Worker(_Ring.create(self.ring_size), self._context.Queue(),
+                                         self._context.Semaphore(0)) for _ in range(self.workers)]
+                for handler, (index, handler_id) in self._ids.items():
+                    self._workers[index].handlers[handler_id] = handler
+            for worker in self._workers:
+                if not (worker.process and worker.process.is_alive()):
+                    self._spawn(worker)
+            self.accepting = True
+        self._monitor = threading.Thread(target=self._watch, name="ProLeakProcessMonitor", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self, worker: _Worker):
+        index = self._workers.index(worker)
+        worker.process = self._context.Process(
+            target=_work, name=f"ProLeakHandlers-{index}", daemon=True,
+            args=(worker.ring.shm.name, self.ring_size, dict(worker.handlers), worker.control, worker.wakeup))
+        worker.process.start()
+
+    def _watch(self):
+        while self.accepting:
+            sentinels = {worker.process.sentinel: worker for worker in self._workers if worker.process}
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=0.2):
+                worker = sentinels[sentinel]
+                with self._lock:
+                    if not self.accepting:
+                        return
+                    worker.process.join()  # Reaps it, for the exit code
+                    print(f"Handler process {worker.process.name} died (exit code {worker.process.exitcode}), "
+                          f"restarting it")
+                    self.restarts += 1
+                    self._spawn(worker)
+
+    def add(self, handler: Callable):
+        """Make ``handler`` known to the workers; called on registration."""
+        with self._lock:
+            if handler in self._ids:
+                return
+            try:
+                pickle.dumps(handler)
+            except Exception as e:
+                raise TypeError(f"Process handlers must be picklable module-level functions: {e}")
+            handler_id = len(self._ids)
+            if handler_id > 0xFFFF:
+                raise ValueError("Too many process handlers")
+            index = handler_id % self.workers
+            self._ids[handler] = (index, handler_id)
+            self._routes.clear()
+            if self._workers:
+                worker = self._workers[index]
+                worker.handlers[handler_id] = handler
+                worker.control.put((handler_id, handler))
+
+    def _route(self, handlers: Tuple[Callable, ...]) -> List[Tuple[_Worker, bytes, int]]:
+        # Per worker: the packed ids of the handlers it runs for these events
+        route = self._routes.get(handlers)
+        if route is None:
+            for handler in handlers:
+                self.add(handler)
+            by_worker: Dict[int, List[int]] = {}
+            for handler in handlers:
+                index, handler_id = self._ids[handler]
+                by_worker.setdefault(index, []).append(handler_id)
+            route = self._routes[handlers] = [
+                (self._workers[index], struct.pack(f"<{len(ids)}H", *ids), len(ids))
+                for index, ids in by_worker.items()]
+        return route
+
+    def submit(self, handlers: Tuple[Callable, ...], event_name: str, event_params, raw_params=None,
+               codec: Optional[Codec] = None) -> bool:
+        """Hand an event to the workers running ``handlers``. Returns False if it was dropped.
+
+        ``raw_params`` are the params as read from the wire, in ``codec`` (text JSON when None).
+        """
+        if not self.accepting:
+            return False
+        if isinstance(event_params, LazyParams) and not event_params.decoded:
+            raw_params = event_params._raw
+        if raw_params is None:
+            params, codec_id = proleak.json_dumps(dict(event_params)).encode('utf-8'), 0
+        elif isinstance(raw_params, str):
+            params, codec_id = raw_params.encode('utf-8'), 0
+        else:
+            params, codec_id = bytes(raw_params), _CODEC_IDS[codec.name] if codec else 0
+        name = event_name.encode('utf-8')
+        queued = True
+        for worker, handler_ids, count in self._route(handlers):
+            size = _RECORD.size + len(handler_ids) + len(name) + len(params)
+            record = [_RECORD.pack(size, codec_id, count, len(name)), handler_ids, name, params]
+            if size > self.ring_size:
+                print(f"{event_name} event too large for the handler process ring ({size} bytes)")
+                self.dropped += 1
+                queued = False
+                continue
+            while not worker.ring.write(record):
+                if self.overflow == OVERFLOW_DROP_NEWEST or not self.accepting:
+                    self.dropped += 1
+                    queued = False
+                    break
+                worker.wakeup.release()
+                time.sleep(0.0005)
+            else:
+                if worker.ring.header[_SLEEPING]:
+                    worker.ring.header[_SLEEPING] = 0
+                    worker.wakeup.release()
+        return queued
+
+    def stats(self) -> Dict[str, Any]:
+        rings = [worker.ring for worker in self._workers]
+        return {
+            "workers": self.workers,
+            "queued_bytes": sum(ring.used for ring in rings),
+            "processed": sum(ring.header[_PROCESSED] for ring in rings),
+            "errors": sum(ring.header[_ERRORS] for ring in rings),
+            "dropped": self.dropped,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = None):
+        """Stop the workers, after they ran what is queued if ``drain``; frees the rings."""
+        with self._lock:
+            self.accepting = False
+            workers, self._workers = self._workers, []
+        if self._monitor and self._monitor is not threading.current_thread():
+            self._monitor.join()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            worker.ring.header[_CLOSING] = 1 if drain else 2
+            worker.wakeup.release()
+        for worker in workers:
+            worker.process.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.ring.close()
+            worker.ring.shm.unlink()
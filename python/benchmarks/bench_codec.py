@@ -0,0 +1,95 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Serialization cost per event: text protocol with each JSON backend against the binary codecs
+# Run from the python/ folder with: python -m benchmarks.bench_codec
+
+import json
+import time
+
+import ProLeak as proleak
+from ProLeak import (FRAME_EVENT, BinaryFrameDecoder, FrameDecoder, available_codecs, binary_event_body,
+                     binary_frame, split_binary_event, use_json_backend, _binary_interception_result,
+                     _interception_result)
+
+EVENTS = 20_000
+PARAMS = {
+    "Method": "SomeSpecificMethod",
+    "DeclaringType": "Lisk.Game.Units.UnitSpawner",
+    "Arguments": ["intercepted_value", 42, 3.5, True, None, ["nested", 1]],
+    "Wave": 12,
+}
+
+
+def measure(label, func, count):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<36} {count / elapsed:>12,.0f} /s  {elapsed / count * 1e6:>7.2f} µs each")
+
+
+def text_decode(data):
+    decoder = FrameDecoder()
+    decoder.feed(data)
+    for frame in decoder.frames():
+        lines = frame.strip().split('\n')
+        lines[0].split(': ', 1)[1]
+        proleak.json_loads(lines[1])
+
+
+def binary_decode(data, codec):
+    decoder = BinaryFrameDecoder()
+    decoder.feed(data)
+    for kind, body in decoder.frames():
+        event_name, raw_params = split_binary_event(body)
+        codec.decode(raw_params)
+
+
+def legacy_result(event_name, params):
+    # The pre-codec INTERCEPTION_RESULT payload, every value through str()
+    wrapped_params = {"entries": [{"key": k, "value": str(v)} for k, v in params.items()]}
+    return f"INTERCEPTION_RESULT:{json.dumps({'event': event_name, 'params': wrapped_params})}".encode('ascii')
+
+
+def main():
+    backends = [name for name in ("json", "ujson", "orjson") if getattr(proleak, name, None) or name == "json"]
+    text = f"Event: MethodCall\n{json.dumps(PARAMS)}\n---\n".encode('utf-8') * EVENTS
+    print(f"Decode {EVENTS} MethodCall events ({len(text) // EVENTS} B each in text)")
+    for backend in backends:
+        use_json_backend(backend)
+        measure(f"text, {backend}", lambda: text_decode(text), EVENTS)
+    use_json_backend()
+    for codec in available_codecs():
+        frame = binary_frame(FRAME_EVENT, binary_event_body("MethodCall", codec.encode(PARAMS)))
+        data = frame * EVENTS
+        measure(f"binary, {codec.name} ({len(frame)} B)", lambda: binary_decode(data, codec), EVENTS)
+
+    print(f"Encode {EVENTS} interception results")
+    measure("legacy text, str() values", lambda: [legacy_result("MethodCall", PARAMS) for _ in range(EVENTS)], EVENTS)
+    for backend in backends:
+        use_json_backend(backend)
+        measure(f"text, {backend}",
+                lambda: [_interception_result("MethodCall", PARAMS).encode('utf-8') for _ in range(EVENTS)], EVENTS)
+    use_json_backend()
+    for codec in available_codecs():
+        measure(f"binary, {codec.name}, typed values",
+                lambda: [_binary_interception_result(codec, "MethodCall", PARAMS) for _ in range(EVENTS)], EVENTS)
+
+
+if __name__ == "__main__":
+    main()
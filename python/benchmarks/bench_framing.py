@@ -0,0 +1,102 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Framing throughput: the legacy str-buffer splitter against FrameDecoder
+# Run from the python/ folder with: python -m benchmarks.bench_framing
+
+import json
+import time
+
+from ProLeak import FrameDecoder
+
+
+class ReplaySocket:
+    """Serves a byte stream through recv/recv_into, like a socket would."""
+
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def recv(self, size):
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return bytes(chunk)
+
+    def recv_into(self, buffer):
+        size = min(len(buffer), len(self.data) - self.offset)
+        buffer[:size] = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+
+def make_stream(count, payload_size):
+    params = {"Method": "SomeSpecificMethod", "DeclaringType": "Lisk.Game", "Arguments": ["é" * (payload_size // 2)]}
+    frame = f"Event: MethodCall\n{json.dumps(params, ensure_ascii=False)}\n---\n".encode('utf-8')
+    return frame * count
+
+
+def legacy_split(sock):
+    # The pre-FrameDecoder loop of ProLeak._read_events
+    frames = 0
+    buffer = ""
+    while True:
+        data = sock.recv(4096).decode('utf-8')
+        if not data:
+            break
+        buffer += data
+        while "---\n" in buffer:
+            event, buffer = buffer.split("---\n", 1)
+            event.strip().split('\n')
+            frames += 1
+    return frames
+
+
+def frame_decoder(sock, read_size):
+    frames = 0
+    decoder = FrameDecoder(read_size)
+    while decoder.recv_from(sock):
+        for frame in decoder.frames():
+            frame.strip().split('\n')
+            frames += 1
+    return frames
+
+
+def measure(label, run, data, count):
+    start = time.perf_counter()
+    frames = run(ReplaySocket(data))
+    elapsed = time.perf_counter() - start
+    assert frames == count, f"{label}: expected {count} frames, got {frames}"
+    print(f"  {label:<28} {count / elapsed:>14,.0f} events/s  {len(data) / elapsed / 2 ** 20:>9,.1f} MiB/s")
+
+
+def main():
+    profiles = [
+        ("small frames (~100 B)", 200_000, 32),
+        ("medium frames (~4 KiB)", 20_000, 4096),
+        ("large frames (~256 KiB)", 100, 256 * 1024),
+    ]
+    for name, count, payload_size in profiles:
+        data = make_stream(count, payload_size)
+        print(f"{name}, {count} events")
+        measure("legacy str buffer", legacy_split, data, count)
+        for read_size in (4096, 65536, 1 << 20):
+            measure(f"FrameDecoder read={read_size}", lambda sock: frame_decoder(sock, read_size), data, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#
+#     ProLeak API (Python)
+#     Copyright (C) 2024  Alexandre 'kidev' Poumaroux
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+# End-to-end load test: the engine simulator in its own process, feeding a ProLeak client
+# Run from the python/ folder with: python -m benchmarks.bench_load [profile ...] [--count N] [--no-js]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from EngineSimulator import PROFILES
+from ProLeak import LatencyHistogram, ProLeak
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.dirname(HERE)
+JS_CLIENT = os.path.join(PYTHON_DIR, "..", "javascript", "benchmarks", "load_client.js")
+
+
+def start_engine(profile, count):
+    command = [sys.executable, "EngineSimulator.py", "--profile", profile, "--text-only"]
+    if count:
+        command += ["--count", str(count)]
+    engine = subprocess.Popen(command, cwd=PYTHON_DIR, stdout=subprocess.PIPE, text=True)
+    port = int(engine.stdout.readline().split()[1])
+    return engine, port
+
+
+def engine_report(engine):
+    report = json.loads(engine.stdout.readline())
+    engine.wait(timeout=30)
+    return report
+
+
+def python_client(port):
+    latency = LatencyHistogram()
+    times = []
+
+    def on_event(event, params, unplug):
+        now = time.time_ns()
+        times.append(time.perf_counter())
+        latency.record((now - params.get("__sent", now)) / 1e9)
+        if event == "EndOfGame":
+            unplug()
+
+    api = ProLeak('127.0.0.1', port)
+    api.register_global_handler(on_event)
+    api.register_interceptor("MethodCall", lambda event, params: params)
+    api.connect()
+    api.start_leaking()
+    while api.running:
+        time.sleep(0.01)
+    api.disconnect()
+    elapsed = times[-1] - times[0] if len(times) > 1 else 0.0
+    return {
+        "received": len(times),
+        "events_per_second": len(times) / elapsed if elapsed else 0.0,
+        "handler_latency": latency.as_dict(),
+    }
+
+
+def js_client(port):
+    output = subprocess.run(["node", JS_CLIENT, str(port)], capture_output=True, text=True, timeout=600)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def print_row(client, result, report):
+    rtt = report["interceptor_rtt"]
+    print(f"  {client:<8} {result['received']:>9} {result['events_per_second']:>12,.0f}"
+          f" {result['handler_latency']['p50'] * 1e3:>9.3f} {result['handler_latency']['p99'] * 1e3:>9.3f}"
+          f" {rtt['p50'] * 1e3:>9.3f} {rtt['p99'] * 1e3:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ProLeak client load test against the engine simulator.")
+    parser.add_argument("profiles", nargs="*", metavar="profile", help=f"One of {', '.join(sorted(PROFILES))}")
+    parser.add_argument("--count", type=int, help="Override the event count of every profile")
+    parser.add_argument("--no-js", action="store_true", help="Skip the JavaScript client")
+    args = parser.parse_args()
+    for profile in args.profiles:
+        if profile not in PROFILES:
+            parser.error(f"Unknown profile: {profile}")
+
+    clients = [("python", python_client)]
+    if not args.no_js and shutil.which("node") and os.path.exists(JS_CLIENT):
+        clients.append(("node", js_client))
+
+    print(f"  {'client':<8} {'received':>9} {'events/s':>12} {'p50 ms':>9} {'p99 ms':>9}"
+          f" {'rtt p50':>9} {'rtt p99':>9}")
+    for profile in args.profiles or sorted(PROFILES):
+        shape = PROFILES[profile]._replace(count=args.count) if args.count else PROFILES[profile]
+        print(f"{profile}: {shape.count} events, rate {shape.rate or 'max'}/s, mix {shape.mix}, "
+              f"{shape.payload_size} B payloads, {shape.prefix_ratio:.0%} prefix")
+        for name, client in clients:
+            engine, port = start_engine(profile, args.count)
+            try:
+                result = client(port)
+                print_row(name, result, engine_report(engine))
+            finally:
+                engine.kill()
+
+
+if __name__ == "__main__":
+    main()
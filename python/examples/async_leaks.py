@@ -0,0 +1,33 @@
+import asyncio
+from AsyncProLeak import AsyncProLeak
+
+# Already living inside asyncio? AsyncProLeak needs no thread at all
+# Handlers and interceptors can be regular functions or coroutines
+
+
+async def on_method_call(event, params):
+    print(f"Method call: {params['Method']} of {params['DeclaringType']}")
+
+
+async def slow_down_nothing(event, params):
+    # Interceptors can await too, but remember the game waits for them
+    return params
+
+
+async def main():
+    api = AsyncProLeak()
+    api.register_handler("MethodCall", on_method_call)
+    api.register_interceptor("MethodCall", slow_down_nothing)
+
+    # The connection is closed when leaving the block
+    async with api:
+        await api.start_leaking()
+
+        # Or just iterate over the events
+        async for event, params in api:
+            print(f"Event: {event}")
+            if event == "EndOfGame":
+                break
+
+
+asyncio.run(main())
@@ -0,0 +1,27 @@
+import time
+from ProLeak import ProLeak
+from ProLeakHub import DEFAULT_HUB_SOCKET
+
+# Running several mods at once? Start a single hub next to the game:
+#   python ProLeakHub.py
+# It keeps the only connection to the engine and shares the events with every mod
+
+# subscribe=True tells the hub which events this mod wants, the others never reach it
+# When several mods intercept the same event, the highest priority has the last word
+api = ProLeak(unix_socket=DEFAULT_HUB_SOCKET, subscribe=True, priority=10)
+
+
+def double_gold(event, params):
+    if params["Method"] == "UpdateGold":
+        params["Amount"] = str(int(params["Amount"]) * 2)
+    return params
+
+
+api.register_interceptor("MethodCall", double_gold)
+api.register_handler("EndOfGame", lambda event, params, stop: stop())
+
+api.connect()
+api.start_leaking()
+while api.running:
+    time.sleep(0.1)
+api.disconnect()
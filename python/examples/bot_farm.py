@@ -0,0 +1,37 @@
+import sys
+import time
+from ProLeakPool import ProLeakPool
+
+# Run a whole fleet of bots from one process: one selector loop reads every engine,
+# instead of a thread per connection. Pass the engine ports on the command line,
+# e.g. python bot_farm.py 69420 69421 69422
+
+ports = [int(port) for port in sys.argv[1:]] or [69420]
+wins = {}
+
+
+# Pool handlers get the client the event came from first, so ye know which bot it was
+def on_end_of_game(client, event, params):
+    wins[client.port] = wins.get(client.port, 0) + 1
+    print(f"Bot on port {client.port} finished a game ({wins[client.port]} so far)")
+
+
+def no_surrender(client, event, params):
+    return None  # Blocked, for every bot
+
+
+with ProLeakPool(loops=1) as pool:
+    pool.register_handler("EndOfGame", on_end_of_game)
+    pool.register_interceptor("MethodCall", no_surrender, Method="Surrender")
+    bots = [pool.connect(port=port) for port in ports]
+
+    # Each bot still has its own registry for what only concerns it
+    bots[0].register_handler("MethodCall", lambda event, params: print(f"Lead bot saw {params['Method']}"))
+
+    pool.start_leaking()
+    try:
+        while len(pool):
+            time.sleep(1)
+            print(pool.stats())
+    except KeyboardInterrupt:
+        pass
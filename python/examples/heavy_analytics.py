@@ -0,0 +1,25 @@
+import time
+from ProLeak import ProLeak
+from ProcessDispatch import ProcessExecutor
+
+# CPU-heavy handlers would slow down the thread reading the events
+# With process=True they run in worker processes instead, each handler always in the same one
+# They must be plain module-level functions
+
+
+def crunch_numbers(event, params):
+    total = sum(i * i for i in range(100_000))
+    print(f"{params['Method']}: {total}")
+
+
+if __name__ == "__main__":  # Needed on Windows, where workers re-import this script
+    api = ProLeak(process_executor=ProcessExecutor(workers=2))
+    api.register_handler("MethodCall", crunch_numbers, process=True)
+    api.register_handler("EndOfGame", lambda event, params, stop: stop())
+
+    api.connect()
+    api.start_leaking()
+    while api.running:
+        time.sleep(0.1)
+    print(api.stats()["process_pool"])
+    api.disconnect()
@@ -0,0 +1,31 @@
+import sys
+import time
+from ProLeak import ProLeak
+from EventLog import EventLog, EventRecorder
+
+# Play a game once while recording it, then replay it as often as ye like to debug yer mod
+# Run with "record" first, then without arguments
+
+
+def on_method_call(event, params):
+    print(f"{params['Method']} called")
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "record":
+    api = ProLeak()
+    api.start_recording(EventRecorder("game.plog"))
+    api.register_handler("EndOfGame", lambda event, params, stop: stop())
+    api.connect()
+    api.start_leaking()
+    while api.running:
+        time.sleep(0.1)
+    api.stop_recording()  # Writes what's left of the log
+    api.disconnect()
+else:
+    # No engine needed: the frames go through the same dispatch as live ones
+    api = ProLeak()
+    api.register_handler("MethodCall", on_method_call)
+    with EventLog("game.plog") as log:
+        # Start at the first SpawnUnit, at twice the real pace. speed=None goes as fast as possible,
+        # handy to time yer handlers on a whole game
+        print(log.replay(api, speed=2.0, start=log.seek_event("SpawnUnit") or 0))
@@ -0,0 +1,46 @@
+import threading
+import time
+from ProLeak import ProLeak
+from GameState import GameState
+
+# One game state for everyone, kept up to date as the events arrive, instead of each handler
+# rebuilding its own from the params. Tell it how the events change it, then attach it
+
+state = GameState()
+state.reset("GameStarted")
+state.update("WaveStarted", fields={"wave": "Wave"})
+state.update("GoldChanged", "players", key="Player", fields={"gold": "Gold"})
+state.update("UnitSpawned", "units", key="UnitId", fields={"owner": "Player", "type": "Unit"})
+state.delete("UnitDied", "units", key="UnitId")
+
+
+# Ye only hear about what changed
+def on_change(change_set):
+    for change in change_set.changes:
+        print(f"Wave {state.game.wave}: {change.fields}")
+
+
+state.subscribe(on_change, ["players"])
+
+
+# Other threads read snapshots: no lock to wait for, and they never change under yer feet
+def army_report():
+    while True:
+        time.sleep(5)
+        snapshot = state.snapshot()
+        armies = {}
+        for unit in snapshot["units"].values():
+            armies[unit.owner] = armies.get(unit.owner, 0) + 1
+        print(f"Wave {snapshot.game.wave} armies: {armies}")
+
+
+api = ProLeak()
+state.attach(api)
+threading.Thread(target=army_report, daemon=True).start()
+api.connect()
+api.start_leaking()
+try:
+    while api.running:
+        time.sleep(0.1)
+except KeyboardInterrupt:
+    api.disconnect()
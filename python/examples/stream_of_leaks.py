@@ -0,0 +1,31 @@
+import time
+from ProLeak import ProLeak
+
+# Streams chain small steps over the events instead of hand-rolling buffers in every handler.
+# Nothing runs before subscribe(), and each event goes through the whole chain in one go
+
+api = ProLeak()
+
+# How many units each 10 seconds, counted as they come
+api.stream("MethodCall", Method="SpawnUnit").window(seconds=10).count().subscribe(
+    lambda spawned: print(f"{spawned} units spawned in the last 10 seconds"))
+
+# First time each unit type shows up in the game
+api.stream("MethodCall", Method="SpawnUnit").map(lambda params: params["Arguments"][0]).distinct().subscribe(
+    lambda unit: print(f"New unit type: {unit}"))
+
+# The gold of a player once it stopped moving for half a second, not every coin
+api.stream("GoldChanged").debounce(0.5, key="Player").subscribe(
+    lambda params: print(f"Player {params['Player']} settled at {params['Gold']} gold"))
+
+# What each player spent their gold on: latest gold paired with the next purchase, by player
+api.stream("GoldChanged").join(api.stream("UnitBought"), key="Player", within=2).subscribe(
+    lambda pair: print(f"Player {pair[1]['Player']} bought {pair[1]['Unit']} with {pair[0]['Gold']} gold"))
+
+api.connect()
+api.start_leaking()
+try:
+    while api.running:
+        time.sleep(0.1)
+except KeyboardInterrupt:
+    api.disconnect()
@@ -37,6 +37,12 @@ def three_param_handler(event, params, stop):
 api.register_handler("MethodCall", two_param_handler)
 api.register_handler(["UnityMessage", "EndOfGame"], three_param_handler)
 
+# Too many events? Keep 1 UnityMessage in 10, at most 30 Tick a second,
+# and only the latest position of each unit every 100 ms
+api.set_flow("UnityMessage", Sample(10))
+api.set_flow("Tick", Throttle(30))
+api.register_handler("UnitMoved", two_param_handler, flow=Coalesce(0.1, key="UnitId"))
+
 try:
     while True:
         command = input("Enter command (start/stop/quit): ").lower()
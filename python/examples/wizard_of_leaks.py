@@ -23,6 +23,32 @@ def powerful_interceptor(event, params):
 # Same syntax, just replacing register_handler by register_interceptor
 # Also, interceptors do not have an unplug parameter
 api.register_interceptor("MethodCall", powerful_interceptor)
+
+# Does yer interceptor always give the same answer for the same params? Mark it pure,
+# and repeated events get their answer from a cache without callin' it again
+@pure
+def tax_collector(event, params):
+    params["Arguments"] = [max(0, params["Arguments"][0] - 10)]
+    return params
+
+api.register_interceptor("CollectGold", tax_collector)
+
+# Only care about one method? Say so when registering, and every other MethodCall
+# goes on its way without waitin' for yer Python at all, quick as a cannonball
+def gold_interceptor(event, params):
+    params["Arguments"][0] = 9999
+    return params
+
+api.register_interceptor("MethodCall", gold_interceptor, Method="UpdateGold")
+# Lists match any of their values, and Prefix matches the start of a string:
+# api.register_handler("MethodCall", my_handler, DeclaringType=Prefix("Lisk.Game.Units."))
+
+# And when all ye do is block or overwrite, ye need no Python at all: rules are sent
+# to the engine, which decides on its own while the game keeps sailin'
+api.add_rule("MethodCall", RULE_BLOCK, Method="SomeOtherMethod")
+api.add_rule("MethodCall", RULE_SET, {"Arguments.0": "intercepted_value"}, Method="SomeSpecificMethod")
+# The first matching rule wins, before any interceptor. RULE_PASS lets the event through untouched
+
 api.connect()
 api.start_leaking()
 
@@ -1,10 +1,15 @@
 import os
 import sys
+import json
 import zipfile
 import shutil
+import hashlib
+import tempfile
+import threading
 import subprocess
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog
@@ -15,16 +20,138 @@ BEPINEX_LINUX_URL = "https://github.com/BepInEx/BepInEx/releases/download/v5.4.2
 PROLEAK_WIN_URL = "https://github.com/LegionTD2-Modding/ProLeak/releases/download/v1.0.0/ProLeakEngine.dll"
 PROLEAK_LINUX_URL = "https://github.com/LegionTD2-Modding/ProLeak/releases/download/v1.0.0/ProLeakEngine.so"
 
+# SHA-256 of each release asset, as published with the release. Downloads must match it. Assets without
+# one install unverified, with a warning, unless pinned digests are required (PROLEAK_REQUIRE_PINNED=1)
+CHECKSUMS = {
+    BEPINEX_WIN_URL: None,
+    BEPINEX_LINUX_URL: None,
+    PROLEAK_WIN_URL: None,
+    PROLEAK_LINUX_URL: None,
+}
+REQUIRE_PINNED = os.environ.get("PROLEAK_REQUIRE_PINNED") == "1"
 
-def download_file(url, filename):
+# Downloads are kept by SHA-256, so every game on the machine installs from the same copy
+CACHE_DIR = Path(os.environ.get("PROLEAK_CACHE") or Path.home() / ".cache" / "proleak")
+MANIFEST_NAME = "proleak-manifest.json"  # In the game folder: what was installed, file by file
+CHUNK_SIZE = 1024 * 1024
+
+_cache_lock = threading.Lock()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_index():
+    # Which blob each URL served last time, for URLs without a pinned checksum
+    try:
+        with open(CACHE_DIR / "urls.json", 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def fetch(url, session=None, require_pinned=REQUIRE_PINNED):
+    """Return the path of the cached download of ``url``, downloading it only if needed.
+
+    Downloads and cached copies are checked against the SHA-256 pinned in ``CHECKSUMS``.
+    The download of a URL without one is trusted as is, and only checked against its
+    own hash once cached. With ``require_pinned``, such URLs are refused instead.
+    """
+    blobs = CACHE_DIR / "sha256"
+    expected = CHECKSUMS.get(url)
+    if not expected:
+        if require_pinned:
+            raise Exception(f"No SHA-256 pinned for {url} in CHECKSUMS, pin the one published with the release")
+        print(f"Warning: no SHA-256 pinned for {url}, it will not be verified")
+    with _cache_lock:
+        known = expected or _cache_index().get(url)
+    if known and (blobs / known).exists() and sha256_file(blobs / known) == known:
+        return blobs / known
+
+    blobs.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, part = tempfile.mkstemp(dir=blobs, suffix=".part")
     try:
-        with requests.get(url, stream=True) as r:
+        with os.fdopen(fd, 'wb') as f, (session or requests).get(url, stream=True, timeout=60) as r:
             r.raise_for_status()
-            with open(filename, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+        actual = digest.hexdigest()
+        if expected and actual != expected:
+            raise Exception(f"Checksum mismatch for {url}: expected {expected}, got {actual}")
+        os.replace(part, blobs / actual)
     except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to download {filename}: {e}")
+        raise Exception(f"Failed to download {url}: {e}")
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+    with _cache_lock:
+        index = _cache_index()
+        index[url] = actual
+        with open(CACHE_DIR / "urls.json", 'w') as f:
+            json.dump(index, f, indent=2)
+    return blobs / actual
+
+
+def load_manifest(game_path):
+    try:
+        with open(Path(game_path) / MANIFEST_NAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(game_path, manifest):
+    with open(Path(game_path) / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def _up_to_date(target, entry, digest, size):
+    # Same content as recorded, and the file on disk was not touched since
+    if not entry or entry["hash"] != digest or entry["size"] != size:
+        return False
+    try:
+        stat = target.stat()
+    except OSError:
+        return False
+    return stat.st_size == size and stat.st_mtime_ns == entry["mtime"]
+
+
+def _record(manifest, name, target, digest, size):
+    manifest[name] = {"hash": digest, "size": size, "mtime": target.stat().st_mtime_ns}
+
+
+def extract_archive(archive, game_path, manifest):
+    """Extract the files of ``archive`` that changed since the manifest was written.
+
+    Returns how many files were written and skipped.
+    """
+    root = Path(game_path).resolve()
+    written = skipped = 0
+    with zipfile.ZipFile(archive, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            target = (root / info.filename).resolve()
+            if root not in target.parents:
+                raise Exception(f"Refusing to extract {info.filename} outside of the game folder")
+            digest = f"crc32:{info.CRC:08x}"  # The archive's own checksum, no need to inflate the file
+            if _up_to_date(target, manifest.get(info.filename), digest, info.file_size):
+                skipped += 1
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zip_ref.open(info) as source, open(target, 'wb') as destination:
+                shutil.copyfileobj(source, destination, CHUNK_SIZE)
+            _record(manifest, info.filename, target, digest, info.file_size)
+            written += 1
+    return written, skipped
 
 
 def get_game_path():
@@ -51,35 +178,40 @@ def get_game_path():
     return game_path if game_path else None
 
 
-def install_bepinex(game_path):
-    bepinex_url = BEPINEX_WIN_URL if sys.platform == "win32" else BEPINEX_LINUX_URL
-    bepinex_zip = "BepInEx.zip"
-
-    print("Downloading BepInEx...")
-    download_file(bepinex_url, bepinex_zip)
-
+def install_bepinex(game_path, archive, manifest):
     print("Extracting BepInEx...")
-    with zipfile.ZipFile(bepinex_zip, 'r') as zip_ref:
-        zip_ref.extractall(game_path)
+    written, skipped = extract_archive(archive, game_path, manifest)
+    print(f"BepInEx installed successfully ({written} files written, {skipped} already up to date).")
 
-    os.remove(bepinex_zip)
-    print("BepInEx installed successfully.")
 
-
-def install_proleak(game_path):
+def install_proleak(game_path, engine, manifest):
     plugins_folder = Path(game_path) / "BepInEx" / "plugins"
     plugins_folder.mkdir(parents=True, exist_ok=True)
 
-    proleak_url = PROLEAK_WIN_URL if sys.platform == "win32" else PROLEAK_LINUX_URL
     proleak_file = "ProLeakEngine.dll" if sys.platform == "win32" else "ProLeakEngine.so"
+    name = f"BepInEx/plugins/{proleak_file}"
+    target = plugins_folder / proleak_file
+    digest = f"sha256:{Path(engine).name}"  # Cache entries are named after their SHA-256
+    size = Path(engine).stat().st_size
 
-    print("Downloading ProLeak...")
-    download_file(proleak_url, proleak_file)
-
-    shutil.move(proleak_file, plugins_folder / proleak_file)
+    if _up_to_date(target, manifest.get(name), digest, size):
+        print("ProLeak is already up to date.")
+        return
+    shutil.copyfile(engine, target)
+    _record(manifest, name, target, digest, size)
     print("ProLeak installed successfully.")
 
 
+def download_all(session=None, require_pinned=REQUIRE_PINNED):
+    """Download (or find in the cache) BepInEx and ProLeak at the same time."""
+    bepinex_url = BEPINEX_WIN_URL if sys.platform == "win32" else BEPINEX_LINUX_URL
+    proleak_url = PROLEAK_WIN_URL if sys.platform == "win32" else PROLEAK_LINUX_URL
+    with ThreadPoolExecutor(max_workers=2) as downloads:
+        bepinex = downloads.submit(fetch, bepinex_url, session, require_pinned)
+        proleak = downloads.submit(fetch, proleak_url, session, require_pinned)
+        return bepinex.result(), proleak.result()
+
+
 def start_game(game_path):
     if sys.platform == "win32":
         subprocess.Popen(["steam", "steam://rungameid/469600"])
@@ -87,7 +219,25 @@ def start_game(game_path):
         subprocess.Popen([str(Path(game_path) / "start.sh")])
 
 
-def run_proleak_demo():
+def wait_for_engine(timeout=120.0, max_delay=2.0):
+    """Connect to the engine as soon as the game opened its port, retrying with a growing delay."""
+    from proleak import ProLeak, ProLeakConnectionError
+
+    proleak = ProLeak()
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            proleak.connect()
+            return proleak
+        except ProLeakConnectionError:
+            if time.monotonic() + delay > deadline:
+                raise Exception(f"ProLeak Engine did not answer within {timeout:.0f} seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+def run_proleak_demo(proleak=None):
     from proleak import ProLeak
 
     def example_callback(event, params, unplug):
@@ -97,7 +247,7 @@ def run_proleak_demo():
             unplug()
 
     try:
-        proleak = ProLeak()
+        proleak = proleak or ProLeak()
         proleak.plug(example_callback)
     except Exception as e:
         print(f"Failed to run ProLeak demo: {e}")
@@ -114,17 +264,25 @@ def main():
     print(f"Found Legion TD 2 at: {game_path}")
 
     try:
-        install_bepinex(game_path)
-        install_proleak(game_path)
+        print("Downloading BepInEx and ProLeak...")
+        with requests.Session() as session:
+            bepinex_zip, proleak_engine = download_all(session)
+
+        manifest = load_manifest(game_path)
+        try:
+            install_bepinex(game_path, bepinex_zip, manifest)
+            install_proleak(game_path, proleak_engine, manifest)
+        finally:
+            save_manifest(game_path, manifest)  # Whatever got written is not written again next time
 
         print("Starting Legion TD 2...")
         start_game(game_path)
 
         print("Waiting for game to start...")
-        time.sleep(10)  # Give the game some time to start
+        proleak = wait_for_engine()
 
         print("Running ProLeak demo...")
-        run_proleak_demo()
+        run_proleak_demo(proleak)
 
         print("Installation and demo complete!")
     except Exception as e:
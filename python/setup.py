@@ -8,6 +8,12 @@ setup(
         "requests",
         # other dependencies...
     ],
+    extras_require={
+        # Binary protocol codec and faster JSON for the text protocol
+        "fast": ["msgpack", "orjson"],
+        # Columnar EventStore
+        "store": ["numpy"],
+    },
     package_data={
         "proleak": ["installer.py", "ProLeakEngine.dll"],
     },
@@ -0,0 +1,23 @@
+import pytest
+
+from ProLeak import Codec, available_codecs
+
+
+def test_half_implemented_codecs_fail_when_created():
+    class EncodeOnly(Codec):
+        name = "encode-only"
+
+        def encode(self, obj):
+            return b""
+
+    with pytest.raises(TypeError):
+        EncodeOnly()
+    with pytest.raises(TypeError):
+        Codec()
+
+
+@pytest.mark.parametrize("codec", available_codecs(), ids=lambda codec: codec.name)
+def test_codecs_round_trip(codec):
+    params = {"Method": "Spawn", "Text": "héllo ✓", "Arguments": [1, 2.5, None, True], "Nested": {"A": "b"}}
+    assert codec.decode(codec.encode(params)) == params
+    assert codec.decode(memoryview(codec.encode(params))) == params
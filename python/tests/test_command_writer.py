@@ -0,0 +1,61 @@
+import socket
+
+import pytest
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import CommandWriter
+
+
+def receive(sock, size):
+    data = b""
+    while len(data) < size:
+        data += sock.recv(size - len(data))
+    return data
+
+
+def test_corked_commands_leave_in_one_write():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        writer = CommandWriter(ours)
+        writer.cork()
+        writer.send(b"A\n")
+        writer.send(b"B\n")
+        writer.send(b"RESULT\n", urgent=True)
+        assert writer.pending == 3 and writer.writes == 0
+        writer.uncork()
+        assert writer.pending == 0
+        assert writer.writes == 1 and writer.messages == 3
+        assert receive(theirs, 11) == b"RESULT\nA\nB\n"  # Interception results first
+
+
+def test_closed_writer_refuses_commands():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        writer = CommandWriter(ours)
+        writer.cork()
+        writer.send(b"LAST\n")
+        writer.close()  # Drains what is queued
+        assert receive(theirs, 5) == b"LAST\n"
+        writer.uncork()
+        with pytest.raises(BrokenPipeError):
+            writer.send(b"LATE\n")
+        assert writer.pending == 0
+
+
+def test_stop_leaking_is_flushed():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True)
+        client.register_handler("Tick", lambda e, p: client.stop_leaking())
+        client.connect()
+        client.start_leaking()
+        connection = sim.wait_for_client()
+        sim.wait_until(lambda: connection.sharing)
+        # Read as one burst: the reader corks the writer, and STOP still has to leave
+        connection.send(sim.frame("Tick", {}) + sim.frame("Tick", {}))
+        sim.wait_until(lambda: not connection.sharing)
+        client.start_leaking()
+        client.stop_leaking()
+        client.disconnect()  # Right away: STOP is written before the socket closes
+        sim.wait_until(lambda: connection.closed)
+        assert [command for command, _ in connection.commands] == ["START", "STOP", "START", "STOP"]
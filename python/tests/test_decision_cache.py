@@ -0,0 +1,66 @@
+import pytest
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import pure
+
+
+@pytest.fixture
+def engine():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True)
+        client.calls = []
+
+        @pure
+        def tag(event_name, params):
+            client.calls.append((event_name, params["Method"]))
+            return dict(params, Tagged=1)
+
+        client.register_interceptor(["MethodCall", "Other"], tag)
+        client.connect()
+        client.start_leaking()
+        connection = sim.wait_for_client()
+        sim.wait_until(lambda: connection.sharing)
+
+        def intercept(event_name, method):
+            params = sim.intercept(event_name, {"Method": method})["params"]
+            return None if params is None else {entry["key"]: entry["value"] for entry in params["entries"]}
+
+        yield client, connection, intercept
+        client.disconnect()
+
+
+def test_repeated_params_hit_the_cache(engine):
+    client, _, intercept = engine
+    assert intercept("MethodCall", "A") == {"Method": "A", "Tagged": "1"}
+    assert intercept("MethodCall", "A") == {"Method": "A", "Tagged": "1"}
+    assert intercept("MethodCall", "B") == {"Method": "B", "Tagged": "1"}
+    assert client.calls == [("MethodCall", "A"), ("MethodCall", "B")]
+    assert client.decision_cache.hits == 1 and len(client.decision_cache) == 2
+
+
+def test_registrations_invalidate_the_event_they_touch(engine):
+    client, _, intercept = engine
+    intercept("MethodCall", "A")
+    intercept("Other", "A")
+
+    def block(event_name, params):
+        return None if params["Method"] == "A" else params
+
+    client.register_interceptor("MethodCall", pure(block))
+    assert len(client.decision_cache) == 1  # Only the other event's decision is left
+    assert intercept("Other", "A") == {"Method": "A", "Tagged": "1"}
+    assert intercept("MethodCall", "A") is None  # Asked again, and blocked by the new chain
+    assert client.calls == [("MethodCall", "A"), ("Other", "A"), ("MethodCall", "A")]
+    client.unregister_interceptor("MethodCall", block)
+    assert intercept("MethodCall", "A") == {"Method": "A", "Tagged": "1"}
+    assert client.calls[-1] == ("MethodCall", "A") and len(client.calls) == 4
+
+
+def test_impure_chains_are_not_cached(engine):
+    client, _, intercept = engine
+    client.register_interceptor("MethodCall", lambda e, p: p)
+    intercept("MethodCall", "A")
+    intercept("MethodCall", "A")
+    assert client.calls == [("MethodCall", "A"), ("MethodCall", "A")]
+    assert len(client.decision_cache) == 0
@@ -0,0 +1,45 @@
+import pytest
+
+from ProLeak import ProLeak
+
+
+def feed(client, event_name, params):
+    client._dispatch_event(event_name, dict(params), False, None, 0.0)
+
+
+def test_event_handlers_run_before_global_handlers():
+    client = ProLeak()
+    got = []
+    client.register_global_handler(lambda e, p: got.append(("global", e)))
+    client.register_handler("Tick", lambda e, p, stop: got.append(("tick", e)))
+    client.register_handler("Tick", lambda e, p: got.append(("tick again", e)))
+    feed(client, "Tick", {})
+    feed(client, "Other", {})
+    assert got == [("tick", "Tick"), ("tick again", "Tick"), ("global", "Tick"), ("global", "Other")]
+
+
+def test_registration_during_dispatch_applies_to_the_next_event():
+    client = ProLeak()
+    got = []
+
+    def late(event_name, params):
+        got.append("late")
+
+    def once(event_name, params):
+        got.append("once")
+        client.unregister_handler("Tick", once)
+        client.register_handler("Tick", late)
+
+    client.register_handler("Tick", once)
+    client.register_handler("Tick", lambda e, p: got.append("always"))
+    feed(client, "Tick", {})
+    assert got == ["once", "always"]  # The event in flight kept the table it started with
+    feed(client, "Tick", {})
+    assert got == ["once", "always", "always", "late"]
+
+
+def test_unusable_signatures_are_rejected_at_registration():
+    client = ProLeak()
+    with pytest.raises(TypeError):
+        client.register_handler("Tick", lambda params: None)
+    assert "Tick" not in client._dispatch.handlers
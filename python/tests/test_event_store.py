@@ -0,0 +1,51 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from EventStore import EventStore  # noqa: E402
+
+
+def test_group_count_on_a_widened_column():
+    store = EventStore()
+    store.append("MethodCall", {"Method": "Spawn", "Target": "Orc"}, timestamp=1.0)
+    store.append("MethodCall", {"Method": "Spawn", "Target": 7}, timestamp=2.0)  # Widens Target to objects
+    store.append("MethodCall", {"Method": "Hit"}, timestamp=3.0)
+    store.append("MethodCall", {"Method": "Hit", "Target": "Orc"}, timestamp=4.0)
+
+    assert store.group_count("MethodCall", "Target") == {"Orc": 2, 7: 1, None: 1}
+    assert store.group_count("MethodCall", ["Method", "Target"]) == {
+        ("Spawn", "Orc"): 1, ("Spawn", 7): 1, ("Hit", None): 1, ("Hit", "Orc"): 1}
+
+
+def test_group_count_on_list_params():
+    store = EventStore()
+    store.append("MethodCall", {"Arguments": [1, "a"]}, timestamp=1.0)
+    store.append("MethodCall", {"Arguments": [1, "a"]}, timestamp=2.0)
+    store.append("MethodCall", {"Arguments": [2]}, timestamp=3.0)
+
+    assert store.group_count("MethodCall", "Arguments") == {(1, "a"): 2, (2,): 1}
+    assert store.group_count("MethodCall", "Arguments", edges=[0.0, 2.5]) == {(0, (1, "a")): 2, (1, (2,)): 1}
+
+
+def test_where_on_a_param_no_event_had():
+    store = EventStore()
+    store.append("Gold", {"Player": 1, "Amount": 5}, timestamp=1.0)
+    store.append("Gold", {"Player": 2, "Amount": 7}, timestamp=2.0)
+
+    assert store.count("Gold", where={"Team": -1}) == 0
+    assert store.count("Gold", where={"Team": 1}) == 0
+    assert store.count("Gold", where={"Player": 2}) == 1
+    assert len(store.timestamps("Gold", where={"Team": "Red"})) == 0
+
+
+def test_rolling_needs_a_numeric_param():
+    store = EventStore()
+    store.append("Chat", {"Text": "gg", "Length": 2}, timestamp=1.0)
+    store.append("Chat", {"Text": "hi", "Length": 2}, timestamp=2.0)
+
+    with pytest.raises(TypeError, match="Text"):
+        store.rolling("Chat", "Text", 10.0)
+    starts, sums = store.rolling("Chat", "Length", 10.0)
+    assert sums.tolist() == [4.0]
+    starts, counts = store.rolling("Chat", "Text", 10.0, aggregate="count")
+    assert counts.tolist() == [2]
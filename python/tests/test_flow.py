@@ -0,0 +1,36 @@
+import threading
+import time
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import Coalesce
+
+
+def test_coalesced_events_wait_for_the_reader():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True)
+        calls, done = [], threading.Event()
+
+        def slow(event_name, params):
+            calls.append("slow")
+            time.sleep(0.2)  # The coalescing window closes meanwhile
+            calls.append("slow done")
+
+        def latest(event_name, params):
+            calls.append(("pos", params["X"], threading.current_thread() is client.thread))
+            done.set()
+
+        client.register_handler("Pos", latest, flow=Coalesce(0.05))
+        client.register_handler("Slow", slow)
+        client.connect()
+        client.start_leaking()
+        try:
+            engine = sim.wait_for_client()
+            sim.wait_until(lambda: engine.sharing and "Slow" in engine.subscription)
+            sim.emit("Pos", {"X": 1})
+            sim.emit("Pos", {"X": 2})
+            sim.emit("Slow", {})
+            assert done.wait(5)
+            assert calls == ["slow", "slow done", ("pos", 2, False)]
+        finally:
+            client.disconnect()
@@ -0,0 +1,83 @@
+import pytest
+
+from ProLeak import (BINARY_SWITCH_EVENT, FRAME_EVENT, FRAME_PREFIX_EVENT, BinaryFrameDecoder, FrameDecoder,
+                     ProLeakProtocolError, binary_frame)
+
+
+class ChunkSocket:
+    """Socket handing out scripted chunks, one per ``recv_into`` call."""
+
+    def __init__(self, data: bytes, *cuts: int):
+        bounds = (0,) + cuts + (len(data),)
+        self.chunks = [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def recv_into(self, view):
+        chunk = self.chunks.pop(0)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def read_all(decoder, sock):
+    frames = []
+    while sock.chunks:
+        decoder.recv_from(sock)
+        frames.extend(decoder.frames())
+    return frames
+
+
+def test_multibyte_character_split_across_reads():
+    data = 'Event: Chat\n{"Text": "héllo ✓"}\n---\n'.encode('utf-8')
+    cut = data.index("✓".encode('utf-8')) + 1  # Inside the 3 bytes of the check mark
+    decoder = FrameDecoder()
+    sock = ChunkSocket(data, cut)
+    decoder.recv_from(sock)
+    assert decoder.frames() == []
+    decoder.recv_from(sock)
+    assert decoder.frames() == ['Event: Chat\n{"Text": "héllo ✓"}\n']
+    assert decoder.buffered == 0
+
+
+@pytest.mark.parametrize("split", [1, 2, 3])
+def test_delimiter_split_across_reads(split):
+    data = b"Event: A\n{}\n---\nEvent: B\n{}\n---\n"
+    delimiter = data.index(b"---\n")
+    decoder = FrameDecoder()
+    assert read_all(decoder, ChunkSocket(data, delimiter + split)) == ["Event: A\n{}\n", "Event: B\n{}\n"]
+    assert decoder.buffered == 0
+
+
+def test_frames_larger_than_the_read_size():
+    big = "Event: Big\n" + '{"Blob": "' + "x" * 1000 + '"}\n'
+    data = (big + "---\nEvent: Small\n{}\n---\n").encode('utf-8')
+    decoder = FrameDecoder(read_size=16)
+    sock = ChunkSocket(data, *range(16, len(data), 16))
+    assert read_all(decoder, sock) == [big, "Event: Small\n{}\n"]
+    assert decoder.capacity >= len(big)
+
+
+def test_text_decoder_stops_at_the_protocol_switch():
+    switch = f"Event: {BINARY_SWITCH_EVENT}\n{{}}\n---\n".encode('utf-8')
+    binary = binary_frame(FRAME_EVENT, b"\x04Tick{}")
+    decoder = FrameDecoder()
+    decoder.switch_marker = f"Event: {BINARY_SWITCH_EVENT}\n".encode('utf-8')
+    decoder.feed(b"Event: A\n{}\n---\n" + switch + binary)
+    assert decoder.frames() == ["Event: A\n{}\n", f"Event: {BINARY_SWITCH_EVENT}\n{{}}\n"]
+    assert decoder.switched
+    assert BinaryFrameDecoder.resume(decoder).frames() == [(FRAME_EVENT, b"\x04Tick{}")]
+
+
+def test_binary_frames_split_anywhere():
+    bodies = [b"x" * 100, b"", b"\xff" * 40]
+    data = b"".join(binary_frame(FRAME_PREFIX_EVENT, body) for body in bodies)
+    for cut in range(1, len(data)):
+        decoder = BinaryFrameDecoder(read_size=64)
+        frames = read_all(decoder, ChunkSocket(data, *sorted({cut} | set(range(64, len(data), 64)))))
+        assert frames == [(FRAME_PREFIX_EVENT, body) for body in bodies]
+        assert decoder.buffered == 0
+
+
+def test_binary_frame_with_bad_magic():
+    decoder = BinaryFrameDecoder()
+    decoder.feed(b"\x00\x01\x00\x00\x00\x00")
+    with pytest.raises(ProLeakProtocolError):
+        decoder.frames()
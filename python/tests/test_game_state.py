@@ -0,0 +1,78 @@
+import operator
+
+from GameState import GameState
+from ProLeak import ProLeak
+
+
+def feed(client, event_name, params):
+    client._dispatch_event(event_name, dict(params), False, None, 0.0)
+
+
+def test_builtin_field_specs_get_the_params_alone():
+    state = GameState()
+    state.update("Gold", "players", key="Player", fields={"gold": operator.itemgetter("Gold"), "name": str})
+    state.update("Wave", fields={"wave": lambda params: int(params["Wave"])})
+    client = ProLeak()
+    state.attach(client)
+
+    feed(client, "Gold", {"Player": 1, "Gold": 100})
+    feed(client, "Wave", {"Wave": "3"})
+
+    player = state["players"][1]
+    assert player.gold == 100
+    assert player.name == str({"Player": 1, "Gold": 100})
+    assert state.game.wave == 3
+
+
+def test_two_argument_specs_get_the_current_value():
+    state = GameState()
+    state.update("Income", "players", key="Player", fields={"gold": lambda params, gold: (gold or 0) + params["Amount"]})
+    client = ProLeak()
+    state.attach(client)
+    changes = []
+    state.subscribe(changes.append)
+
+    feed(client, "Income", {"Player": 1, "Amount": 5})
+    feed(client, "Income", {"Player": 1, "Amount": 0})  # Nothing changes, nobody hears about it
+    feed(client, "Income", {"Player": 1, "Amount": 2})
+
+    assert state["players"][1].gold == 7
+    assert [change_set.changes[0].fields for change_set in changes] == [{"gold": 5}, {"gold": 7}]
+
+
+def test_snapshots_do_not_see_later_events():
+    state = GameState()
+    state.update("Spawn", "units", key="Id", fields={"type": "Type"})
+    state.delete("Death", "units", key="Id")
+    client = ProLeak()
+    state.attach(client)
+
+    feed(client, "Spawn", {"Id": 1, "Type": "Orc"})
+    snapshot = state.snapshot()
+    feed(client, "Spawn", {"Id": 1, "Type": "Troll"})
+    feed(client, "Death", {"Id": 1})
+
+    assert snapshot["units"][1].type == "Orc"
+    assert 1 not in state["units"]
+    assert snapshot.game is state.game  # Untouched records are shared
+
+
+def test_falsy_key_specs_are_kept():
+    class Slot:
+        def __bool__(self):
+            return False
+
+        def __call__(self, params):
+            return params["Slot"]
+
+    state = GameState()
+    state.update("Build", "slots", key=Slot(), fields={"tower": "Tower"})
+    state.update("Chat", "by_empty_param", key="", fields={"text": "Text"})
+    client = ProLeak()
+    state.attach(client)
+
+    feed(client, "Build", {"Slot": 3, "Tower": "Arrow"})
+    feed(client, "Chat", {"": "red", "Text": "gg"})
+
+    assert state["slots"][3].tower == "Arrow"
+    assert state["by_empty_param"]["red"].text == "gg"
@@ -0,0 +1,38 @@
+import threading
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeakHub import ProLeakHub
+
+
+def _mod(port, method):
+    mod = ProLeak.ProLeak("127.0.0.1", port, subscribe=True)
+    mod.seen, mod.done = [], threading.Event()
+    mod.register_handler("MethodCall", lambda event_name, params: mod.seen.append(params["Method"]), Method=method)
+    mod.register_handler("Tick", lambda event_name, params: mod.done.set())
+    mod.connect()
+    mod.start_leaking()
+    return mod
+
+
+def test_hub_applies_each_mods_filters():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        with ProLeakHub("127.0.0.1", sim.port, listen=("127.0.0.1", 0)) as hub:
+            engine = sim.wait_for_client()
+            mod_a, mod_b = _mod(hub.listen[1], "A"), _mod(hub.listen[1], "B")
+            try:
+                # The engine gets both filters, merged
+                sim.wait_until(lambda: engine.wants("MethodCall", {"Method": "A"})
+                               and engine.wants("MethodCall", {"Method": "B"}))
+                assert not engine.wants("MethodCall", {"Method": "C"})
+                assert sim.emit("MethodCall", {"Method": "C"}) == 0
+                sim.emit("MethodCall", {"Method": "B"})
+                sim.emit("MethodCall", {"Method": "A"})
+                sim.emit("Tick", {})
+                assert mod_a.done.wait(5) and mod_b.done.wait(5)
+                # Each mod only got the events it filters on, not the other one's
+                assert mod_a.seen == ["A"] and mod_a.events_received["MethodCall"] == 1
+                assert mod_b.seen == ["B"] and mod_b.events_received["MethodCall"] == 1
+            finally:
+                mod_a.disconnect()
+                mod_b.disconnect()
@@ -0,0 +1,31 @@
+import ProLeak
+from ProLeak import FALLBACK_BLOCK, FALLBACK_PASS, _fallback_params, _interception_result
+
+
+def test_fallback_without_raw_params():
+    # Frames with extra header lines have their params merged, and no raw form to resend
+    assert _fallback_params(FALLBACK_PASS, None, {"Method": "X"}) == {"Method": "X"}
+    assert _fallback_params(FALLBACK_BLOCK, None, {"Method": "X"}) is None
+    assert _fallback_params(FALLBACK_PASS, '{"Method": "X", "__is_prefix": true}', None) == {"Method": "X"}
+
+
+def test_failed_chain_resends_the_params_it_was_given():
+    client = ProLeak.ProLeak()
+    sent = []
+    client._send_interception_result = lambda event_name, params: sent.append(params)
+
+    def broken(event_name, params):
+        params["Method"] = "Changed"
+        raise RuntimeError("boom")
+
+    client.register_interceptor("MethodCall", broken)
+    client._dispatch_event("MethodCall", {"Method": "X", "Gold": 5}, True, None, 0.0)
+    assert sent == [{"Method": "X", "Gold": 5}]
+
+
+def test_interception_results_use_the_json_backend(monkeypatch):
+    dumped = []
+    backend = ProLeak.json_dumps
+    monkeypatch.setattr(ProLeak, "json_dumps", lambda obj: dumped.append(obj) or backend(obj))
+    _interception_result("E", {"A": "kept", "B": [1, 2]})
+    assert [1, 2] in dumped  # The list param itself went through the backend
@@ -0,0 +1,65 @@
+import json
+import urllib.request
+
+from MetricsExporter import MetricsExporter, prometheus_text
+from ProLeak import ProLeak
+
+EVENT = 'Say "hi"\\\nnow'  # A quote, a backslash and a newline
+
+
+def client_with_latencies():
+    client = ProLeak()
+    client.events_received[EVENT] = 3
+    for seconds in (0.000001, 0.00003, 0.002, 0.002, 100.0):
+        client._record_handler(EVENT, "mod.handler", seconds)
+    return client
+
+
+def samples(text, metric):
+    return [line for line in text.splitlines() if line.startswith(metric + "{") or line.startswith(metric + " ")]
+
+
+def family(name, declared):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in declared:
+            return name[:-len(suffix)]
+    return name
+
+
+def test_types_come_before_their_samples():
+    lines = prometheus_text(client_with_latencies().stats(buckets=True)).splitlines()
+    declared = set()
+    for line in lines:
+        if line.startswith("# TYPE "):
+            declared.add(line.split()[2])
+        elif not line.startswith("#"):
+            assert family(line.split("{")[0].split(" ")[0], declared) in declared, line
+
+
+def test_histogram_buckets_are_cumulative():
+    text = prometheus_text(client_with_latencies().stats(buckets=True))
+    buckets = samples(text, "proleak_handler_seconds_bucket")
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+    assert 'le="+Inf"' in buckets[-1]
+    assert counts[-1] == 5
+    count, = samples(text, "proleak_handler_seconds_count")
+    assert int(count.rsplit(" ", 1)[1]) == counts[-1]
+
+
+def test_label_values_are_escaped():
+    text = prometheus_text(client_with_latencies().stats(buckets=True))
+    sample, = samples(text, "proleak_events_received_total")
+    assert sample == 'proleak_events_received_total{event="Say \\"hi\\"\\\\\\nnow"} 3'
+    assert all("\n" not in line for line in text.splitlines())
+
+
+def test_exporter_serves_metrics_and_stats():
+    with MetricsExporter(client_with_latencies(), port=0) as exporter:
+        assert exporter.port != 0
+        base = f"http://127.0.0.1:{exporter.port}"
+        with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "# TYPE proleak_handler_seconds histogram" in response.read().decode('utf-8')
+        with urllib.request.urlopen(base + "/stats", timeout=5) as response:
+            assert json.loads(response.read())["events_received"] == {EVENT: 3}
@@ -0,0 +1,42 @@
+import threading
+
+from EngineSimulator import EngineSimulator
+from ProLeakPool import ProLeakPool
+
+
+def _pool_of_two(sim, pool, got):
+    lock = threading.Lock()
+
+    def handler(client, event_name, params):
+        with lock:
+            got.append(client)
+
+    pool.register_handler("Tick", handler)
+    clients = [pool.connect(port=sim.port) for _ in range(2)]
+    pool.start_leaking()
+    sim.wait_for_client(2)
+    sim.wait_until(lambda: all(connection.sharing for connection in sim.connections))
+    return clients
+
+
+def test_bad_frame_only_drops_its_connection():
+    with EngineSimulator("127.0.0.1", binary=False) as sim, ProLeakPool() as pool:
+        got = []
+        clients = _pool_of_two(sim, pool, got)
+        sim.connections[0].send(b"Event: Tick\n{not json\n---\n")
+        sim.wait_until(lambda: len(pool) == 1)
+        survivor = pool.clients[0]
+        assert survivor in clients and survivor.running
+        sim.emit("Tick", {})
+        sim.wait_until(lambda: got == [survivor])
+
+
+def test_shared_executor_shards_by_connection():
+    with EngineSimulator("127.0.0.1", binary=False) as sim, ProLeakPool() as pool:
+        got, keys = [], []
+        clients = _pool_of_two(sim, pool, got)
+        submit = pool.executor.submit
+        pool.executor.submit = lambda key, *args: keys.append(key) or submit(key, *args)
+        sim.emit("Tick", {})
+        sim.wait_until(lambda: len(got) == 2)
+        assert sorted(keys, key=lambda key: clients.index(key[0])) == [(clients[0], "Tick"), (clients[1], "Tick")]
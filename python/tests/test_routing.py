@@ -0,0 +1,64 @@
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import Prefix
+
+
+def feed(client, event_name, params):
+    client._dispatch_event(event_name, dict(params), False, None, 0.0)
+
+
+def test_handlers_only_get_matching_params():
+    client = ProLeak.ProLeak()
+    got = []
+    client.register_handler("MethodCall", lambda e, p: got.append(("exact", p["Method"])), Method="Spawn")
+    client.register_handler("MethodCall", lambda e, p: got.append(("any of", p["Method"])), Method=["Move", "Stop"])
+    client.register_handler("MethodCall", lambda e, p: got.append(("prefix", p["Method"])), Method=Prefix("Get"))
+    client.register_handler("MethodCall", lambda e, p: got.append(("both", p["Method"])), Method="Spawn", Player=2)
+    client.register_handler("MethodCall", lambda e, p: got.append(("all", p["Method"])))
+    for method, player in (("Spawn", 1), ("Spawn", 2), ("Stop", 1), ("GetGold", 1), ("Other", 1)):
+        feed(client, "MethodCall", {"Method": method, "Player": player})
+    assert got == [("exact", "Spawn"), ("all", "Spawn"),
+                   ("exact", "Spawn"), ("both", "Spawn"), ("all", "Spawn"),
+                   ("any of", "Stop"), ("all", "Stop"),
+                   ("prefix", "GetGold"), ("all", "GetGold"),
+                   ("all", "Other")]
+    feed(client, "MethodCall", {"Method": ["unhashable"]})
+    assert got[-1] == ("all", ["unhashable"])
+
+
+def test_prefix_events_matching_no_interceptor_pass_through():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        # Without a subscription, the engine sends every event and the client has to route them
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=False)
+        asked = []
+        client.register_interceptor("MethodCall", lambda e, p: asked.append(p["Method"]) or dict(p, Seen=1),
+                                    Method="Spawn")
+        client.connect()
+        client.start_leaking()
+        try:
+            connection = sim.wait_for_client()
+            sim.wait_until(lambda: connection.sharing)
+            result = sim.intercept("MethodCall", {"Method": "Move", "Gold": 5})
+            assert {entry["key"]: entry["value"] for entry in result["params"]["entries"]} == {"Method": "Move",
+                                                                                              "Gold": "5"}
+            result = sim.intercept("MethodCall", {"Method": "Spawn"})
+            assert {entry["key"]: entry["value"] for entry in result["params"]["entries"]} == {"Method": "Spawn",
+                                                                                              "Seen": "1"}
+            assert asked == ["Spawn"]
+        finally:
+            client.disconnect()
+
+
+def test_filters_reach_the_engine():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True)
+        client.register_interceptor("MethodCall", lambda e, p: p, Method="Spawn")
+        client.connect()
+        client.start_leaking()
+        try:
+            connection = sim.wait_for_client()
+            sim.wait_until(lambda: connection.sharing)
+            assert connection.commands[-1][1]["filters"] == {"MethodCall": [{"Method": "Spawn"}]}
+            assert sim.intercept("MethodCall", {"Method": "Move"}) is None  # Never left the engine
+        finally:
+            client.disconnect()
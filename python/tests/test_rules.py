@@ -0,0 +1,53 @@
+import pytest
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import RULE_BLOCK, RULE_PASS, RULE_SET, Rule
+
+
+@pytest.fixture
+def engine():
+    with EngineSimulator("127.0.0.1", binary=False) as sim:
+        client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True)
+        client.asked = []
+        client.register_interceptor("MethodCall", lambda e, p: client.asked.append(p["Method"]) or p)
+        client.add_rule("MethodCall", RULE_BLOCK, Method="Cheat")
+        client.add_rule("MethodCall", RULE_SET, {"Gold": 0, "Arguments.1": "capped"}, Method="Reward")
+        client.connect()
+        client.start_leaking()
+        connection = sim.wait_for_client()
+        sim.wait_until(lambda: connection.sharing and "MethodCall" in connection.rules)
+        yield sim, client
+        client.disconnect()
+
+
+def test_rule_match_blocks_in_the_engine(engine):
+    sim, client = engine
+    assert sim.intercept("MethodCall", {"Method": "Cheat"}) == {"event": "MethodCall", "params": None, "rule": True}
+    assert client.asked == []
+
+
+def test_rule_match_rewrites_values_in_the_engine(engine):
+    sim, client = engine
+    result = sim.intercept("MethodCall", {"Method": "Reward", "Gold": 500, "Arguments": ["a", "b"]})
+    assert result == {"event": "MethodCall", "rule": True,
+                      "params": {"Method": "Reward", "Gold": 0, "Arguments": ["a", "capped"]}}
+    assert client.asked == []
+
+
+def test_no_rule_match_falls_through_to_the_interceptors(engine):
+    sim, client = engine
+    result = sim.intercept("MethodCall", {"Method": "Move"})
+    assert "rule" not in result
+    assert {entry["key"]: entry["value"] for entry in result["params"]["entries"]} == {"Method": "Move"}
+    assert client.asked == ["Move"]
+
+
+def test_rule_values_are_not_shared():
+    assert Rule("E", RULE_PASS).values is None
+    client = ProLeak.ProLeak()
+    values = {"Gold": 0}
+    rule = client.add_rule("E", RULE_SET, values)
+    values["Gold"] = 1
+    assert rule.values == {"Gold": 0}
+    assert Rule.from_json(client.add_rule("E", RULE_PASS).to_json()).values is None
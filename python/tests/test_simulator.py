@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+import ProLeak
+from EngineSimulator import EngineSimulator
+from ProLeak import PROTOCOL_AUTO, PROTOCOL_TEXT
+
+
+@pytest.fixture(params=[PROTOCOL_TEXT, PROTOCOL_AUTO])
+def engine(request):
+    with EngineSimulator("127.0.0.1", binary=request.param == PROTOCOL_AUTO) as sim:
+        clients = []
+
+        def connect(setup, start=True):
+            client = ProLeak.ProLeak("127.0.0.1", sim.port, subscribe=True, protocol=request.param)
+            clients.append(client)
+            setup(client)
+            client.connect()
+            connection = sim.wait_for_client(len(clients))
+            if request.param == PROTOCOL_AUTO:
+                sim.wait_until(lambda: client.codec is not None)
+            if start:
+                client.start_leaking()
+                sim.wait_until(lambda: connection.sharing)
+            return client, connection
+
+        yield sim, connect
+        for client in clients:
+            client.disconnect()
+
+
+def _params(result):
+    """Params of an interception result, whichever protocol carried it."""
+    params = result["params"]
+    if params is not None and "entries" in params:
+        return {entry["key"]: entry["value"] for entry in params["entries"]}
+    return params
+
+
+def test_start_and_stop_subscription(engine):
+    sim, connect = engine
+    client, connection = connect(lambda c: c.register_handler("Tick", lambda e, p: None), start=False)
+    assert not connection.sharing
+    assert sim.emit("Tick", {}) == 0
+    client.start_leaking()
+    sim.wait_until(lambda: connection.sharing)
+    assert connection.subscription == {"Tick"}
+    assert sim.emit("Tick", {}) == 1
+    assert sim.emit("Other", {}) == 0  # Not subscribed, never serialized
+    client.stop_leaking()
+    sim.wait_until(lambda: not connection.sharing)
+    assert sim.emit("Tick", {}) == 0
+    assert [command for command, _ in connection.commands if command in ("START", "STOP")] == ["START", "STOP"]
+
+
+def test_events_are_delivered_in_order(engine):
+    sim, connect = engine
+    got, done = [], threading.Event()
+
+    def handler(event_name, params):
+        got.append((event_name, dict(params)))
+        if len(got) == 3:
+            done.set()
+
+    connect(lambda c: c.register_handler(["Tick", "Chat"], handler))
+    sim.emit("Tick", {"I": 1})
+    sim.emit("Chat", {"Text": "héllo ✓", "Nested": {"List": [1, 2]}})
+    sim.emit("Tick", {"I": 2})
+    assert done.wait(5)
+    assert got == [("Tick", {"I": 1}), ("Chat", {"Text": "héllo ✓", "Nested": {"List": [1, 2]}}),
+                   ("Tick", {"I": 2})]
+
+
+def test_interception_round_trip(engine):
+    sim, connect = engine
+
+    def interceptor(event_name, params):
+        if params["Method"] == "Blocked":
+            return None
+        return dict(params, Seen="yes")
+
+    connect(lambda c: c.register_interceptor("MethodCall", interceptor))
+    result = sim.intercept("MethodCall", {"Method": "Kept"})
+    assert result["event"] == "MethodCall"
+    assert _params(result) == {"Method": "Kept", "Seen": "yes"}
+    assert _params(sim.intercept("MethodCall", {"Method": "Blocked"})) is None
+    assert sim.intercept("Other", {"Method": "Kept"}) is None  # Not subscribed, the game goes on